@@ -1,96 +1,505 @@
 # ai_client.py
 
+import asyncio
+import contextvars
+import copy
+import random
+import threading
+import time
 import openai
-from pathlib import Path
+from collections import deque
 
-class AIClient:
-    def __init__(self, api_key: str):
-        openai.api_key = api_key
-        self.client = openai
+import metrics
+import notes
+from persistent_cache import make_key, normalize_text
 
-    def transcribe(self, file_object) -> str:
+TRANSLATION_MODEL = "gpt-4o-mini"
+# Da incrementare a ogni modifica del prompt di traduzione, per invalidare la cache
+TRANSLATION_PROMPT_VERSION = "2"
+NOTES_MODEL = "gpt-4o"
+TTS_MODEL = "tts-1"
+TTS_VOICE = "alloy"
+
+# Timeout (secondi) e chiamate contemporanee massime per ciascun endpoint
+DEFAULT_TIMEOUTS = {"transcribe": 30, "translate": 15, "tts": 30, "summarize": 180, "translate_document": 90}
+DEFAULT_CONCURRENCY = {"transcribe": 4, "translate": 8, "tts": 4, "summarize": 4, "translate_document": 4}
+
+# Lingue di destinazione dei sottotitoli (codice -> nome usato nel prompt).
+# L'inglese viene sempre tradotto: è la lingua della trascrizione salvata.
+SUPPORTED_LANGUAGES = {"en": "inglese", "es": "spagnolo", "zh": "cinese (semplificato)", "ar": "arabo"}
+DEFAULT_LANGUAGE = "en"
+
+TRANSLATION_SYSTEM_PROMPT = """
+Sei un motore di traduzione automatica, non un assistente conversazionale.
+La tua unica funzione è tradurre il testo fornito dall'italiano in {language}.
+Segui queste regole in modo ferreo e senza eccezioni:
+1.  **TRADUCI E BASTA:** Il tuo output deve contenere *solo e soltanto* la traduzione in {language}.
+2.  **NON ESSERE CONVERSAZIONALE:** Non fare mai domande, non chiedere la lingua, non scusarti, non dire che non hai capito e non aggiungere commenti o frasi introduttive come "Ecco la traduzione:".
+3.  **GESTISCI INPUT IMPERFETTI:** Se il testo in input non è in italiano, è incompleto o poco chiaro, tenta comunque la migliore traduzione possibile senza commentare. Se il testo non ha alcun senso (es. "asdfasdf"), restituisci una stringa vuota.
+"""
+
+# Traduzione dei documenti (appunti): a differenza dei sottotitoli il testo è lungo e in Markdown
+DOCUMENT_TRANSLATION_SYSTEM_PROMPT = """
+Sei un traduttore professionale di materiale didattico universitario dall'italiano all'inglese.
+Ricevi una parte di un documento Markdown più lungo. Restituisci *solo* la sua traduzione in inglese:
+1.  Mantieni esattamente la struttura Markdown (titoli, elenchi, grassetti, formule, blocchi di codice).
+2.  Non aggiungere commenti, introduzioni o conclusioni e non completare parti che sembrano tagliate.
+3.  Mantieni invariati nomi propri, simboli e formule.
+"""
+
+NOTES_SYSTEM_PROMPT = "Sei un assistente specializzato nella creazione di appunti universitari ben strutturati e organizzati."
+
+# Fase "map": appunti di una sola parte della lezione
+NOTES_SECTION_PROMPT = """
+Trasforma questa parte della trascrizione di una lezione in appunti universitari ben strutturati.
+Organizza il contenuto con titoli e punti elenco ed evidenzia i concetti chiave.
+Riporta solo ciò che è presente nel testo: le altre parti della lezione verranno elaborate separatamente.
+
+Trascrizione:
+{text}
+
+Appunti strutturati:
+"""
+
+# Fase "reduce": unione, nell'ordine, degli appunti delle varie parti
+NOTES_MERGE_PROMPT = """
+Questi sono gli appunti, in ordine, di parti consecutive della stessa lezione.
+Uniscili in {target} ben strutturati: organizza il contenuto in sezioni logiche con titoli e punti elenco,
+elimina le ripetizioni tra una parte e l'altra, evidenzia i concetti chiave e rendi il tutto coerente e facile da studiare.
+
+{text}
+
+Appunti unificati:
+"""
+
+
+# Chi sta usando il client (es. l'aula): i limiti di concorrenza vengono ripartiti a turno tra questi
+_tenant = contextvars.ContextVar("ai_tenant", default=None)
+
+
+async def _with_tenant(coroutine, tenant):
+    _tenant.set(tenant)
+    return await coroutine
+
+
+class FairSemaphore:
+    """
+    Semaforo asincrono che, quando i posti sono esauriti, li assegna a turno tra
+    i tenant in attesa (vedi AIClient.for_tenant) invece che in ordine di arrivo:
+    un'aula con molte richieste in coda non fa aspettare le altre.
+    """
+
+    def __init__(self, value: int):
+        self.free = value
+        self.waiters = {}
+        self.turns = deque()
+
+    async def __aenter__(self):
+        tenant = _tenant.get()
+        if self.free > 0 and not self.turns:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        if tenant not in self.waiters:
+            self.waiters[tenant] = deque()
+            self.turns.append(tenant)
+        self.waiters[tenant].append(future)
         try:
-            transcript = self.client.audio.transcriptions.create(
-                model="gpt-4o-transcribe", file=file_object
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Il posto era già stato assegnato: passa al prossimo
+                self._release()
+            else:
+                self._discard(tenant, future)
+            raise
+
+    async def __aexit__(self, *exc):
+        self._release()
+
+    def _release(self):
+        while self.turns:
+            tenant = self.turns.popleft()
+            queue = self.waiters[tenant]
+            future = queue.popleft()
+            if queue:
+                self.turns.append(tenant)
+            else:
+                del self.waiters[tenant]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+    def _discard(self, tenant, future):
+        queue = self.waiters.get(tenant)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        if not queue:
+            del self.waiters[tenant]
+            self.turns.remove(tenant)
+
+    def waiting(self) -> dict:
+        """Richieste in attesa per tenant."""
+        return {tenant: len(queue) for tenant, queue in list(self.waiters.items())}
+
+
+async def _cache_get(cache, key: str):
+    """Lettura da una PersistentCache senza bloccare l'event loop: il disco si legge in un thread."""
+    value = cache.peek(key)
+    if value is None:
+        value = await asyncio.to_thread(cache.get, key)
+    return value
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncAIClient:
+    """
+    Client asincrono verso OpenAI: un solo AsyncOpenAI (quindi un solo pool di
+    connessioni HTTP) condiviso da tutte le chiamate, con timeout per chiamata,
+    limite di concorrenza per endpoint e retry con backoff esponenziale e jitter
+    sugli errori 429/5xx e di rete.
+    """
+
+    def __init__(self, api_key: str, translation_cache=None, base_url: str | None = None,
+                 timeouts: dict | None = None, concurrency: dict | None = None, max_retries: int = 3,
+                 notes_cache=None, notes_section_tokens: int = 3000, notes_merge_tokens: int = 12000,
+                 document_section_tokens: int = 1500, languages: dict | None = None):
+        # I retry li gestiamo noi, per poter applicare backoff e limiti di concorrenza
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        # Cache opzionale (PersistentCache) delle traduzioni già eseguite
+        self.translation_cache = translation_cache
+        # Cache opzionale dei riassunti di sezione e delle unioni degli appunti
+        self.notes_cache = notes_cache
+        self.notes_section_tokens = notes_section_tokens
+        self.notes_merge_tokens = notes_merge_tokens
+        self.document_section_tokens = document_section_tokens
+        self.languages = languages or SUPPORTED_LANGUAGES
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        limits = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        # Un solo budget per endpoint, condiviso e ripartito a turno tra le aule
+        self.semaphores = {endpoint: FairSemaphore(n) for endpoint, n in limits.items()}
+        self.max_retries = max_retries
+
+    async def _call(self, endpoint: str, request):
+        """Esegue `request(timeout)` rispettando concorrenza, timeout e retry dell'endpoint."""
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            try:
+                async with self.semaphores[endpoint]:
+                    result = await request(self.timeouts[endpoint])
+                metrics.api_requests_total.inc(endpoint=endpoint, outcome="ok")
+                metrics.api_seconds.observe(time.monotonic() - started, endpoint=endpoint)
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    metrics.api_requests_total.inc(endpoint=endpoint, outcome=e.__class__.__name__)
+                    raise
+                retry_after = _retry_after(e)
+                if retry_after is None:
+                    delay = random.uniform(0, min(20.0, 0.5 * 2 ** attempt))
+                else:
+                    # Un Retry-After enorme (o negativo) non deve bloccare la chiamata oltre il suo timeout
+                    delay = min(max(0.0, retry_after), self.timeouts[endpoint])
+                attempt += 1
+                metrics.api_retries_total.inc(endpoint=endpoint)
+                print(f"⚠️ Errore {endpoint} ({e.__class__.__name__}), nuovo tentativo {attempt} tra {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def transcribe(self, file_object) -> str:
+        async def request(timeout):
+            # Un nuovo tentativo deve rileggere il file dall'inizio
+            file_object.seek(0)
+            return await self.client.audio.transcriptions.create(
+                model="gpt-4o-transcribe", file=file_object, timeout=timeout
             )
+
+        try:
+            transcript = await self._call("transcribe", request)
             return transcript.text.strip()
         except Exception as e:
             print(f"❌ Errore trascrizione: {e}")
             return ""
 
-    def translate(self, text: str) -> str:
+    async def translate(self, text: str, target: str = DEFAULT_LANGUAGE, on_partial=None) -> str:
+        """
+        Con `on_partial` la risposta arriva in streaming e `on_partial(testo_finora)`
+        viene chiamata a ogni frammento ricevuto (sul thread dell'event loop).
+        Una traduzione già in cache viene restituita subito, senza parziali.
+        """
         if not text.strip():
             return ""
-            
-        # ==========================================================
-        # ===== NUOVO PROMPT DI SISTEMA PIÙ ROBUSTO =====
-        # ==========================================================
-        nuovo_prompt_di_sistema = """
-Sei un motore di traduzione automatica, non un assistente conversazionale.
-La tua unica funzione è tradurre il testo fornito dall'italiano all'inglese.
-Segui queste regole in modo ferreo e senza eccezioni:
-1.  **TRADUCI E BASTA:** Il tuo output deve contenere *solo e soltanto* la traduzione in inglese.
-2.  **NON ESSERE CONVERSAZIONALE:** Non fare mai domande, non chiedere la lingua, non scusarti, non dire che non hai capito e non aggiungere commenti o frasi introduttive come "Ecco la traduzione:".
-3.  **GESTISCI INPUT IMPERFETTI:** Se il testo in input non è in italiano, è incompleto o poco chiaro, tenta comunque la migliore traduzione possibile senza commentare. Se il testo non ha alcun senso (es. "asdfasdf"), restituisci una stringa vuota.
-"""
-        # ==========================================================
-            
+
+        cache_key = None
+        if self.translation_cache is not None:
+            cache_key = make_key("translate", TRANSLATION_MODEL, TRANSLATION_PROMPT_VERSION, target, normalize_text(text))
+            cached = await _cache_get(self.translation_cache, cache_key)
+            if cached is not None:
+                return cached
+
+        messages = [
+            {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT.format(language=self.languages[target])},
+            {"role": "user", "content": text},
+        ]
         try:
-            resp = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": nuovo_prompt_di_sistema}, # <-- Usiamo il nuovo prompt
-                    {"role": "user", "content": text},
-                ],
-                max_tokens=500,
-                temperature=0 # Riduciamo la "creatività" al minimo per traduzioni più dirette
-            )
-            return resp.choices[0].message.content.strip()
+            if on_partial is None:
+                resp = await self._call("translate", lambda timeout: self.client.chat.completions.create(
+                    model=TRANSLATION_MODEL,
+                    messages=messages,
+                    max_tokens=500,
+                    temperature=0, # Riduciamo la "creatività" al minimo per traduzioni più dirette
+                    timeout=timeout,
+                ))
+                translation = resp.choices[0].message.content.strip()
+            else:
+                translation = (await self._call(
+                    "translate", lambda timeout: self._stream_translation(messages, timeout, on_partial)
+                )).strip()
+            if cache_key is not None:
+                self.translation_cache.put(cache_key, translation)
+            return translation
         except Exception as e:
             print(f"❌ Errore traduzione: {e}")
             return ""
 
-    def text_to_speech(self, text: str, output_path: str) -> bool:
+    async def _stream_translation(self, messages: list, timeout: float, on_partial) -> str:
+        # Un nuovo tentativo riparte da capo: i parziali riportano sempre il testo completo finora
+        stream = await self.client.chat.completions.create(
+            model=TRANSLATION_MODEL,
+            messages=messages,
+            max_tokens=500,
+            temperature=0,
+            stream=True,
+            timeout=timeout,
+        )
+        parts = []
+        async for event in stream:
+            delta = event.choices[0].delta.content if event.choices else None
+            if delta:
+                parts.append(delta)
+                on_partial("".join(parts))
+        return "".join(parts)
+
+    async def translate_many(self, text: str, targets, on_partial=None) -> dict:
+        """
+        Traduce lo stesso testo in più lingue in parallelo: {lingua: traduzione}.
+        Con `on_partial(lingua, testo_finora)` le traduzioni arrivano in streaming.
+        """
+        targets = list(targets)
+
+        def partial_for(target):
+            if on_partial is None:
+                return None
+            return lambda partial: on_partial(target, partial)
+
+        results = await asyncio.gather(*(self.translate(text, target, partial_for(target)) for target in targets))
+        return dict(zip(targets, results))
+
+    async def stream_speech(self, text: str, on_chunk, voice: str = TTS_VOICE, model: str = TTS_MODEL) -> bool:
+        """Sintesi vocale in streaming: `on_chunk(bytes)` riceve l'mp3 man mano che arriva."""
         if not text.strip():
             return False
+
+        async def request(timeout):
+            delivered = False
+            try:
+                async with self.client.audio.speech.with_streaming_response.create(
+                    model=model, voice=voice, input=text, timeout=timeout,
+                ) as response:
+                    async for data in response.iter_bytes():
+                        delivered = True
+                        on_chunk(data)
+            except Exception as e:
+                # Dopo i primi byte un nuovo tentativo duplicherebbe l'audio già consegnato
+                if delivered:
+                    raise RuntimeError(f"streaming audio interrotto: {e}") from e
+                raise
+
         try:
-            response = self.client.audio.speech.create(
-                model="tts-1",
-                voice="alloy",
-                input=text,
-            )
-            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-            with open(output_path, "wb") as f:
-                f.write(response.content)
+            await self._call("tts", request)
             return True
         except Exception as e:
             print(f"❌ Errore TTS: {e}")
             return False
 
-    def summarize_transcript(self, transcript_text: str) -> str:
-        if not transcript_text.strip():
-            return ""
+    async def translate_section(self, text: str) -> str:
+        """Traduce una parte di un documento Markdown, con un limite di token proporzionato alla sua lunghezza."""
+        # Testo grezzo nella chiave: negli appunti gli a capo fanno parte della struttura
+        cache_key = None
+        if self.translation_cache is not None:
+            cache_key = make_key("translate_document", TRANSLATION_MODEL, DOCUMENT_TRANSLATION_SYSTEM_PROMPT, text)
+            cached = await _cache_get(self.translation_cache, cache_key)
+            if cached is not None:
+                return cached
         try:
-            prompt = f"""
-Trasforma questa trascrizione di una lezione in appunti universitari ben strutturati. 
-Organizza il contenuto in sezioni logiche con titoli e punti elenco, 
-evidenzia i concetti chiave e rendi il tutto coerente e facile da studiare.
-
-Trascrizione:
-{transcript_text}
-
-Appunti strutturati:
-"""
-            resp = self.client.chat.completions.create(
-                model="gpt-4o",
+            resp = await self._call("translate_document", lambda timeout: self.client.chat.completions.create(
+                model=TRANSLATION_MODEL,
                 messages=[
-                    {"role": "system", "content": "Sei un assistente specializzato nella creazione di appunti universitari ben strutturati e organizzati."},
-                    {"role": "user", "content": prompt},
+                    {"role": "system", "content": DOCUMENT_TRANSLATION_SYSTEM_PROMPT},
+                    {"role": "user", "content": text},
                 ],
-                max_tokens=2000,
-                temperature=0.7
-            )
-            return resp.choices[0].message.content.strip()
+                # L'inglese richiede in genere meno token dell'italiano: il doppio lascia ampio margine
+                max_tokens=2 * notes.estimate_tokens(text) + 100,
+                temperature=0,
+                timeout=timeout,
+            ))
+            choice = resp.choices[0]
+            if choice.finish_reason == "length":
+                print("⚠️ Traduzione di una parte degli appunti troncata")
+                return ""
+            translation = choice.message.content.strip()
+            if cache_key is not None and translation:
+                self.translation_cache.put(cache_key, translation)
+            return translation
+        except Exception as e:
+            print(f"❌ Errore traduzione degli appunti: {e}")
+            return ""
+
+    async def translate_document(self, text: str) -> str:
+        """Traduzione completa di un documento Markdown lungo (es. gli appunti), vedi notes.translate_markdown."""
+        if not text.strip():
+            return ""
+        return await notes.translate_markdown(self, text, self.document_section_tokens)
+
+    async def _complete_notes(self, prompt: str, max_tokens: int) -> str | None:
+        """Risposta del modello per gli appunti; None se è stata troncata a `max_tokens`."""
+        # La chiave include il testo del prompt: modificarlo invalida da solo i risultati vecchi
+        cache_key = None
+        if self.notes_cache is not None:
+            cache_key = make_key("notes", NOTES_MODEL, NOTES_SYSTEM_PROMPT, prompt)
+            cached = await _cache_get(self.notes_cache, cache_key)
+            if cached is not None:
+                return cached
+        resp = await self._call("summarize", lambda timeout: self.client.chat.completions.create(
+            model=NOTES_MODEL,
+            messages=[
+                {"role": "system", "content": NOTES_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=max_tokens,
+            # Bassa, perché i risultati vengono riutilizzati dalla cache
+            temperature=0.3,
+            timeout=timeout,
+        ))
+        choice = resp.choices[0]
+        if choice.finish_reason == "length":
+            # Appunti a metà: non vanno né usati né messi in cache
+            return None
+        result = choice.message.content.strip()
+        if cache_key is not None and result:
+            self.notes_cache.put(cache_key, result)
+        return result
+
+    async def summarize_section(self, section_text: str) -> str:
+        try:
+            summary = await self._complete_notes(NOTES_SECTION_PROMPT.format(text=section_text), max_tokens=1200)
         except Exception as e:
-            print(f"❌ Errore nell'elaborazione della trascrizione: {e}")
-            return ""
\ No newline at end of file
+            print(f"❌ Errore nel riassunto di una sezione: {e}")
+            return ""
+        if summary is None:
+            print("⚠️ Riassunto di una sezione troncato")
+            return ""
+        return summary
+
+    async def merge_notes(self, partial_notes: list[str], final: bool = True) -> str:
+        if len(partial_notes) == 1 and not final:
+            return partial_notes[0]
+        text = "\n\n".join(f"--- Parte {i} ---\n{n}" for i, n in enumerate(partial_notes, 1))
+        target = "appunti universitari completi" if final else "un'unica sezione di appunti"
+        try:
+            merged = await self._complete_notes(NOTES_MERGE_PROMPT.format(target=target, text=text), max_tokens=4000)
+        except Exception as e:
+            print(f"❌ Errore nell'unione degli appunti: {e}")
+            return ""
+        if merged is not None:
+            return merged
+        if len(partial_notes) == 1:
+            return partial_notes[0]
+        # Il risultato non sta in max_tokens: si uniscono le due metà separatamente e
+        # si accodano, invece di unirle di nuovo (sarebbe troncato allo stesso modo)
+        print(f"⚠️ Unione di {len(partial_notes)} parti troncata, la divido in due")
+        half = len(partial_notes) // 2
+        halves = await asyncio.gather(
+            self.merge_notes(partial_notes[:half], final=False),
+            self.merge_notes(partial_notes[half:], final=False),
+        )
+        if any(not h for h in halves):
+            return ""
+        return "\n\n".join(halves)
+
+    async def generate_notes(self, transcript_text: str) -> str:
+        """Appunti di una lezione di qualsiasi lunghezza, in stile map-reduce (vedi notes.py)."""
+        return await notes.map_reduce_notes(
+            self, transcript_text, self.notes_section_tokens, self.notes_merge_tokens
+        )
+
+
+class AIClient:
+    """
+    Facciata sincrona di AsyncAIClient per i moduli basati su thread (audio_worker, utils).
+    Le coroutine girano su un unico event loop dedicato, così tutte le chiamate
+    condividono le stesse connessioni e gli stessi limiti di concorrenza.
+    """
+
+    def __init__(self, api_key: str, translation_cache=None, **options):
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="ai-client-loop", daemon=True)
+        self.loop_thread.start()
+        self.async_client = AsyncAIClient(api_key, translation_cache=translation_cache, **options)
+        self.tenant = None
+
+    @property
+    def translation_cache(self):
+        return self.async_client.translation_cache
+
+    def for_tenant(self, tenant: str) -> "AIClient":
+        """
+        Vista del client per un tenant (es. un'aula): stesso event loop, stesse
+        connessioni e stessi limiti, ma le sue richieste in attesa si alternano
+        con quelle degli altri tenant.
+        """
+        view = copy.copy(self)
+        view.tenant = tenant
+        return view
+
+    def submit(self, coroutine):
+        """Avvia una coroutine sull'event loop del client senza attenderla (concurrent.futures.Future)."""
+        if self.tenant is not None:
+            coroutine = _with_tenant(coroutine, self.tenant)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        """Esegue una coroutine sull'event loop del client e ne attende il risultato."""
+        return self.submit(coroutine).result()
+
+    def transcribe(self, file_object) -> str:
+        return self.run(self.async_client.transcribe(file_object))
+
+    def translate(self, text: str, target: str = DEFAULT_LANGUAGE, on_partial=None) -> str:
+        return self.run(self.async_client.translate(text, target, on_partial))
+
+    def translate_many(self, text: str, targets, on_partial=None) -> dict:
+        return self.run(self.async_client.translate_many(text, targets, on_partial))
+
+    def translate_document(self, text: str) -> str:
+        return self.run(self.async_client.translate_document(text))
+
+    def generate_notes(self, transcript_text: str) -> str:
+        return self.run(self.async_client.generate_notes(transcript_text))
@@ -1,32 +1,53 @@
 # app.py
 
+import hmac
 import os
 import sys
 import time
 import threading
+from collections import deque
 from pathlib import Path
 from datetime import datetime
 
 from flask import Flask, send_from_directory, Response, request
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 
 # Importa dai nostri moduli
 import config
+import metrics
 import shared_state
-from ai_client import AIClient
-from audio_worker import SimpleTranslatorWorker
+from ai_client import AIClient, SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE
+from persistent_cache import PersistentCache
+from tts_store import AudioRetentionManager
+from audio_cache import AudioHotCache, TTS_FILENAME
+from session_catalog import SessionCatalog, format_session
+from search_index import SearchIndex
+from notes import RollingNotes
+from jobs import JobQueue
+from broadcast import Broadcaster, resolve_server_mode, run_blocking
+import segment_log
+from classrooms import ClassroomManager, classroom_configs
+from audio_ingest import available_codecs, create_decoder
 from gui import launch_gui
 
 
-from utils import generate_and_save_notes, cleanup_old_audio_files, save_transcript_to_file # Aggiungi la nuova funzione
+from utils import generate_and_save_notes, save_transcript_to_file, format_transcript, recover_unfinished_sessions, finalize_live_notes, segments_after, language_room, segment_for_language, classroom_room, CLASSROOM_ROOM_PREFIX # Aggiungi la nuova funzione
 
 
 
 # ------------------------
 # Inizializzazione Flask + SocketIO
 # ------------------------
+# "threading" per lo sviluppo; "gevent" o "eventlet" per servire un'aula intera (vedi config.template.py)
+SERVER_MODE = resolve_server_mode(getattr(config, "SERVER_MODE", "threading"))
 app = Flask(__name__, static_folder=".", static_url_path="")
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=SERVER_MODE)
+# Tutti gli eventi inviati dai thread dell'applicazione passano da qui
+broadcaster = Broadcaster(socketio, SERVER_MODE)
+# Lingue in cui i client possono seguire la lezione (codice -> nome usato nel prompt di traduzione)
+LANGUAGES = getattr(config, "LANGUAGES", SUPPORTED_LANGUAGES)
+# Client che stanno inviando l'audio della lezione (sid -> (sorgente, decoder)), vedi ingest_start
+ingest_streams = {}
 
 # ------------------------
 # Routes Flask
@@ -42,7 +63,30 @@ def teacher_page():
 
 @app.route("/audio/<path:filename>")
 def serve_audio(filename):
-    return send_from_directory(config.AUDIO_DIR, filename)
+    match = TTS_FILENAME.match(filename)
+    if match is None:
+        return send_from_directory(config.AUDIO_DIR, filename)
+    data = audio_cache.get(filename)
+    if data is None:
+        # Sintesi ancora in corso: i byte vengono inoltrati man mano che arrivano (chunked)
+        pending = classrooms.pending_audio(filename)
+        if pending is not None:
+            return Response(pending.iter_bytes(socketio.sleep), mimetype="audio/mpeg",
+                            headers={"Cache-Control": "no-cache"})
+        # Oppure appena terminata, tra la prima lettura e il controllo
+        data = audio_cache.get(filename)
+    if data is None:
+        return "File audio non trovato.", 404
+    # Il nome deriva dal contenuto: il file non cambia mai e il browser può tenerlo per sempre
+    response = Response(data, mimetype="audio/mpeg")
+    response.set_etag(match["digest"])
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Metriche in formato testo Prometheus (latenze per fase, errori API, code)."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/download_transcript")
 def download_transcript():
@@ -56,12 +100,11 @@ def download_transcript():
 
     if not transcript_filepath.exists():
         # Controlla se è la sessione attiva (il cui file non è ancora stato salvato)
-        if session_id == shared_state.current_session_id and shared_state.session_active:
-             # Genera il contenuto al volo per la sessione live
-            session_data = shared_state.session_transcripts.get(session_id)
-            if session_data and session_data.get("transcripts"):
-                lines = [f"[{r.get('timestamp', '')}] IT: {r.get('italian', '')}\nEN: {r.get('english', '')}\n" for r in session_data["transcripts"]]
-                text = "\n".join(lines)
+        if shared_state.classroom_of_session(session_id) is not None:
+            # Genera il contenuto al volo dal log dei segmenti della sessione live
+            segments = segment_log.read_segments(session_id)
+            if segments:
+                text = format_transcript(segments)
                 return Response(text, mimetype="text/plain", headers={"Content-Disposition": f"attachment;filename={transcript_filename}"})
 
         return "File della trascrizione non trovato. Potrebbe non essere ancora stato salvato.", 404
@@ -86,10 +129,23 @@ def download_notes_en(session_id):
 
 @app.route("/process_session/<session_id>")
 def process_session(session_id):
-    if generate_and_save_notes(session_id, ai_client):
-        return {"success": True, "message": "Trascrizione elaborata con successo"}
-    else:
-        return {"error": "Errore nell'elaborazione o sessione non trovata"}, 500
+    """
+    Accoda la generazione degli appunti e risponde subito con il lavoro (202).
+    Richieste ripetute per la stessa sessione restituiscono il lavoro già in corso;
+    il completamento arriva con l'evento "job_done" o interrogando /jobs/<id>.
+    """
+    if shared_state.classroom_of_session(session_id) is not None:
+        return {"error": "La sessione è ancora in corso"}, 409
+    if not (Path(config.TRANSCRIPTS_DIR) / f"trascrizione_{session_id}.txt").exists():
+        return {"error": "Sessione non trovata"}, 404
+    return job_queue.submit("notes", session_id), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return {"error": "Lavoro non trovato"}, 404
+    return job
 
 # in app.py
 
@@ -98,51 +154,53 @@ def process_session(session_id):
 @app.route("/session_list")
 def session_list():
     """
-    Analizza le cartelle, trova le ultime 6 sessioni e ne restituisce i dati formattati.
+    Elenco paginato delle sessioni dal catalogo, dalla più recente.
+    Parametri opzionali: cursor (il next_cursor della pagina precedente), per_page (max 100),
+    docente, materia, date (YYYY-MM-DD), has_transcript (1 = solo le sessioni con la
+    trascrizione salvata, 0 = solo quelle senza).
     """
-    sessions_found = {}
-    
-    transcript_files = Path(config.TRANSCRIPTS_DIR).glob("trascrizione_*.txt")
-    notes_files = Path(config.NOTES_DIR).glob("appunti_*.txt")
-
-    # Estrae i dati dai nomi dei file
-    for f in transcript_files:
-        session_id = f.stem.replace("trascrizione_", "")
-        parts = session_id.split('_')
-        if len(parts) < 4: continue # Salta ID malformati
-
-        # Estrae le singole parti
-        docente = parts[0]
-        materia = " ".join(parts[1:-2]) # La materia può contenere spazi (che erano underscore)
-        data_str = parts[-2]
-        ora_str = parts[-1]
-        
-        # Formatta data e ora per una migliore leggibilità
-        try:
-            data_formatted = f"{data_str[6:8]}/{data_str[4:6]}/{data_str[0:4]}"
-            ora_formatted = f"{ora_str[0:2]}:{ora_str[2:4]}"
-            timestamp_for_sorting = data_str + ora_str
-        except IndexError:
-            continue
-
-        sessions_found[session_id] = {
-            'id': session_id,
-            'docente': docente,
-            'materia': materia,
-            'data': data_formatted,
-            'ora': ora_formatted,
-            'timestamp': timestamp_for_sorting,
-            'processed': False
-        }
-
-    for f in notes_files:
-        session_id = f.stem.replace("appunti_", "")
-        if session_id in sessions_found:
-            sessions_found[session_id]['processed'] = True
-
-    sorted_sessions = sorted(sessions_found.values(), key=lambda s: s['timestamp'], reverse=True)
-    
-    return {"sessions": sorted_sessions[:6]}
+    per_page = min(100, max(1, request.args.get("per_page", 6, type=int)))
+    has_transcript = request.args.get("has_transcript", type=int)
+    try:
+        rows, next_cursor = catalog.list_sessions(
+            per_page,
+            cursor=request.args.get("cursor") or None,
+            docente=request.args.get("docente") or None,
+            materia=request.args.get("materia") or None,
+            date=request.args.get("date") or None,
+            has_transcript=None if has_transcript is None else bool(has_transcript),
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return {"sessions": [format_session(r) for r in rows], "per_page": per_page,
+            "next_cursor": next_cursor, "has_more": next_cursor is not None}
+
+@app.route("/classrooms")
+def classrooms_status():
+    """Aule servite dal server, con la sessione eventualmente in corso in ciascuna."""
+    return {"classrooms": classrooms.status()}
+
+@app.route("/languages")
+def languages():
+    return {"languages": list(LANGUAGES), "default": DEFAULT_LANGUAGE}
+
+@app.route("/search")
+def search():
+    """
+    Ricerca full-text su segmenti e appunti di tutte le sessioni, ordinata per rilevanza.
+    Parametri: q, page, per_page (max 50), session_id (opzionale).
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return {"error": "Parametro 'q' mancante"}, 400
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = min(50, max(1, request.args.get("per_page", 10, type=int)))
+    results, has_more = search_index.search(query, page, per_page, session_id=request.args.get("session_id") or None)
+    for result in results:
+        session = catalog.get(result["session_id"])
+        if session:
+            result.update({k: v for k, v in format_session(session).items() if k in ("docente", "materia", "data", "ora")})
+    return {"results": results, "page": page, "per_page": per_page, "has_more": has_more}
 
 
 # ------------------------
@@ -156,54 +214,261 @@ def trigger_start_session():
     # Leggiamo i nuovi parametri dall'URL
     docente = request.args.get('docente', 'NessunDocente')
     materia = request.args.get('materia', 'NessunaMateria')
-    handle_start_session(docente, materia) # Passiamo i dati alla funzione principale
+    # Senza `classroom` si usa la prima aula configurata
+    handle_start_session(docente, materia, request.args.get('classroom')) # Passiamo i dati alla funzione principale
     return "OK"
 
 @app.route("/_stop_session")
 def trigger_stop_session():
-    handle_stop_session()
+    handle_stop_session(request.args.get('classroom'))
     return "OK"
 
 
 @socketio.on("start_session")
-def handle_start_session(docente: str = 'DefaultDocente', materia: str = 'DefaultMateria'):
-    if not shared_state.session_active:
-        shared_state.session_active = True
-        
+def handle_start_session(docente: str = 'DefaultDocente', materia: str = 'DefaultMateria', classroom_id: str | None = None):
+    # Può attendere uno stop in corso (lock dell'aula) e scrive su disco: fuori dall'event loop
+    run_blocking(SERVER_MODE, start_session, docente, materia, classroom_id)
+
+def start_session(docente: str, materia: str, classroom_id: str | None = None):
+    classroom = shared_state.get_classroom(classroom_id)
+    if classroom is None:
+        print(f"❌ Aula sconosciuta: {classroom_id}")
+        return
+    # Avvio e stop della stessa aula non si sovrappongono (lo stop può attendere a lungo il drain)
+    with classroom.lifecycle_lock:
+        _start_session(classroom, docente, materia)
+
+def _start_session(classroom, docente: str, materia: str):
+    if not classroom.session_active:
         # Creiamo il nuovo ID sessione descrittivo 🆔
         now = datetime.now()
         timestamp = now.strftime("%Y%m%d_%H%M")
         session_id = f"{docente}_{materia}_{timestamp}"
+        if session_id in shared_state.session_transcripts:
+            # Stessa lezione avviata nello stesso minuto in un'altra aula
+            session_id = f"{session_id}_{classroom.id}"
         
-        shared_state.current_session_id = session_id
+        classroom.current_session_id = session_id
         
+        # Ogni segmento finisce subito nel log su disco; in memoria ne teniamo solo la coda recente
+        log = segment_log.SegmentLog(
+            session_id,
+            fsync_every=getattr(config, "SEGMENT_LOG_FSYNC_EVERY", 10),
+            fsync_interval=getattr(config, "SEGMENT_LOG_FSYNC_INTERVAL_S", 1.0),
+        )
+        # Nel catalogo e nel log i nomi tornano leggibili (la GUI sostituisce gli spazi con underscore)
+        docente_name, materia_name = docente.replace("_", " "), materia.replace("_", " ")
+        log.start({"docente": docente_name, "materia": materia_name, "start_time": now.isoformat()})
+        catalog.session_started(session_id, docente_name, materia_name, now.isoformat())
+
         # Salviamo i nuovi metadati insieme alla sessione
         shared_state.session_transcripts[session_id] = {
             "docente": docente,
             "materia": materia,
             "start_time": now.isoformat(), 
-            "transcripts": [], 
+            "transcripts": deque(maxlen=getattr(config, "LIVE_TAIL_SEGMENTS", 200)),
+            "next_seq": 0,
+            "log": log,
+            # Appunti riassunti a sezioni durante la lezione, pronti pochi secondi dopo lo stop
+            "rolling_notes": RollingNotes(
+                classrooms.worker(classroom.id).ai_client,
+                section_tokens=getattr(config, "NOTES_SECTION_TOKENS", 3000),
+                merge_tokens=getattr(config, "NOTES_MERGE_TOKENS", 12000),
+            ) if getattr(config, "LIVE_NOTES", True) else None,
             "notes": None
         }
-        print(f"▶️ Sessione avviata: {shared_state.current_session_id}")
-        socketio.emit("session_status", {"active": True, "session_id": shared_state.current_session_id})
+        # Attiviamo la sessione solo ora, così il worker legge già l'ID corretto
+        classroom.set_session_active(True)
+        print(f"▶️ Sessione avviata nell'aula {classroom.name}: {session_id}")
+        broadcaster.emit("session_status", classroom.status(), to=classroom_room(classroom.id))
 
 
 @socketio.on("stop_session")
-def handle_stop_session():
-    if shared_state.session_active and shared_state.current_session_id:
-        session_id = shared_state.current_session_id
-        print(f"⏹️  Sessione fermata: {session_id}")
-
-        # Salva la trascrizione su file
-        save_transcript_to_file(session_id)
+def handle_stop_session(classroom_id: str | None = None):
+    # L'attesa degli ultimi segmenti può durare secondi: fuori dall'event loop
+    run_blocking(SERVER_MODE, stop_current_session, classroom_id)
 
-        shared_state.session_active = False
-        shared_state.current_session_id = None
-        socketio.emit("session_status", {"active": False, "session_id": session_id})
+def stop_current_session(classroom_id: str | None = None):
+    classroom = shared_state.get_classroom(classroom_id)
+    if classroom is None:
+        print("⏹️  Comando di stop ricevuto, ma nessuna sessione attiva trovata.")
+        return
+    with classroom.lifecycle_lock:
+        _stop_session(classroom)
+
+def _stop_session(classroom):
+    if classroom.session_active and classroom.current_session_id:
+        session_id = classroom.current_session_id
+        print(f"⏹️  Sessione fermata nell'aula {classroom.name}: {session_id}")
+
+        classroom.set_session_active(False)
+        # Attende che gli ultimi segmenti ancora in elaborazione finiscano nel log
+        worker = classrooms.worker(classroom.id)
+        drained = worker.drain(getattr(config, "STOP_DRAIN_TIMEOUT_S", 15), session_id)
+        # Non cancella una sessione che nel frattempo ha preso il suo posto
+        if classroom.current_session_id == session_id:
+            classroom.current_session_id = None
+
+        broadcaster.emit("session_status", {**classroom.status(), "session_id": session_id},
+                         to=classroom_room(classroom.id))
+
+        if drained:
+            finalize_session(session_id)
+        else:
+            # Log, trascrizione e appunti si chiudono quando arriva l'ultimo segmento:
+            # chiuderli ora li lascerebbe senza i segmenti ancora in pipeline
+            print("⚠️ Alcuni segmenti sono ancora in elaborazione: la sessione verrà chiusa al loro arrivo")
+            threading.Thread(target=finalize_session_late, args=(worker, session_id),
+                             name=f"finalize-{session_id}", daemon=True).start()
     else:
         print("⏹️  Comando di stop ricevuto, ma nessuna sessione attiva trovata.")
 
+def finalize_session_late(worker, session_id: str):
+    if not worker.drain(getattr(config, "STOP_LATE_TIMEOUT_S", 600), session_id):
+        print(f"⚠️ Segmenti della sessione {session_id} ancora in elaborazione: chiudo comunque")
+    finalize_session(session_id)
+
+def finalize_session(session_id: str):
+    """Chiude il log della sessione fermata, salva la trascrizione e accoda gli appunti."""
+    session_data = shared_state.session_transcripts.get(session_id)
+    if session_data:
+        session_data["log"].close()
+
+    # Salva la trascrizione su file
+    saved = save_transcript_to_file(session_id)
+    catalog.session_ended(session_id, has_transcript=saved is not None)
+
+    # Con gli appunti live resta solo l'unione finale: la accodiamo subito
+    if saved and session_data and session_data.get("rolling_notes") is not None:
+        job_queue.submit("notes", session_id)
+
+@socketio.on("connect")
+def handle_connect():
+    # Il client sceglie l'aula con ?classroom=... nella connessione (predefinita: la prima).
+    # Nella stanza dell'aula riceve l'avvio e la fine delle sue sessioni
+    classroom = shared_state.get_classroom(request.args.get("classroom")) or shared_state.get_classroom()
+    join_room(classroom_room(classroom.id))
+    emit("classroom", {"id": classroom.id, "name": classroom.name})
+    # Il client scopre subito la sessione in corso e può unirsi alla sua stanza
+    if classroom.session_active and classroom.current_session_id:
+        emit("session_status", classroom.status())
+
+@socketio.on("disconnect")
+def handle_disconnect():
+    shared_state.unsubscribe(request.sid)
+    stop_ingest(request.sid)
+
+@socketio.on("ingest_start")
+def handle_ingest_start(data):
+    """
+    Un client autorizzato (INGEST_TOKEN) inizia a inviare l'audio di un'aula
+    configurata con "source": "ingest". `codec` è "opus" (pacchetti WebCodecs)
+    o "pcm16" (con `sample_rate`); la risposta indica l'esito e i codec accettati.
+    """
+    data = data or {}
+    token = getattr(config, "INGEST_TOKEN", None)
+    if not token or not hmac.compare_digest(str(data.get("token", "")), token):
+        return {"ok": False, "error": "Non autorizzato", "codecs": available_codecs()}
+    classroom = shared_state.get_classroom(data.get("classroom"))
+    source = classrooms.ingest_source(classroom.id) if classroom else None
+    if source is None:
+        return {"ok": False, "error": "L'aula non riceve audio dal browser", "codecs": available_codecs()}
+    try:
+        decoder = create_decoder(data.get("codec", "pcm16"), source.sample_rate, data.get("sample_rate"))
+    except ValueError as e:
+        return {"ok": False, "error": str(e), "codecs": available_codecs()}
+    if source.sender is not None and source.sender != request.sid:
+        # Un solo invio per aula: l'ultimo client che si collega sostituisce il precedente
+        print(f"⚠️ Nuova sorgente audio per l'aula {classroom.name}, sostituisce la precedente")
+        stop_ingest(source.sender)
+    source.sender = request.sid
+    ingest_streams[request.sid] = (source, decoder)
+    print(f"🎙️ Audio dal browser per l'aula {classroom.name} ({data.get('codec', 'pcm16')})")
+    return {"ok": True, "classroom": classroom.id, "codecs": available_codecs()}
+
+@socketio.on("ingest_audio")
+def handle_ingest_audio(data):
+    stream = ingest_streams.get(request.sid)
+    if stream is None or not isinstance(data, (bytes, bytearray)):
+        return
+    source, decoder = stream
+    try:
+        samples = decoder.decode(bytes(data))
+    except Exception as e:
+        print(f"⚠️ Pacchetto audio non valido: {e}")
+        return
+    source.feed(samples)
+
+@socketio.on("ingest_stop")
+def handle_ingest_stop():
+    stop_ingest(request.sid)
+
+def stop_ingest(sid: str):
+    stream = ingest_streams.pop(sid, None)
+    if stream is not None and stream[0].sender == sid:
+        stream[0].sender = None
+
+@socketio.on("join_session")
+def handle_join_session(data):
+    """
+    Sposta il client nelle stanze della sessione e della lingua scelta (`language`,
+    predefinita l'inglese): riceverà solo le traduzioni in quella lingua, e la
+    pipeline tradurrà in quella lingua finché qualcuno la ascolta.
+    """
+    data = data or {}
+    session_id = data.get("session_id")
+    if not session_id:
+        return
+    language = data.get("language") or DEFAULT_LANGUAGE
+    if language not in LANGUAGES:
+        language = DEFAULT_LANGUAGE
+    for room in rooms():
+        if room != request.sid and not room.startswith(CLASSROOM_ROOM_PREFIX):
+            leave_room(room)
+    join_room(session_id)
+    join_room(language_room(session_id, language))
+    # La lingua conta solo per l'aula in cui la sessione è in corso
+    shared_state.unsubscribe(request.sid)
+    classroom = shared_state.classroom_of_session(session_id)
+    if classroom is not None:
+        classroom.subscribe_language(request.sid, language)
+    return language
+
+@socketio.on("resume")
+def handle_resume(data):
+    """
+    Entra nella stanza della sessione e invia in un solo messaggio "catch_up" i
+    segmenti successivi a `last_seq` (null = client nuovo: solo gli ultimi segmenti).
+    """
+    data = data or {}
+    session_id = data.get("session_id")
+    if not session_id:
+        return
+    # Prima nella stanza, poi la copia dei segmenti: ciò che viene emesso nel mezzo
+    # può arrivare due volte (il client lo scarta per seq) ma non va perso
+    language = handle_join_session(data)
+    try:
+        last_seq = data.get("last_seq")
+        last_seq = None if last_seq is None else int(last_seq)
+    except (TypeError, ValueError):
+        # Valore non numerico (client vecchio o manomesso): lo trattiamo come un client nuovo
+        last_seq = None
+    if last_seq is None:
+        segments = segments_after(session_id, None, getattr(config, "CATCH_UP_NEW_CLIENT_SEGMENTS", 20))
+    else:
+        segments = segments_after(session_id, last_seq)
+    emit("catch_up", {"session_id": session_id, "language": language,
+                      "segments": [segment_for_language(s, language) for s in segments]})
+
+def run_notes_job(session_id: str) -> bool:
+    # Se la sessione ha ancora gli appunti live in memoria si completano quelli,
+    # altrimenti (es. dopo un riavvio) si rigenerano dalla trascrizione
+    session_data = shared_state.session_transcripts.get(session_id) or {}
+    rolling_notes = session_data.pop("rolling_notes", None)
+    if rolling_notes is not None:
+        return finalize_live_notes(session_id, rolling_notes, ai_client, catalog, search_index)
+    return generate_and_save_notes(session_id, ai_client, catalog, search_index)
+
 # ------------------------
 # Main
 # ------------------------
@@ -219,8 +484,25 @@ if __name__ == "__main__":
     os.makedirs(config.AUDIO_DIR, exist_ok=True)
     os.makedirs(config.NOTES_DIR, exist_ok=True)
     os.makedirs(config.TRANSCRIPTS_DIR, exist_ok=True) # <-- AGGIUNGI
+    os.makedirs(getattr(config, "SESSIONS_DIR", "sessions"), exist_ok=True)
+
+    catalog = SessionCatalog(getattr(config, "CATALOG_DB", "data/catalog.sqlite3"))
+    # Sessioni rimaste aperte da un crash: la trascrizione viene ricostruita dal log
+    for recovered_id, transcript_path in recover_unfinished_sessions():
+        catalog.session_ended(recovered_id, has_transcript=transcript_path is not None)
+    # Solo al primo avvio: porta nel catalogo le sessioni salvate prima della sua introduzione
+    catalog.import_existing_files()
+    search_index = SearchIndex(getattr(config, "SEARCH_DB", "data/search.sqlite3"))
+    search_index.import_existing_files()
     
-    cleanup_old_audio_files()
+    # Mantiene la cartella audio entro la quota, periodicamente e non solo all'avvio
+    retention_manager = AudioRetentionManager(
+        config.AUDIO_DIR,
+        quota_bytes=getattr(config, "AUDIO_QUOTA_MB", 500) * 1024 * 1024,
+        max_age_hours=getattr(config, "AUDIO_MAX_AGE_HOURS", 24),
+        interval=getattr(config, "AUDIO_CLEANUP_INTERVAL_S", 300),
+    )
+    retention_manager.start()
     ## load_existing_sessions() # <-- AGGIUNGI
     
     api_key = os.getenv("OPENAI_API_KEY", config.OPENAI_API_KEY)
@@ -228,10 +510,60 @@ if __name__ == "__main__":
         print("❌ API key di OpenAI non trovata o non configurata in config.py")
         sys.exit(1)
         
-    ai_client = AIClient(api_key)
-    worker = SimpleTranslatorWorker(ai_client, socketio)
-    worker_thread = threading.Thread(target=worker.run, daemon=True)
-    worker_thread.start()
+    translation_cache = PersistentCache(
+        getattr(config, "CACHE_DB", "data/cache.sqlite3"), "translations",
+        memory_items=getattr(config, "TRANSLATION_CACHE_MEMORY_ITEMS", 2000),
+        max_entries=getattr(config, "TRANSLATION_CACHE_MAX_ENTRIES", 100_000),
+    )
+    metrics.register_collector(lambda: [
+        ("translator_translation_cache_total", "counter", "Esito delle ricerche nella cache delle traduzioni",
+         [({"result": k}, v) for k, v in translation_cache.stats().items() if k in ("memory_hits", "disk_hits", "misses")]),
+    ])
+    notes_cache = PersistentCache(
+        getattr(config, "CACHE_DB", "data/cache.sqlite3"), "notes_sections",
+        memory_items=200, max_entries=getattr(config, "NOTES_CACHE_MAX_ENTRIES", 20_000),
+    )
+    ai_client = AIClient(
+        api_key,
+        translation_cache=translation_cache,
+        notes_cache=notes_cache,
+        notes_section_tokens=getattr(config, "NOTES_SECTION_TOKENS", 3000),
+        notes_merge_tokens=getattr(config, "NOTES_MERGE_TOKENS", 12000),
+        document_section_tokens=getattr(config, "NOTES_TRANSLATION_SECTION_TOKENS", 1500),
+        languages=LANGUAGES,
+        base_url=getattr(config, "OPENAI_BASE_URL", None),
+        timeouts=getattr(config, "AI_TIMEOUTS", None),
+        concurrency=getattr(config, "AI_CONCURRENCY", None),
+        max_retries=getattr(config, "AI_MAX_RETRIES", 3),
+    )
+    metrics.register_collector(lambda: [
+        ("translator_api_waiting", "gauge", "Richieste API in attesa di un posto libero, per endpoint e aula",
+         [({"endpoint": endpoint, "classroom": tenant or ""}, n)
+          for endpoint, semaphore in ai_client.async_client.semaphores.items()
+          for tenant, n in semaphore.waiting().items()]),
+    ])
+    audio_cache = AudioHotCache(config.AUDIO_DIR, max_bytes=getattr(config, "AUDIO_CACHE_MB", 64) * 1024 * 1024)
+    metrics.register_collector(lambda: [
+        ("translator_audio_cache_bytes", "gauge", "Byte di audio TTS tenuti in memoria", [({}, audio_cache.stats()["bytes"])]),
+        ("translator_audio_cache_total", "counter", "Richieste alla cache audio in memoria",
+         [({"result": k}, v) for k, v in audio_cache.stats().items() if k in ("hits", "misses")]),
+    ])
+    # Una pipeline per aula, tutte sullo stesso AIClient
+    classrooms = ClassroomManager(ai_client, broadcaster, classroom_configs(),
+                                  search_index=search_index, audio_cache=audio_cache)
+
+    job_queue = JobQueue(
+        getattr(config, "JOBS_DB", "data/jobs.sqlite3"),
+        handlers={"notes": run_notes_job},
+        workers=getattr(config, "JOB_WORKERS", 2),
+        on_done=lambda job: broadcaster.emit("job_done", job),
+    )
+    job_queue.start()
+    metrics.register_collector(lambda: [
+        ("translator_jobs", "gauge", "Lavori in background in coda o in esecuzione",
+         [({"status": k}, v) for k, v in job_queue.stats().items()]),
+    ])
+    classrooms.start()
 
     # ====================================================================
     # ===== BLOCCO DI VERIFICA: CONTROLLA SE VEDI QUESTO MESSAGGIO =====
@@ -240,7 +572,7 @@ if __name__ == "__main__":
     print("### STAI ESEGUENDO LA VERSIONE CORRETTA DEL FILE app.py ###")
     
     # Creiamo gli argomenti in una variabile separata per il debug
-    gui_args = (ai_client,)
+    gui_args = (ai_client, catalog)
     print(f"### Argomenti preparati per la GUI: {gui_args} ###")
     print("#"*60 + "\n")
     # ====================================================================
@@ -252,8 +584,13 @@ if __name__ == "__main__":
     try:
         print("🚀 Server in avvio su http://0.0.0.0:8000")
         print("💡 Usa la GUI per avviare/fermare la sessione")
-        socketio.run(app, host="0.0.0.0", port=8000, allow_unsafe_werkzeug=True)
+        broadcaster.start()
+        if SERVER_MODE == "threading":
+            socketio.run(app, host="0.0.0.0", port=8000, allow_unsafe_werkzeug=True)
+        else:
+            print(f"⚡ Server in modalità {SERVER_MODE}")
+            socketio.run(app, host="0.0.0.0", port=8000)
     except KeyboardInterrupt:
         print("\n⏹️ Arresto del server...")
-        worker.stop()
+        classrooms.stop()
         sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,65 @@
+# audio_cache.py
+
+# Cache in memoria degli mp3 TTS più recenti, limitata in byte.
+# Con un'aula intera ogni segmento viene scaricato da centinaia di browser quasi
+# nello stesso istante: tenerlo in RAM evita una lettura da disco per ciascuno.
+# I file sono indirizzati per contenuto (vedi tts_store.py), quindi non cambiano
+# mai e non serve invalidarli.
+
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# Nomi dei file prodotti da TTSStore: il digest è anche l'ETag
+TTS_FILENAME = re.compile(r"^tts_(?P<digest>[0-9a-f]{32})\.mp3$")
+
+
+class AudioHotCache:
+    def __init__(self, audio_dir: str, max_bytes: int = 64 * 1024 * 1024):
+        self.audio_dir = Path(audio_dir)
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filename: str) -> bytes | None:
+        """Contenuto del file, dalla memoria o, la prima volta, dal disco."""
+        if not TTS_FILENAME.match(filename):
+            return None
+        with self.lock:
+            data = self.items.get(filename)
+            if data is not None:
+                self.items.move_to_end(filename)
+                self.hits += 1
+                return data
+            self.misses += 1
+        try:
+            data = (self.audio_dir / filename).read_bytes()
+        except FileNotFoundError:
+            return None
+        self.put(filename, data)
+        return data
+
+    def put(self, filename: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.items.pop(filename, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.items[filename] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def contains(self, filename: str) -> bool:
+        with self.lock:
+            return filename in self.items
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"items": len(self.items), "bytes": self.size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,42 @@
+# audio_codec.py
+
+# Codifica dei chunk audio prima dell'invio alla trascrizione.
+# Il formato si sceglie con config.UPLOAD_FORMAT: un formato compresso riduce
+# i byte da caricare sulla rete della classe a parità di qualità per il riconoscimento.
+
+import io
+import soundfile as sf
+
+# nome -> (formato soundfile, sottotipo, estensione del file inviato)
+UPLOAD_FORMATS = {
+    "wav": ("WAV", "PCM_16", "wav"),
+    "flac": ("FLAC", "PCM_16", "flac"),
+    "opus": ("OGG", "OPUS", "ogg"),
+}
+
+
+def is_supported(fmt: str) -> bool:
+    """Verifica che il formato sia noto e che la libsndfile installata sappia scriverlo."""
+    if fmt not in UPLOAD_FORMATS:
+        return False
+    container, subtype, _ = UPLOAD_FORMATS[fmt]
+    return subtype in sf.available_subtypes(container)
+
+
+def resolve_format(fmt: str) -> str:
+    """Restituisce `fmt` se utilizzabile, altrimenti ripiega su FLAC (o WAV)."""
+    if is_supported(fmt):
+        return fmt
+    fallback = "flac" if is_supported("flac") else "wav"
+    print(f"⚠️ Formato di upload '{fmt}' non disponibile, uso '{fallback}'")
+    return fallback
+
+
+def encode_audio(samples, sample_rate: int, fmt: str = "flac") -> io.BytesIO:
+    """Codifica i campioni nel formato richiesto e restituisce un file in memoria pronto per l'upload."""
+    container, subtype, extension = UPLOAD_FORMATS[fmt]
+    encoded = io.BytesIO()
+    sf.write(encoded, samples, sample_rate, format=container, subtype=subtype)
+    encoded.seek(0)
+    encoded.name = f"stream.{extension}"
+    return encoded
@@ -0,0 +1,79 @@
+# audio_ingest.py
+
+# Decodifica dell'audio inviato dal browser (pagina del docente) via Socket.IO.
+# Il browser invia pacchetti Opus grezzi prodotti da WebCodecs (AudioEncoder)
+# oppure, se il browser o il server non supportano Opus, PCM a 16 bit già
+# ricampionato dalla pagina a 16 kHz.
+# I campioni decodificati finiscono in una IngestSource (vedi audio_source.py),
+# quindi nello stesso buffer circolare usato con il microfono.
+
+import numpy as np
+
+# Durata massima di un pacchetto Opus: 120 ms
+OPUS_MAX_FRAME_SECONDS = 0.12
+
+
+def available_codecs() -> list[str]:
+    """Codec accettati da questo server, dal preferito. Opus richiede opuslib (pip install opuslib)."""
+    try:
+        import opuslib  # noqa: F401
+    except Exception:  # opuslib assente o libopus non trovata
+        return ["pcm16"]
+    return ["opus", "pcm16"]
+
+
+class OpusDecoder:
+    """Pacchetti Opus grezzi (senza contenitore Ogg/WebM), decodificati direttamente alla frequenza della pipeline."""
+
+    def __init__(self, sample_rate: int):
+        import opuslib
+        # Opus decodifica nativamente a 8, 12, 16, 24 o 48 kHz: nessun ricampionamento
+        self.decoder = opuslib.Decoder(sample_rate, 1)
+        self.max_frame = int(sample_rate * OPUS_MAX_FRAME_SECONDS)
+
+    def decode(self, packet: bytes) -> np.ndarray:
+        pcm = self.decoder.decode(packet, self.max_frame)
+        return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+class PCM16Decoder:
+    """
+    PCM little-endian a 16 bit alla frequenza del browser, ricampionato linearmente
+    (come WavFileSource). I pacchetti sono parti di un unico flusso: la posizione
+    frazionaria e l'ultimo campione passano da un pacchetto al successivo, così
+    ai bordi non si perdono né si aggiungono campioni.
+    """
+
+    def __init__(self, input_rate: int, sample_rate: int):
+        self.input_rate = input_rate
+        self.sample_rate = sample_rate
+        self.step = input_rate / sample_rate
+        # Ultimo campione del pacchetto precedente e posizione del prossimo campione in uscita,
+        # misurata in campioni di ingresso a partire da quello
+        self.last = 0.0
+        self.position = 1.0
+
+    def decode(self, data: bytes) -> np.ndarray:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+        if self.input_rate == self.sample_rate or len(samples) == 0:
+            return samples
+        buffer = np.concatenate([[self.last], samples])
+        positions = self.position + self.step * np.arange(max(0, int(np.ceil((len(samples) - self.position) / self.step))))
+        self.position += self.step * len(positions) - len(samples)
+        self.last = buffer[-1]
+        return np.interp(positions, np.arange(len(buffer)), buffer).astype(np.float32)
+
+
+def create_decoder(codec: str, sample_rate: int, input_rate: int | None = None):
+    if codec not in available_codecs():
+        raise ValueError(f"Codec non supportato: {codec}")
+    if codec == "opus":
+        return OpusDecoder(sample_rate)
+    try:
+        # Valore inviato dal client: può essere di qualsiasi tipo
+        rate = int(input_rate)
+    except (TypeError, ValueError):
+        raise ValueError(f"Frequenza di campionamento non valida: {input_rate!r}") from None
+    if not 8000 <= rate <= 192000:
+        raise ValueError(f"Frequenza di campionamento non valida: {input_rate!r}")
+    return PCM16Decoder(rate, sample_rate)
@@ -0,0 +1,133 @@
+# audio_source.py
+
+# Sorgenti audio per SimpleTranslatorWorker (microfono locale, audio dalla rete, file).
+# Ogni sorgente espone `open(callback)`, un context manager che, finché è aperto,
+# chiama `callback(indata, frames, time_info, status)` con blocchi float32 mono,
+# con la stessa firma del callback di sounddevice.
+
+import threading
+import time
+import numpy as np
+import soundfile as sf
+
+
+class MicrophoneSource:
+    """Cattura dal microfono tramite sounddevice (dispositivo predefinito o `device`)."""
+
+    def __init__(self, sample_rate: int, block_size: int, device=None):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.device = device
+
+    def open(self, callback):
+        # Import ritardato: senza PortAudio il server può comunque girare con altre sorgenti
+        import sounddevice as sd
+        return sd.InputStream(
+            samplerate=self.sample_rate, channels=1, dtype="float32",
+            callback=callback, blocksize=self.block_size, device=self.device
+        )
+
+
+class IngestSource:
+    """
+    Audio che arriva dalla rete (es. dal browser del docente, vedi audio_ingest.py)
+    invece che da un dispositivo locale. I campioni passati a `feed` vengono
+    consegnati al callback solo mentre la sorgente è aperta, cioè durante una sessione.
+    """
+
+    def __init__(self, sample_rate: int, block_size: int):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.callback = None
+        # Client che sta inviando l'audio: ne è ammesso uno alla volta
+        self.sender = None
+        self.lock = threading.Lock()
+
+    def open(self, callback):
+        return _IngestStream(self, callback)
+
+    def feed(self, samples: np.ndarray):
+        with self.lock:
+            callback = self.callback
+        if callback is not None and len(samples):
+            callback(samples[:, None], len(samples), None, None)
+
+
+class _IngestStream:
+    def __init__(self, source: IngestSource, callback):
+        self.source = source
+        self.callback = callback
+
+    def __enter__(self):
+        with self.source.lock:
+            self.source.callback = self.callback
+        return self
+
+    def __exit__(self, *exc):
+        with self.source.lock:
+            self.source.callback = None
+
+
+class WavFileSource:
+    """
+    Riproduce un file audio come se arrivasse dal microfono, in tempo reale
+    (`speed=1`) o accelerato (`speed>1`; `speed=0` = il più velocemente possibile).
+    `finished` viene impostato quando il file è stato consegnato per intero.
+    """
+
+    def __init__(self, path: str, sample_rate: int, block_size: int, speed: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.speed = speed
+        self.finished = threading.Event()
+        self.audio = self._load()
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / self.sample_rate
+
+    def _load(self) -> np.ndarray:
+        data, rate = sf.read(self.path, dtype="float32", always_2d=True)
+        data = data.mean(axis=1)
+        if rate != self.sample_rate:
+            # Ricampionamento lineare, sufficiente per il riconoscimento vocale
+            duration = len(data) / rate
+            target = np.linspace(0, duration, int(duration * self.sample_rate), endpoint=False)
+            data = np.interp(target, np.arange(len(data)) / rate, data)
+        return np.ascontiguousarray(data, dtype=np.float32)
+
+    def open(self, callback):
+        return _ReplayStream(self, callback)
+
+
+class _ReplayStream:
+    def __init__(self, source: WavFileSource, callback):
+        self.source = source
+        self.callback = callback
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self._run, name="wav-replay", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        src = self.source
+        interval = src.block_size / src.sample_rate / src.speed if src.speed > 0 else 0
+        next_time = time.monotonic()
+        for start in range(0, len(src.audio), src.block_size):
+            if self.stop_event.is_set():
+                return
+            block = src.audio[start:start + src.block_size]
+            self.callback(block[:, None], len(block), None, None)
+            if interval:
+                # Scadenze assolute: il ritmo non deriva anche se il callback è lento
+                next_time += interval
+                self.stop_event.wait(max(0.0, next_time - time.monotonic()))
+        src.finished.set()
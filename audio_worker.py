@@ -1,143 +1,457 @@
 # audio_worker.py
 
+import queue
 import threading
 import time
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
-import io
-from pathlib import Path
 from datetime import datetime
 
 import config
+import metrics
 import shared_state
+from concurrent.futures import ThreadPoolExecutor
+from ai_client import DEFAULT_LANGUAGE
+from pipeline import Pipeline, Chunk
+from segmenter import create_segmenter
+from audio_codec import encode_audio, resolve_format
+from tts_store import TTSStore
+from audio_source import MicrophoneSource
+from utils import language_room, segment_for_language
 
 class CircularBuffer:
-    # ... (Il codice della classe CircularBuffer rimane identico) ...
+    """
+    Buffer circolare indicizzato per campione.
+    `written` conta tutti i campioni scritti dall'avvio; ogni consumatore legge
+    tramite un proprio RingCursor, così ogni campione viene consegnato una sola volta
+    e la sovrascrittura di audio non ancora letto viene rilevata.
+    """
+
     def __init__(self, size):
         self.buffer = np.zeros(size, dtype=np.float32)
         self.size = size
-        self.index = 0
-        self.filled = False
-        
+        self.written = 0
+        self.lock = threading.Lock()
+
     def add_data(self, data):
-        data_len = len(data)
-        if data_len > self.size:
-            data = data[-self.size:]
-            
-        if self.index + data_len > self.size:
-            part1 = self.size - self.index
-            self.buffer[self.index:self.index+part1] = data[:part1]
-            self.buffer[0:data_len-part1] = data[part1:]
-            self.index = data_len - part1
-        else:
-            self.buffer[self.index:self.index+data_len] = data
-            self.index = (self.index + data_len) % self.size
-            
-        if not self.filled and self.index == 0:
-            self.filled = True
-            
+        with self.lock:
+            data_len = len(data)
+            total = data_len
+            if data_len > self.size:
+                data = data[-self.size:]
+                data_len = self.size
+
+            index = (self.written + total - data_len) % self.size
+            part1 = min(data_len, self.size - index)
+            self.buffer[index:index + part1] = data[:part1]
+            if part1 < data_len:
+                self.buffer[0:data_len - part1] = data[part1:]
+            self.written += total
+
     def get_data(self):
-        if self.filled:
-            return np.concatenate([self.buffer[self.index:], self.buffer[:self.index]])
-        return self.buffer[:self.index]
+        """Intero contenuto del buffer, dal campione più vecchio al più recente."""
+        with self.lock:
+            available = min(self.written, self.size)
+            return self._slice(self.written - available, available)
+
+    def cursor(self):
+        """Crea un cursore di lettura posizionato sul prossimo campione che verrà scritto."""
+        return RingCursor(self)
+
+    def _slice(self, position, count):
+        start = position % self.size
+        if start + count <= self.size:
+            return self.buffer[start:start + count]
+        # Unica copia: i dati attraversano la fine del buffer
+        return np.concatenate([self.buffer[start:], self.buffer[:count - (self.size - start)]])
+
+
+class RingCursor:
+    """Posizione di lettura di un consumatore all'interno di un CircularBuffer."""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.position = ring.written
+        self.overrun_samples = 0
+
+    def available(self) -> int:
+        return self.ring.written - self.position
+
+    def read_new(self, max_samples=None):
+        """
+        Restituisce i campioni non ancora letti (al massimo `max_samples`).
+        Il risultato è una vista sul buffer, o una sola copia se i dati attraversano
+        la fine del buffer: va consumato prima che il buffer faccia un giro completo.
+        """
+        ring = self.ring
+        with ring.lock:
+            available = ring.written - self.position
+            if available > ring.size:
+                # Il produttore ci ha superato: l'audio più vecchio è andato perso
+                lost = available - ring.size
+                self.overrun_samples += lost
+                self.position += lost
+                available = ring.size
+            count = available if max_samples is None else min(available, max_samples)
+            data = ring._slice(self.position, count)
+            self.position += count
+        return data
+
+    def skip_to_end(self):
+        with self.ring.lock:
+            self.position = self.ring.written
 
 
 # in audio_worker.py
 
+def create_tts_store(ai_client, audio_cache=None) -> TTSStore:
+    return TTSStore(
+        config.AUDIO_DIR, ai_client, hot_cache=audio_cache,
+        sentence_min_chars=getattr(config, "TTS_SENTENCE_MIN_CHARS", 60),
+        first_audio_timeout=ai_client.async_client.timeouts["tts"],
+    )
+
+
 class SimpleTranslatorWorker(threading.Thread):
-    def __init__(self, ai_client, socketio, chunk_duration=4, sample_rate=16000):
+    def __init__(self, ai_client, socketio, chunk_duration=4, sample_rate=16000, source=None, search_index=None,
+                 audio_cache=None, classroom=None, tts_store=None):
         super().__init__(daemon=True)
         self.ai_client = ai_client
+        # Stato dell'aula servita da questo worker (sessione in corso, lingue ascoltate)
+        self.classroom = classroom or shared_state.get_classroom() or shared_state.add_classroom(shared_state.DEFAULT_CLASSROOM)
         self.socketio = socketio
         self.chunk_duration = chunk_duration
         self.sample_rate = sample_rate
         self.samples_per_chunk = int(sample_rate * chunk_duration)
         self.running = False
-        self.processing = False
         # Use a larger buffer to ensure we don't miss audio while processing
         self.audio_buffer = CircularBuffer(sample_rate * (chunk_duration * 3))
+        self.audio_cursor = self.audio_buffer.cursor()
         self.lock = threading.Lock()
-        self.last_chunk_time = 0
+        # Svegliato dal callback audio e dai cambi di stato della sessione
+        self.wakeup = threading.Condition(self.lock)
+        self.block_size = int(sample_rate * getattr(config, "AUDIO_BLOCK_MS", 100) / 1000)
+        # Microfono di default; per test e benchmark si può passare un WavFileSource
+        self.source = source or MicrophoneSource(sample_rate, self.block_size)
+        self.next_seq = 0
+        self.segmenter = create_segmenter(sample_rate, chunk_duration, config)
+        self.segment_session_id = None
+        # Impostato quando la cattura della sessione è terminata e l'ultimo segmento è in pipeline
+        self.capture_idle = threading.Event()
+        self.capture_idle.set()
+        # Sequenza successiva all'ultimo chunk di ogni sessione catturata (le più recenti):
+        # lo stop può attendere i segmenti di una sessione anche se nel frattempo ne parte un'altra
+        self.session_end_seqs = {}
+        self.upload_format = resolve_format(getattr(config, "UPLOAD_FORMAT", "flac"))
+        # Con più aule l'archivio è unico (ClassroomManager): una frase sintetizzata in un'aula serve a tutte
+        self.tts_store = tts_store or create_tts_store(ai_client, audio_cache)
+        # Sintesi delle diverse lingue di uno stesso chunk in parallelo
+        self.languages = ai_client.async_client.languages
+        self.tts_executor = ThreadPoolExecutor(max_workers=len(self.languages), thread_name_prefix="tts-lang")
+        self.audio_cache = audio_cache
+        # Audio allegato come binario a new_translation: il client non deve scaricarlo a parte
+        self.inline_audio = getattr(config, "AUDIO_INLINE", False) and audio_cache is not None
+        self.timings_in_payload = getattr(config, "METRICS_IN_PAYLOAD", False)
+        # Sottotitoli in streaming: l'italiano appena trascritto, poi la traduzione man mano che arriva
+        self.streaming_subtitles = getattr(config, "STREAMING_SUBTITLES", False)
+        self.partial_interval = getattr(config, "PARTIAL_TRANSLATION_INTERVAL_MS", 150) / 1000
+        # Le traduzioni parziali arrivano dal loop dell'AIClient, condiviso da tutte le aule:
+        # le invia un thread dedicato, così un client lento non ferma le chiamate API
+        self.partials = queue.SimpleQueue()
+        # Indice full-text aggiornato a ogni segmento (opzionale)
+        self.search_index = search_index
+        metrics.register_collector(self.collect_metrics)
+
+        workers = getattr(config, "PIPELINE_WORKERS", {})
+        self.pipeline = Pipeline(
+            [
+                ("transcribe", self.transcribe_chunk, workers.get("transcribe", 2)),
+                ("translate", self.translate_chunk, workers.get("translate", 2)),
+                ("tts", self.synthesize_chunk, workers.get("tts", 2)),
+            ],
+            on_emit=self.emit_chunk,
+            queue_size=getattr(config, "PIPELINE_QUEUE_SIZE", 4),
+            backpressure=getattr(config, "PIPELINE_BACKPRESSURE", "drop_oldest"),
+        )
 
     def audio_callback(self, indata, frames, time_info, status):
         if status:
             print(f"Audio status: {status}")
-        if self.running and shared_state.session_active:
-            with self.lock:
-                self.audio_buffer.add_data(indata[:, 0])
+        if self.running and self.classroom.session_active:
+            self.audio_buffer.add_data(indata[:, 0])
+            self.wake()
+
+    def wake(self):
+        with self.wakeup:
+            self.wakeup.notify_all()
 
     def run(self):
         self.running = True
-        print("▶️ Worker avviato e in attesa di una sessione...")
-        with sd.InputStream(
-            samplerate=self.sample_rate, channels=1, dtype="float32",
-            callback=self.audio_callback, blocksize=self.sample_rate # Get new audio every second
-        ):
-            while self.running:
-                if not shared_state.session_active or self.processing:
-                    time.sleep(0.1)
-                    continue
-
-                with self.lock:
-                    buffered_data = self.audio_buffer.get_data()
-
-                # Check if we have a full chunk of NEW audio since last time
-                if len(buffered_data) >= self.samples_per_chunk:
-                    self.processing = True
-                    
-                    # Process the most recent chunk of audio
-                    audio_chunk = buffered_data[-self.samples_per_chunk:]
-                    
-                    # Run the processing in a separate thread to not block the audio callback
-                    threading.Thread(target=self.process_chunk, args=(audio_chunk,)).start()
+        self.pipeline.start()
+        threading.Thread(target=self.send_partials, name=f"partials-{self.classroom.id}", daemon=True).start()
+        self.classroom.add_session_listener(self.wake)
+        print(f"▶️ Worker dell'aula {self.classroom.name} avviato e in attesa di una sessione...")
+        while self.running:
+            # Nessuna sessione: il thread dorme finché non arriva una notifica
+            with self.wakeup:
+                self.wakeup.wait_for(lambda: not self.running or self.classroom.session_active)
+            if self.running:
+                self.capture_session()
 
+        self.pipeline.stop()
+        self.partials.put(None)
         print("⏹️ Worker fermato")
 
-    def process_chunk(self, audio_data):
+    def capture_session(self):
+        """Cattura e segmenta l'audio finché la sessione corrente resta attiva."""
+        self.capture_idle.clear()
+        self.segment_session_id = self.classroom.current_session_id
+        self.audio_cursor.skip_to_end()
         try:
-            print("🎤 Chunk audio acquisito, avvio elaborazione...")
-            
-            wav_bytes = io.BytesIO()
-            sf.write(wav_bytes, audio_data, self.sample_rate, format='WAV')
-            wav_bytes.seek(0)
-            wav_bytes.name = "stream.wav"
-            
-            italian_text = self.ai_client.transcribe(wav_bytes)
-            if not italian_text:
-                print("... Trascrizione vuota, scarto il chunk ...")
-                return
+            # Il microfono resta aperto solo durante la sessione
+            with self.source.open(self.audio_callback):
+                while self.running and self.classroom.session_active:
+                    with self.wakeup:
+                        self.wakeup.wait_for(
+                            lambda: not self.running
+                            or not self.classroom.session_active
+                            or self.audio_cursor.available() > 0
+                        )
+                    self.process_new_audio()
+        except Exception as e:
+            print(f"❌ Errore nella cattura audio: {e}")
+            with self.wakeup:
+                self.wakeup.wait_for(lambda: not self.running or not self.classroom.session_active)
 
-            print(f"📥 IT: {italian_text}")
-            english_text = self.ai_client.translate(italian_text)
-            if not english_text:
+        # La sessione è finita: elabora l'audio residuo e l'ultimo segmento rimasto aperto
+        self.process_new_audio()
+        last_segment = self.segmenter.flush()
+        if last_segment is not None:
+            self.submit_segment(last_segment)
+        with self.wakeup:
+            self.session_end_seqs[self.segment_session_id] = self.next_seq
+            while len(self.session_end_seqs) > 16:
+                del self.session_end_seqs[next(iter(self.session_end_seqs))]
+            self.wakeup.notify_all()
+        self.capture_idle.set()
+
+    def drain(self, timeout: float, session_id: str | None = None) -> bool:
+        """
+        Attende che la sessione `session_id` (senza: quella appena fermata) abbia
+        emesso tutti i suoi segmenti.
+        """
+        deadline = time.monotonic() + timeout
+        if session_id is None:
+            if not self.capture_idle.wait(timeout):
+                return False
+            end_seq = self.next_seq
+        else:
+            with self.wakeup:
+                if not self.wakeup.wait_for(lambda: session_id in self.session_end_seqs, timeout):
+                    return False
+                end_seq = self.session_end_seqs[session_id]
+        return self.pipeline.emitter.wait_until(end_seq, max(0.0, deadline - time.monotonic()))
+
+    def process_new_audio(self):
+        new_audio = self.take_pending()
+        if new_audio is None:
+            return
+        for segment in self.segmenter.feed(new_audio):
+            self.submit_segment(segment)
+
+    def take_pending(self):
+        """Restituisce l'audio arrivato dall'ultima chiamata, o None se non c'è nulla di nuovo."""
+        lost_before = self.audio_cursor.overrun_samples
+        new_audio = self.audio_cursor.read_new()
+        lost = self.audio_cursor.overrun_samples - lost_before
+        if lost:
+            print(f"⚠️ Buffer audio pieno, persi {lost / self.sample_rate:.1f}s di audio")
+        if len(new_audio) == 0:
+            return None
+        return new_audio
+
+    def submit_segment(self, audio_segment):
+        chunk = Chunk(self.next_seq, audio_segment, self.sample_rate, self.segment_session_id)
+        self.next_seq += 1
+        # Con la politica "block" la cattura attende qui finché la trascrizione non libera spazio
+        self.pipeline.submit(chunk)
+
+    def transcribe_chunk(self, chunk):
+        print(f"🎤 Chunk audio {chunk.seq} acquisito, avvio trascrizione...")
+        # La codifica avviene nei thread dello stadio di trascrizione, non in quello di cattura
+        encoded = encode_audio(chunk.audio, chunk.sample_rate, self.upload_format)
+        chunk.mark("encode")
+
+        chunk.italian = self.ai_client.transcribe(encoded)
+        chunk.mark("transcribe")
+        if not chunk.italian:
+            print("... Trascrizione vuota, scarto il chunk ...")
+            return False
+        print(f"📥 IT: {chunk.italian}")
+        if self.streaming_subtitles and chunk.session_id:
+            self.emit_partial_transcript(chunk)
+        return True
+
+    def emit_partial_transcript(self, chunk):
+        # Riga provvisoria per tutti i client della sessione, chiusa dal new_translation dello stesso chunk
+        timestamp = datetime.fromtimestamp(chunk.captured_at).strftime("%H:%M:%S")
+        self.socketio.emit("partial_transcript", {"chunk": chunk.seq, "italian": chunk.italian, "timestamp": timestamp},
+                           to=chunk.session_id)
+        metrics.capture_to_first_subtitle_seconds.observe(time.time() - chunk.captured_at, classroom=self.classroom.id)
+
+    def partial_sender(self, chunk, languages: set):
+        """
+        Callback per translate_many che inoltra la traduzione parziale alla stanza
+        della lingua, al massimo una volta ogni PARTIAL_TRANSLATION_INTERVAL_MS:
+        ogni evento contiene tutto il testo finora, quindi saltarne qualcuno non perde nulla.
+        """
+        last_sent = {}
+
+        def send(lang, text):
+            now = time.monotonic()
+            if lang not in languages or now - last_sent.get(lang, float("-inf")) < self.partial_interval:
                 return
-            
-            print(f"🌍 EN: {english_text}")
-            audio_filename = f"tts_{int(time.time() * 1000)}.mp3"
-            audio_file_path = Path(config.AUDIO_DIR) / audio_filename
-            
-            audio_url = None
-            if self.ai_client.text_to_speech(english_text, str(audio_file_path)):
-                audio_url = f"/audio/{audio_filename}"
-
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            result = {
-                "italian": italian_text, "english": english_text,
-                "audio_url": audio_url, "timestamp": timestamp
-            }
-            
-            if shared_state.current_session_id in shared_state.session_transcripts:
-                shared_state.session_transcripts[shared_state.current_session_id]["transcripts"].append(result)
-            
-            self.socketio.emit("new_translation", result)
-            print("✅ Chunk processato e inviato.")
+            last_sent[lang] = now
+            self.partials.put((language_room(chunk.session_id, lang), {"chunk": chunk.seq, "language": lang, "text": text}))
 
-        except Exception as e:
-            print(f"❌ Errore durante l'elaborazione del chunk: {e}")
-        finally:
-            self.processing = False # Allow the next chunk to be processed
+        return send
+
+    def send_partials(self):
+        while True:
+            items = [self.partials.get()]
+            try:
+                while True:
+                    items.append(self.partials.get_nowait())
+            except queue.Empty:
+                pass
+            # Se il thread è rimasto indietro basta l'ultimo testo di ogni chunk e lingua: contiene anche i precedenti
+            latest = {}
+            for item in items:
+                if item is not None:
+                    room, data = item
+                    latest[(data["chunk"], data["language"])] = (room, data)
+            for room, data in latest.values():
+                try:
+                    self.socketio.emit("partial_translation", data, to=room)
+                except Exception as e:
+                    print(f"❌ Errore nell'invio di una traduzione parziale: {e}")
+            if None in items:
+                break
+
+    def active_languages(self) -> set:
+        """Lingue con almeno un client in ascolto, tra quelle supportate."""
+        return self.classroom.subscribed_languages() & set(self.languages)
+
+    def translate_chunk(self, chunk):
+        # L'inglese serve sempre (trascrizione salvata, appunti); le altre lingue solo se qualcuno le ascolta
+        listened = self.active_languages()
+        targets = {DEFAULT_LANGUAGE} | listened
+        on_partial = None
+        if self.streaming_subtitles and chunk.session_id:
+            on_partial = self.partial_sender(chunk, listened)
+        translations = self.ai_client.translate_many(chunk.italian, targets, on_partial)
+        chunk.mark("translate")
+        chunk.translations = {lang: text for lang, text in translations.items() if text}
+        chunk.english = chunk.translations.get(DEFAULT_LANGUAGE, "")
+        if not chunk.english:
+            return False
+        for lang, text in chunk.translations.items():
+            print(f"🌍 {lang.upper()}: {text}")
+        return True
+
+    def synthesize_chunk(self, chunk):
+        # Audio solo per le lingue ascoltate in questo momento, sintetizzate in parallelo.
+        # Frasi già sintetizzate riusano l'mp3 esistente senza chiamare l'API; per le altre
+        # si attende solo l'inizio dell'audio: il resto arriva ai client in streaming da /audio
+        languages = [lang for lang in chunk.translations if lang in self.active_languages()]
+        filenames = self.tts_executor.map(lambda text: self.tts_store.start(text, self.ai_client),
+                                          [chunk.translations[l] for l in languages])
+        for lang, audio_filename in zip(languages, filenames):
+            if audio_filename:
+                chunk.audio_urls[lang] = f"/audio/{audio_filename}"
+        chunk.audio_url = chunk.audio_urls.get(DEFAULT_LANGUAGE)
+        chunk.mark("tts")
+        # Anche senza audio la traduzione va comunque inviata
+        return True
+
+    def emit_chunk(self, chunk):
+        timestamp = datetime.fromtimestamp(chunk.captured_at).strftime("%H:%M:%S")
+        result = {
+            "italian": chunk.italian, "english": chunk.english,
+            "audio_url": chunk.audio_url, "timestamp": timestamp,
+            "translations": chunk.translations, "audio_urls": chunk.audio_urls,
+        }
+
+        session = shared_state.session_transcripts.get(chunk.session_id)
+        if session is not None:
+            # Numero progressivo per sessione: i client lo usano per riprendere dopo una disconnessione.
+            # emit_chunk viene chiamato in ordine da un solo thread alla volta (OrderedEmitter)
+            result["seq"] = session["next_seq"]
+            session["next_seq"] += 1
+            # Prima su disco, poi nella coda in memoria usata dai client live
+            session["log"].append(result)
+            session["transcripts"].append(result)
+            if session.get("rolling_notes") is not None:
+                session["rolling_notes"].add_segment(result)
+        if self.search_index is not None and chunk.session_id:
+            self.search_index.add_segment(chunk.session_id, timestamp, chunk.italian, chunk.english)
+
+        timings = None
+        if self.timings_in_payload:
+            # Millisecondi dalla fine della cattura, per il debug lato client
+            timings = {stage: round((t - chunk.captured_at) * 1000) for stage, t in chunk.timings.items()}
+
+        # Ogni lingua riceve la propria vista del segmento, solo nella sua stanza.
+        # Sono copie: i campi solo per l'invio live non finiscono nella coda usata per il catch-up
+        for lang in chunk.translations:
+            payload = segment_for_language(result, lang)
+            # Identifica la riga provvisoria creata dai partial_transcript/partial_translation
+            payload["chunk"] = chunk.seq
+            if timings is not None:
+                payload["timings"] = timings
+            if self.inline_audio and payload["audio_url"]:
+                audio = self.audio_cache.get(payload["audio_url"].rsplit("/", 1)[-1])
+                if audio is not None:
+                    payload["audio"] = audio
+            self.socketio.emit("new_translation", payload, to=language_room(chunk.session_id, lang))
+        chunk.mark("emit")
+        self.record_timings(chunk)
+        print(f"✅ Chunk {chunk.seq} processato e inviato.")
+
+    def record_timings(self, chunk):
+        previous = None
+        for stage, t in chunk.timings.items():
+            if previous is not None:
+                metrics.stage_seconds.observe(t - previous, stage=stage, classroom=self.classroom.id)
+            previous = t
+        metrics.capture_to_emit_seconds.observe(previous - chunk.captured_at, classroom=self.classroom.id)
+
+    def collect_metrics(self):
+        stats = self.stats()
+        stages = stats["stages"]
+        room = {"classroom": self.classroom.id}
+        return [
+            ("translator_queue_depth", "gauge", "Chunk in attesa davanti a ogni stadio",
+             [({**room, "stage": name}, s["queued"]) for name, s in stages.items()]),
+            ("translator_dropped_chunks_total", "counter", "Chunk scartati per backpressure",
+             [({**room, "stage": name}, s["dropped_chunks"]) for name, s in stages.items()]),
+            ("translator_dropped_audio_seconds_total", "counter", "Secondi di audio scartati per backpressure",
+             [({**room, "stage": name}, s["dropped_seconds"]) for name, s in stages.items()]),
+            ("translator_overrun_audio_seconds_total", "counter", "Secondi di audio persi per overrun del buffer circolare",
+             [(room, stats["overrun_seconds"])]),
+            ("translator_silence_skipped_seconds_total", "counter", "Secondi di silenzio non inviati alla trascrizione",
+             [(room, stats["silence_skipped_seconds"])]),
+            ("translator_tts_cache_total", "counter", "Richieste TTS servite da file esistenti (hit) o sintetizzate (miss)",
+             [({**room, "result": "hit"}, stats["tts"]["hits"]), ({**room, "result": "miss"}, stats["tts"]["misses"])]),
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "overrun_seconds": round(self.audio_cursor.overrun_samples / self.sample_rate, 2),
+            "silence_skipped_seconds": round(getattr(self.segmenter, "skipped_seconds", 0.0), 2),
+            "stages": self.pipeline.stats(),
+            "tts": self.tts_store.stats(),
+        }
 
     def stop(self):
         self.running = False
-
+        self.wake()
@@ -0,0 +1,68 @@
+# bench_codec.py
+
+# Confronta i formati di upload su una registrazione reale di una lezione.
+# Per ogni formato riporta i byte codificati, il tempo CPU di codifica e il tempo
+# di upload simulato per chunk, dati banda in uscita e latenza della rete.
+#
+# Uso: python bench_codec.py lezione.wav --uplink-mbps 2 --rtt-ms 40
+
+import argparse
+import time
+import numpy as np
+import soundfile as sf
+
+from audio_codec import UPLOAD_FORMATS, encode_audio, is_supported
+
+SAMPLE_RATE = 16000
+
+
+def load_mono_16k(path: str) -> np.ndarray:
+    data, rate = sf.read(path, dtype="float32", always_2d=True)
+    data = data.mean(axis=1)
+    if rate != SAMPLE_RATE:
+        # Ricampionamento lineare: sufficiente per confrontare le dimensioni dei file
+        duration = len(data) / rate
+        target = np.linspace(0, duration, int(duration * SAMPLE_RATE), endpoint=False)
+        data = np.interp(target, np.arange(len(data)) / rate, data).astype(np.float32)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dei formati di upload per la trascrizione")
+    parser.add_argument("audio", help="File audio della lezione (qualsiasi formato leggibile da soundfile)")
+    parser.add_argument("--chunk-seconds", type=float, default=4.0, help="Durata di ogni chunk")
+    parser.add_argument("--uplink-mbps", type=float, default=2.0, help="Banda in upload della rete (Mbit/s)")
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="Round trip verso l'API (ms)")
+    args = parser.parse_args()
+
+    audio = load_mono_16k(args.audio)
+    chunk_len = int(args.chunk_seconds * SAMPLE_RATE)
+    chunks = [audio[i:i + chunk_len] for i in range(0, len(audio) - chunk_len + 1, chunk_len)]
+    if not chunks:
+        print("❌ Registrazione più corta di un chunk.")
+        return
+
+    print(f"🎧 {args.audio}: {len(audio) / SAMPLE_RATE:.0f}s, {len(chunks)} chunk da {args.chunk_seconds:g}s")
+    print(f"🌐 Rete simulata: {args.uplink_mbps:g} Mbit/s, RTT {args.rtt_ms:g} ms\n")
+    print(f"{'formato':<8} {'KB/chunk':>10} {'rapporto':>9} {'CPU ms/chunk':>13} {'upload ms/chunk':>16}")
+
+    baseline = None
+    for fmt in UPLOAD_FORMATS:
+        if not is_supported(fmt):
+            print(f"{fmt:<8} non supportato dalla libsndfile installata")
+            continue
+        total_bytes = 0
+        cpu_start = time.process_time()
+        for chunk in chunks:
+            total_bytes += len(encode_audio(chunk, SAMPLE_RATE, fmt).getbuffer())
+        cpu_ms = (time.process_time() - cpu_start) * 1000 / len(chunks)
+
+        bytes_per_chunk = total_bytes / len(chunks)
+        baseline = baseline or bytes_per_chunk
+        upload_ms = args.rtt_ms + bytes_per_chunk * 8 / (args.uplink_mbps * 1_000_000) * 1000
+        print(f"{fmt:<8} {bytes_per_chunk / 1024:>10.1f} {baseline / bytes_per_chunk:>8.1f}x "
+              f"{cpu_ms:>13.2f} {upload_ms:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench_pipeline.py
+
+# Benchmark end-to-end della pipeline senza microfono e senza rete.
+# Riproduce una lezione registrata attraverso SimpleTranslatorWorker, con lo stub
+# locale al posto di OpenAI, e riporta la latenza cattura -> invio per segmento,
+# il throughput e i secondi di audio persi.
+#
+# Uso: python bench_pipeline.py lezione.wav --speed 4 --transcribe-latency lognormal:700,0.35
+
+import argparse
+import tempfile
+import threading
+import time
+import numpy as np
+
+import config
+import segment_log
+import shared_state
+from ai_client import AIClient
+from audio_source import WavFileSource
+from audio_worker import SimpleTranslatorWorker
+from stub_server import StubServer, DEFAULT_LATENCIES
+
+
+class RecordingSocketIO:
+    """Sostituto di SocketIO che registra gli eventi invece di inviarli."""
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data=None, **kwargs):
+        self.events.append((time.time(), event, data))
+
+
+class BenchmarkWorker(SimpleTranslatorWorker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.first_subtitle_latencies = []
+        self.emitted_audio_seconds = 0.0
+
+    def emit_partial_transcript(self, chunk):
+        super().emit_partial_transcript(chunk)
+        self.first_subtitle_latencies.append(time.time() - chunk.captured_at)
+
+    def emit_chunk(self, chunk):
+        super().emit_chunk(chunk)
+        self.latencies.append(time.time() - chunk.captured_at)
+        self.emitted_audio_seconds += chunk.duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end della pipeline con backend simulato")
+    parser.add_argument("audio", help="Registrazione della lezione da riprodurre")
+    parser.add_argument("--speed", type=float, default=1.0, help="Velocità di riproduzione (1 = tempo reale)")
+    parser.add_argument("--port", type=int, default=0, help="Porta dello stub (0 = libera)")
+    parser.add_argument("--transcribe-latency", default=DEFAULT_LATENCIES["transcribe"])
+    parser.add_argument("--chat-latency", default=DEFAULT_LATENCIES["chat"])
+    parser.add_argument("--speech-latency", default=DEFAULT_LATENCIES["speech"])
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, {
+        "transcribe": args.transcribe_latency, "chat": args.chat_latency, "speech": args.speech_latency,
+    }, args.error_rate)
+    stub.start()
+
+    # Nessun effetto collaterale sulle cartelle reali
+    config.AUDIO_DIR = tempfile.mkdtemp(prefix="bench_audio_")
+    config.SESSIONS_DIR = tempfile.mkdtemp(prefix="bench_sessions_")
+    ai_client = AIClient("sk-stub", base_url=stub.base_url)
+    socketio = RecordingSocketIO()
+
+    sample_rate = 16000
+    block_size = int(sample_rate * getattr(config, "AUDIO_BLOCK_MS", 100) / 1000)
+    source = WavFileSource(args.audio, sample_rate, block_size, speed=args.speed)
+    classroom = shared_state.add_classroom("benchmark")
+    worker = BenchmarkWorker(ai_client, socketio, sample_rate=sample_rate, source=source, classroom=classroom)
+    threading.Thread(target=worker.run, daemon=True).start()
+
+    session_id = "benchmark"
+    classroom.current_session_id = session_id
+    # Un ascoltatore simulato, altrimenti la pipeline non sintetizzerebbe l'audio
+    classroom.subscribe_language("benchmark-listener", "en")
+    shared_state.session_transcripts[session_id] = {"transcripts": [], "next_seq": 0, "log": segment_log.SegmentLog(session_id)}
+    print(f"▶️ Riproduzione di {source.duration:.0f}s di audio a velocità {args.speed:g}x...")
+    started = time.time()
+    classroom.set_session_active(True)
+    source.finished.wait()
+    classroom.set_session_active(False)
+    drained = worker.drain(timeout=120)
+    elapsed = time.time() - started
+    shared_state.session_transcripts[session_id]["log"].close()
+    worker.stop()
+    stub.stop()
+
+    stats = worker.stats()
+    dropped = stats["overrun_seconds"] + sum(s["dropped_seconds"] for s in stats["stages"].values())
+    print("\n--- Risultati ---")
+    if not drained:
+        print("⚠️ La pipeline non si è svuotata entro il timeout: risultati parziali")
+    if worker.latencies:
+        lat = np.array(worker.latencies) * 1000
+        p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+        print(f"Segmenti emessi:        {len(lat)}")
+        print(f"Latenza cattura->invio: p50 {p50:.0f} ms, p90 {p90:.0f} ms, p99 {p99:.0f} ms, max {lat.max():.0f} ms")
+    else:
+        print("Nessun segmento emesso.")
+    if worker.first_subtitle_latencies:
+        lat = np.array(worker.first_subtitle_latencies) * 1000
+        p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+        print(f"Primo sottotitolo:      p50 {p50:.0f} ms, p90 {p90:.0f} ms, p99 {p99:.0f} ms")
+    print(f"Tempo totale:           {elapsed:.1f}s per {source.duration:.0f}s di audio")
+    print(f"Throughput:             {worker.emitted_audio_seconds / elapsed:.2f}s di audio tradotto al secondo")
+    print(f"Audio perso:            {dropped:.1f}s (overrun buffer {stats['overrun_seconds']:.1f}s)")
+    print(f"Silenzio saltato:       {stats['silence_skipped_seconds']:.1f}s")
+    print(f"Chiamate allo stub:     {stub.app.stats}")
+
+
+if __name__ == "__main__":
+    main()
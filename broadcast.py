@@ -0,0 +1,87 @@
+# broadcast.py
+
+# Invio degli eventi Socket.IO dai thread dell'applicazione (pipeline audio,
+# lavori in background) verso i client, in tutte le modalità del server.
+#
+# In modalità "threading" si chiama direttamente socketio.emit. Con gevent o
+# eventlet il server gira su un event loop cooperativo, mentre la pipeline usa
+# thread veri (non applichiamo il monkey patching, che li renderebbe green
+# thread): emettere da quei thread non è sicuro. Gli eventi vengono quindi
+# accodati e inviati da un task in background del server, che si sveglia appena
+# arriva un evento (l'attesa sulla coda avviene nel pool di thread nativi).
+
+import queue
+
+SERVER_MODES = ("threading", "gevent", "eventlet")
+
+# Attesa massima di un evento nel pool di thread: il thread torna libero di tanto
+# in tanto, così non impedisce la chiusura del processo
+WAIT_TIMEOUT = 1.0
+
+
+def resolve_server_mode(mode: str) -> str:
+    if mode not in SERVER_MODES:
+        raise ValueError(f"SERVER_MODE non valido: {mode} (valori ammessi: {', '.join(SERVER_MODES)})")
+    if mode != "threading":
+        try:
+            __import__(mode)
+        except ImportError:
+            print(f"⚠️ {mode} non installato: uso la modalità threading")
+            return "threading"
+    return mode
+
+
+class Broadcaster:
+    """Stessa firma di socketio.emit, utilizzabile da qualsiasi thread."""
+
+    def __init__(self, socketio, server_mode: str = "threading"):
+        self.socketio = socketio
+        self.server_mode = server_mode
+        self.direct = server_mode == "threading"
+        self.pending = queue.SimpleQueue()
+
+    def start(self):
+        if not self.direct:
+            self.socketio.start_background_task(self._pump)
+
+    def emit(self, event: str, data=None, **kwargs):
+        if self.direct:
+            self.socketio.emit(event, data, **kwargs)
+        else:
+            self.pending.put((event, data, kwargs))
+
+    def _pump(self):
+        while True:
+            # Attesa bloccante fuori dall'event loop, poi si svuota la coda senza altri passaggi di thread
+            item = run_blocking(self.server_mode, self._wait)
+            if item is None:
+                continue
+            try:
+                while True:
+                    event, data, kwargs = item
+                    self.socketio.emit(event, data, **kwargs)
+                    item = self.pending.get_nowait()
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"❌ Errore nell'invio di un evento: {e}")
+
+    def _wait(self):
+        try:
+            return self.pending.get(timeout=WAIT_TIMEOUT)
+        except queue.Empty:
+            return None
+
+
+def run_blocking(server_mode: str, function, *args):
+    """
+    Esegue una funzione che può bloccare a lungo (attese su thread, I/O) senza
+    fermare l'event loop: con gevent/eventlet la sposta nel pool di thread nativi.
+    """
+    if server_mode == "gevent":
+        import gevent
+        return gevent.get_hub().threadpool.apply(function, args)
+    if server_mode == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(function, *args)
+    return function(*args)
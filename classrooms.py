@@ -0,0 +1,65 @@
+# classrooms.py
+
+# Più aule servite dallo stesso processo. Ogni aula ha il proprio stato
+# (shared_state.ClassroomState), la propria sorgente audio (microfono locale o
+# audio inviato dal browser, vedi audio_ingest.py) e la propria pipeline
+# (SimpleTranslatorWorker) e i suoi client stanno nella stanza Socket.IO
+# dell'aula. Tutte le pipeline condividono un solo AIClient: stesse connessioni
+# e stesso budget di concorrenza per endpoint, ripartito a turno tra le aule.
+
+import threading
+
+import config
+import shared_state
+from audio_source import IngestSource, MicrophoneSource
+from audio_worker import SimpleTranslatorWorker, create_tts_store
+
+
+def classroom_configs() -> dict:
+    """Aule dalla configurazione (CLASSROOMS); senza, un'unica aula sul microfono predefinito."""
+    return getattr(config, "CLASSROOMS", None) or {shared_state.DEFAULT_CLASSROOM: {"name": "Aula"}}
+
+
+class ClassroomManager:
+    def __init__(self, ai_client, socketio, configs: dict, sample_rate: int = 16000, **worker_options):
+        self.workers = {}
+        # Un solo archivio TTS: le sintesi in corso si condividono tra le aule e ogni file ha un solo scrittore
+        self.tts_store = create_tts_store(ai_client, worker_options.get("audio_cache"))
+        block_size = int(sample_rate * getattr(config, "AUDIO_BLOCK_MS", 100) / 1000)
+        for classroom_id, options in configs.items():
+            classroom = shared_state.add_classroom(classroom_id, options.get("name"))
+            # "ingest": l'audio arriva dal browser del docente invece che da un dispositivo locale
+            if options.get("source") == "ingest":
+                source = IngestSource(sample_rate, block_size)
+            else:
+                source = MicrophoneSource(sample_rate, block_size, device=options.get("device"))
+            self.workers[classroom_id] = SimpleTranslatorWorker(
+                ai_client.for_tenant(classroom_id), socketio, sample_rate=sample_rate, source=source,
+                classroom=classroom, tts_store=self.tts_store, **worker_options,
+            )
+        print(f"🏫 Aule configurate: {', '.join(self.workers)}")
+
+    def start(self):
+        for classroom_id, worker in self.workers.items():
+            threading.Thread(target=worker.run, name=f"worker-{classroom_id}", daemon=True).start()
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+
+    def worker(self, classroom_id: str) -> SimpleTranslatorWorker | None:
+        return self.workers.get(classroom_id)
+
+    def ingest_source(self, classroom_id: str) -> IngestSource | None:
+        """La sorgente di un'aula che riceve l'audio dalla rete, se è configurata così."""
+        worker = self.workers.get(classroom_id)
+        if worker is None or not isinstance(worker.source, IngestSource):
+            return None
+        return worker.source
+
+    def pending_audio(self, filename: str):
+        """Sintesi ancora in corso per `filename`, avviata da una qualsiasi delle aule (vedi TTSStore.pending)."""
+        return self.tts_store.pending(filename)
+
+    def status(self) -> list[dict]:
+        return [shared_state.get_classroom(classroom_id).status() for classroom_id in self.workers]
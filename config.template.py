@@ -2,8 +2,126 @@
 
 # Inserisci qui la tua API key di OpenAI o lasciala come variabile d'ambiente
 OPENAI_API_KEY = "sk-..." 
+# Endpoint alternativo compatibile con OpenAI (es. "http://127.0.0.1:8765/v1" per stub_server.py); None = OpenAI
+OPENAI_BASE_URL = None
 
 # Nomi delle directory
 AUDIO_DIR = "audio_files"
 NOTES_DIR = "notes"
-TRANSCRIPTS_DIR = "transcripts"
\ No newline at end of file
+TRANSCRIPTS_DIR = "transcripts"
+
+# Pipeline di elaborazione audio
+# Numero di chunk elaborati in parallelo da ogni stadio
+PIPELINE_WORKERS = {"transcribe": 2, "translate": 2, "tts": 2}
+# Dimensione massima della coda davanti a ogni stadio
+PIPELINE_QUEUE_SIZE = 4
+# Cosa fare quando una coda è piena: "drop_oldest" scarta il chunk più vecchio, "block" rallenta la cattura
+PIPELINE_BACKPRESSURE = "drop_oldest"
+
+# Segmentazione dell'audio: "vad" chiude i segmenti sulle pause del parlato, "fixed" usa chunk da 4 secondi
+SEGMENTATION = "vad"
+VAD_FRAME_MS = 30            # Durata di un frame di analisi (10, 20 o 30 ms per webrtcvad)
+VAD_THRESHOLD_DB = -45.0     # Soglia minima di energia (dBFS) per considerare un frame parlato
+VAD_SILENCE_MS = 600         # Pausa che chiude un segmento
+VAD_MIN_SEGMENT_S = 1.5      # Durata minima di un segmento
+VAD_MAX_SEGMENT_S = 10.0     # Durata massima: oltre questa il segmento viene comunque chiuso
+VAD_MIN_SPEECH_MS = 250      # Segmenti con meno parlato di così vengono scartati come rumore
+VAD_PADDING_MS = 200         # Silenzio mantenuto prima e dopo il parlato
+VAD_BACKEND = "energy"       # "energy" oppure "webrtc" (richiede il pacchetto webrtcvad)
+VAD_AGGRESSIVENESS = 2       # Aggressività di webrtcvad (0-3)
+VAD_NOISE_WINDOW_S = 10.0    # Finestra (secondi) su cui si stima il rumore di fondo
+VAD_NOISE_PERCENTILE = 15.0  # Percentile dell'energia dei frame preso come rumore di fondo
+
+# Durata dei blocchi audio consegnati dal microfono: blocchi più corti riducono la latenza
+AUDIO_BLOCK_MS = 100
+
+# Formato dei chunk inviati alla trascrizione: "wav" (PCM 16 bit), "flac" oppure "opus" (Ogg/Opus)
+# Usa bench_codec.py per scegliere il più conveniente per la tua rete
+UPLOAD_FORMAT = "flac"
+
+# Cache persistente delle traduzioni (SQLite) con un LRU in memoria davanti
+CACHE_DB = "data/cache.sqlite3"
+TRANSLATION_CACHE_MEMORY_ITEMS = 2000
+TRANSLATION_CACHE_MAX_ENTRIES = 100_000
+
+# Ritenzione dei file TTS in AUDIO_DIR: quota massima, età massima dall'ultimo uso e frequenza del controllo
+AUDIO_QUOTA_MB = 500
+AUDIO_MAX_AGE_HOURS = 24
+AUDIO_CLEANUP_INTERVAL_S = 300
+
+# Client OpenAI: timeout per chiamata (secondi), chiamate contemporanee per endpoint e tentativi su 429/5xx
+AI_TIMEOUTS = {"transcribe": 30, "translate": 15, "tts": 30, "summarize": 180, "translate_document": 90}
+AI_CONCURRENCY = {"transcribe": 4, "translate": 8, "tts": 4, "summarize": 4, "translate_document": 4}
+AI_MAX_RETRIES = 3
+
+# Includi nel payload di new_translation i tempi di ogni fase (ms dalla fine della cattura), per il debug
+METRICS_IN_PAYLOAD = False
+
+# Log dei segmenti delle sessioni live (JSONL), usato per il recupero dopo un crash
+SESSIONS_DIR = "sessions"
+SEGMENT_LOG_FSYNC_EVERY = 10         # fsync dopo questo numero di segmenti...
+SEGMENT_LOG_FSYNC_INTERVAL_S = 1.0   # ...o comunque dopo questo intervallo
+LIVE_TAIL_SEGMENTS = 200             # Segmenti recenti tenuti in memoria per la sessione live
+STOP_DRAIN_TIMEOUT_S = 15            # Attesa massima per gli ultimi segmenti quando si ferma la sessione
+STOP_LATE_TIMEOUT_S = 600            # Oltre quella, la sessione si chiude in background all'arrivo dei segmenti (max)
+
+# Catalogo delle sessioni (SQLite) usato da /session_list e dalla GUI
+CATALOG_DB = "data/catalog.sqlite3"
+
+# Indice full-text (SQLite FTS5) di trascrizioni e appunti, usato da /search
+SEARCH_DB = "data/search.sqlite3"
+
+# Generazione degli appunti a sezioni (map-reduce): token per sezione e per singola unione.
+# Le sezioni vengono riassunte in parallelo, al massimo AI_CONCURRENCY["summarize"] alla volta.
+NOTES_SECTION_TOKENS = 3000
+NOTES_MERGE_TOKENS = 12000
+NOTES_CACHE_MAX_ENTRIES = 20_000
+# Gli appunti vengono tradotti per sezioni Markdown di al massimo questi token, in parallelo
+NOTES_TRANSLATION_SECTION_TOKENS = 1500
+# Riassumi le sezioni già durante la lezione, così gli appunti sono pronti pochi secondi dopo lo stop
+LIVE_NOTES = True
+
+# Lavori in background (generazione appunti): database della coda e thread che li eseguono
+JOBS_DB = "data/jobs.sqlite3"
+JOB_WORKERS = 2
+
+# Server: "threading" (sviluppo) oppure "gevent"/"eventlet" per centinaia di client
+# (pip install gevent gevent-websocket, oppure eventlet). I thread della pipeline
+# restano thread nativi: non serve, e non va applicato, il monkey patching.
+SERVER_MODE = "threading"
+
+# Segmenti recenti inviati a un client che si collega a lezione iniziata (la ripresa dopo una
+# disconnessione invia invece tutti quelli persi, dalla coda in memoria o dal log)
+CATCH_UP_NEW_CLIENT_SEGMENTS = 20
+
+# Cache in memoria degli mp3 TTS recenti (servita con ETag e Cache-Control immutable)
+AUDIO_CACHE_MB = 64
+# Allega l'mp3 come binario all'evento new_translation invece di farlo scaricare a ogni client
+AUDIO_INLINE = False
+
+# Lingue in cui gli studenti possono seguire la lezione (codice -> nome nel prompt di traduzione).
+# Si traduce e sintetizza solo nelle lingue scelte da almeno un client; l'inglese viene sempre tradotto.
+LANGUAGES = {"en": "inglese", "es": "spagnolo", "zh": "cinese (semplificato)", "ar": "arabo"}
+
+# Sottotitoli a bassa latenza: l'italiano viene inviato appena trascritto (partial_transcript)
+# e la traduzione in streaming (partial_translation, al massimo un evento ogni intervallo)
+STREAMING_SUBTITLES = True
+PARTIAL_TRANSLATION_INTERVAL_MS = 150
+
+# Sintesi vocale per frasi: i testi più lunghi vengono divisi in frasi di almeno questi caratteri,
+# sintetizzate in parallelo; l'audio viene inviato ai client mentre le altre sono ancora in sintesi (0 = disattivato)
+TTS_SENTENCE_MIN_CHARS = 60
+
+# Aule servite dallo stesso server: id -> nome e dispositivo audio di ingresso (None = predefinito,
+# altrimenti indice o nome come in `python -m sounddevice`). Ogni aula ha la propria pipeline e
+# le proprie sessioni; le chiamate API condividono AI_CONCURRENCY, ripartito a turno tra le aule.
+# I client scelgono l'aula con ?classroom=<id> nell'indirizzo (predefinita: la prima).
+# Con "source": "ingest" l'audio arriva dal browser del docente (teacher.html?classroom=<id>&token=...)
+CLASSROOMS = {
+    "aula": {"name": "Aula", "device": None},
+    # "aula2": {"name": "Aula 2", "source": "ingest"},
+}
+
+# Token richiesto ai client che inviano l'audio della lezione (None = invio dal browser disattivato).
+# Opus richiede opuslib e libopus (vedi requirements.txt); senza, il browser invia PCM a 16 bit e 16 kHz
+INGEST_TOKEN = None
@@ -6,6 +6,7 @@ import subprocess
 import sys
 import os
 import threading
+import time
 from pathlib import Path
 import requests
 import qrcode
@@ -13,11 +14,17 @@ from PIL import Image, ImageTk
 
 import config
 import shared_state
+from session_catalog import format_session
 from utils import generate_and_save_notes, get_local_ip, save_transcript_to_file
 
+# Numero massimo di sessioni mostrate nella lista della GUI
+GUI_SESSION_LIMIT = 100
+# Intervallo di controllo dello stato dei lavori in background (es. generazione appunti)
+JOB_POLL_INTERVAL_S = 2
+
 # ... (tutti gli import esistenti) ...
 
-def launch_gui(ai_client):
+def launch_gui(ai_client, catalog):
     root = tk.Tk()
     root.title("Controller Server Traduttore")
     root.geometry("650x500") # Allargata leggermente per il nuovo pulsante
@@ -29,26 +36,12 @@ def launch_gui(ai_client):
         nonlocal displayed_session_ids
         session_listbox.delete(0, tk.END)
         displayed_session_ids.clear()
-        transcript_files = Path(config.TRANSCRIPTS_DIR).glob("trascrizione_*.txt")
-        sessions_found = {}
-        for f in transcript_files:
-            session_id = f.stem.replace("trascrizione_", "")
-            parts = session_id.split('_')
-            if len(parts) < 4: continue
-            try:
-                timestamp_str = parts[-2] + parts[-1]
-                sessions_found[session_id] = timestamp_str
-            except IndexError:
-                continue
-        sorted_ids = sorted(sessions_found, key=sessions_found.get, reverse=True)
-        displayed_session_ids.extend(sorted_ids)
-        for session_id in sorted_ids:
-            parts = session_id.split('_')
-            docente = parts[0]
-            materia = " ".join(parts[1:-2])
-            data_str, ora_str = parts[-2], parts[-1]
-            display_text = f'{materia} - {docente} ({data_str[6:8]}/{data_str[4:6]}/{data_str[0:4]} {ora_str[0:2]}:{ora_str[2:4]})'
-            session_listbox.insert(tk.END, display_text)
+        # Le sessioni più recenti dal catalogo, senza scorrere la cartella delle trascrizioni
+        rows, _ = catalog.list_sessions(per_page=GUI_SESSION_LIMIT, has_transcript=True)
+        for row in rows:
+            session = format_session(row)
+            displayed_session_ids.append(session["id"])
+            session_listbox.insert(tk.END, f'{session["materia"]} - {session["docente"]} ({session["data"]} {session["ora"]})')
 
     def get_selected_session_id():
         selected_indices = session_listbox.curselection()
@@ -68,8 +61,13 @@ def launch_gui(ai_client):
             status_label.config(text=f"Stato: Genero appunti per {session_id}...", fg="orange")
             root.update_idletasks()
             def run_generation():
+                # Il server accoda il lavoro: ne controlliamo lo stato finché non è concluso
                 response = requests.get(f"http://127.0.0.1:8000/process_session/{session_id}")
-                if response.ok and response.json().get("success"):
+                job = response.json() if response.ok else {}
+                while job.get("status") in ("queued", "running"):
+                    time.sleep(JOB_POLL_INTERVAL_S)
+                    job = requests.get(f"http://127.0.0.1:8000/jobs/{job['id']}").json()
+                if job.get("status") == "done":
                     status_label.config(text="Stato: Appunti generati!", fg="blue")
                     open_file(notes_filepath)
                 else:
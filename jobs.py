@@ -0,0 +1,123 @@
+# jobs.py
+
+# Coda dei lavori in background (es. generazione degli appunti).
+# I lavori vengono salvati su SQLite, così un riavvio non perde quelli in coda,
+# ed eseguiti da un numero limitato di thread. Le richieste per la stessa
+# sessione mentre un lavoro è già in coda o in esecuzione vengono unite a quello.
+
+import queue
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Stati di un lavoro
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    def __init__(self, db_path: str, handlers: dict, workers: int = 2, on_done=None):
+        """
+        `handlers` associa a ogni tipo di lavoro una funzione `handler(session_id) -> bool`;
+        `on_done(job)` viene chiamata al termine di ogni lavoro, riuscito o no.
+        """
+        self.handlers = handlers
+        self.workers = workers
+        self.on_done = on_done
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_session ON jobs(kind, session_id, status);
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at);
+            """
+        )
+        self.db.commit()
+
+    def start(self):
+        # I lavori interrotti da un riavvio ripartono da capo, nell'ordine in cui erano stati richiesti
+        with self.lock:
+            self.db.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING))
+            self.db.commit()
+            pending = self.db.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        for row in pending:
+            self.queue.put(row["id"])
+        if pending:
+            print(f"🗂️ Ripresi {len(pending)} lavori in coda dall'esecuzione precedente")
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, kind: str, session_id: str) -> dict:
+        """Accoda un lavoro, o restituisce quello già attivo per la stessa sessione."""
+        if kind not in self.handlers:
+            raise ValueError(f"Tipo di lavoro sconosciuto: {kind}")
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND session_id = ? AND status IN (?, ?)",
+                (kind, session_id, QUEUED, RUNNING),
+            ).fetchone()
+            if row:
+                return dict(row)
+            job_id = uuid.uuid4().hex
+            self.db.execute(
+                "INSERT INTO jobs (id, kind, session_id, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, session_id, QUEUED, datetime.now().isoformat()),
+            )
+            self.db.commit()
+        self.queue.put(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> dict | None:
+        with self.lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def stats(self) -> dict:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", (QUEUED, RUNNING)
+            ).fetchall()
+        return {QUEUED: 0, RUNNING: 0, **{status: count for status, count in rows}}
+
+    def _update(self, job_id: str, **fields) -> dict:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self.db.commit()
+        return self.get(job_id)
+
+    def _work(self):
+        while True:
+            job_id = self.queue.get()
+            job = self._update(job_id, status=RUNNING, started_at=datetime.now().isoformat())
+            print(f"🗂️ Lavoro {job['kind']} avviato per {job['session_id']}")
+            error = None
+            try:
+                ok = self.handlers[job["kind"]](job["session_id"])
+            except Exception as e:
+                ok, error = False, str(e)
+                print(f"❌ Errore nel lavoro {job['kind']} per {job['session_id']}: {e}")
+            job = self._update(job_id, status=DONE if ok else FAILED,
+                               finished_at=datetime.now().isoformat(), error=error)
+            if self.on_done is not None:
+                try:
+                    self.on_done(job)
+                except Exception as e:
+                    print(f"❌ Errore nella notifica del lavoro {job_id}: {e}")
@@ -0,0 +1,91 @@
+# loadtest_socketio.py
+
+# Test di carico della diffusione dei sottotitoli: apre N client Socket.IO contro
+# un server avviato, li fa entrare nella stanza della sessione attiva e misura,
+# per ogni traduzione, quanto tempo passa tra il primo e l'ultimo client che la
+# riceve. Con --server-pid riporta anche la CPU usata dal server.
+#
+# Uso (con una sessione attiva, ad es. con OPENAI_BASE_URL puntato a stub_server.py):
+#   python loadtest_socketio.py --clients 300 --duration 60 --server-pid 12345
+# Richiede: pip install "python-socketio[asyncio_client]" (psutil opzionale)
+
+import argparse
+import asyncio
+import time
+import numpy as np
+import socketio
+
+
+async def run_client(url: str, arrivals: dict, connected: list, stop: asyncio.Event):
+    client = socketio.AsyncClient(reconnection=False)
+
+    @client.on("session_status")
+    async def on_status(data):
+        if data.get("active"):
+            await client.emit("join_session", {"session_id": data["session_id"]})
+
+    @client.on("new_translation")
+    async def on_translation(data):
+        key = (data.get("timestamp"), data.get("italian"))
+        arrivals.setdefault(key, []).append(time.monotonic())
+
+    try:
+        await client.connect(url, transports=["websocket"])
+    except Exception as e:
+        print(f"❌ Connessione fallita: {e}")
+        return
+    connected.append(client)
+    await stop.wait()
+    await client.disconnect()
+
+
+def cpu_seconds(pid: int | None) -> float | None:
+    if pid is None:
+        return None
+    try:
+        import psutil
+    except ImportError:
+        print("⚠️ psutil non installato: CPU del server non misurata")
+        return None
+    times = psutil.Process(pid).cpu_times()
+    return times.user + times.system
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Test di carico dei client Socket.IO")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=60, help="Secondi di misura dopo le connessioni")
+    parser.add_argument("--ramp", type=float, default=10, help="Secondi in cui distribuire le connessioni")
+    parser.add_argument("--server-pid", type=int, default=None)
+    args = parser.parse_args()
+
+    arrivals, connected, stop = {}, [], asyncio.Event()
+    tasks = []
+    for i in range(args.clients):
+        tasks.append(asyncio.create_task(run_client(args.url, arrivals, connected, stop)))
+        await asyncio.sleep(args.ramp / args.clients)
+    print(f"🔌 Client connessi: {len(connected)}/{args.clients}")
+
+    cpu_start, started = cpu_seconds(args.server_pid), time.monotonic()
+    await asyncio.sleep(args.duration)
+    cpu_end, elapsed = cpu_seconds(args.server_pid), time.monotonic() - started
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print("\n--- Risultati ---")
+    if not arrivals:
+        print("Nessuna traduzione ricevuta: c'è una sessione attiva?")
+        return
+    spreads = np.array([(max(t) - min(t)) * 1000 for t in arrivals.values()])
+    delivered = np.array([len(t) for t in arrivals.values()])
+    print(f"Traduzioni ricevute:    {len(arrivals)}")
+    print(f"Consegne per messaggio: media {delivered.mean():.0f} su {len(connected)} client")
+    print(f"Dispersione primo->ultimo client: p50 {np.percentile(spreads, 50):.0f} ms, "
+          f"p99 {np.percentile(spreads, 99):.0f} ms, max {spreads.max():.0f} ms")
+    if cpu_start is not None and cpu_end is not None:
+        print(f"CPU del server:         {(cpu_end - cpu_start) / elapsed * 100:.1f}% di un core")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+# metrics.py
+
+# Metriche dell'applicazione esposte in formato testo Prometheus su /metrics.
+# Contatori e istogrammi sono oggetti globali del modulo, aggiornati dai vari
+# componenti; i valori istantanei (code, audio scartato...) vengono letti al
+# momento della richiesta tramite i collector registrati.
+
+import threading
+
+# Limiti degli istogrammi di latenza, in secondi
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30)
+
+_registry = []
+_collectors = []
+_lock = threading.Lock()
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            state = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, observations) in sorted(self.values.items()):
+            labels = dict(key)
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {observations}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {observations}")
+        return lines
+
+
+def register_collector(callback):
+    """
+    Registra una funzione chiamata a ogni richiesta di /metrics. Deve restituire una
+    lista di (nome, tipo, descrizione, [(etichette, valore), ...]).
+    """
+    _collectors.append(callback)
+
+
+def render() -> str:
+    with _lock:
+        lines = []
+        for metric in _registry:
+            lines.extend(metric.render())
+
+    grouped = {}
+    for callback in list(_collectors):
+        try:
+            for name, kind, help_text, samples in callback():
+                entry = grouped.setdefault(name, (kind, help_text, []))
+                entry[2].extend(samples)
+        except Exception as e:
+            print(f"❌ Errore nella raccolta delle metriche: {e}")
+    for name, (kind, help_text, samples) in grouped.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Metriche della pipeline audio ---
+stage_seconds = Histogram(
+    "translator_stage_seconds",
+    "Tempo trascorso in ogni fase di un chunk (attesa in coda compresa)",
+)
+capture_to_emit_seconds = Histogram(
+    "translator_capture_to_emit_seconds",
+    "Latenza dalla fine della cattura all'invio ai client",
+)
+capture_to_first_subtitle_seconds = Histogram(
+    "translator_capture_to_first_subtitle_seconds",
+    "Latenza dalla fine della cattura al primo sottotitolo parziale (solo con STREAMING_SUBTITLES)",
+)
+
+# --- Metriche delle chiamate API ---
+api_requests_total = Counter("translator_api_requests_total", "Chiamate API completate per endpoint ed esito")
+api_retries_total = Counter("translator_api_retries_total", "Nuovi tentativi dopo errori 429/5xx o di rete")
+api_seconds = Histogram("translator_api_seconds", "Durata delle chiamate API riuscite, retry compresi")
@@ -0,0 +1,204 @@
+# notes.py
+
+# Generazione degli appunti in stile map-reduce.
+# La trascrizione viene divisa in sezioni entro un budget di token (sempre sui
+# confini dei segmenti), le sezioni vengono riassunte in parallelo e i riassunti
+# parziali vengono poi uniti in un unico documento. Con la cache degli appunti
+# (vedi AsyncAIClient) rigenerare le note dopo una modifica rifà solo le parti cambiate.
+
+import asyncio
+import re
+import threading
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken è opzionale: senza, usiamo una stima dai caratteri
+    _ENCODING = None
+
+
+def estimate_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    # In italiano un token corrisponde in media a circa 4 caratteri
+    return len(text) // 4 + 1
+
+
+def format_segment(segment: dict) -> str:
+    """Un segmento nel formato dei file di trascrizione (vedi utils.format_transcript)."""
+    return f"[{segment.get('timestamp', '')}] IT: {segment.get('italian', '')}\nEN: {segment.get('english', '')}\n"
+
+
+def split_sections(transcript_text: str, max_tokens: int) -> list[str]:
+    """
+    Raggruppa i blocchi della trascrizione (separati da una riga vuota, uno per
+    segmento) in sezioni di al massimo `max_tokens`. Le sezioni si riempiono
+    dall'inizio, così se la trascrizione cresce cambia solo l'ultima.
+    """
+    sections, current, current_tokens = [], [], 0
+    for block in transcript_text.split("\n\n"):
+        block = block.strip()
+        if not block:
+            continue
+        tokens = estimate_tokens(block)
+        if current and current_tokens + tokens > max_tokens:
+            sections.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += tokens
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def group_by_budget(texts: list[str], max_tokens: int) -> list[list[str]]:
+    """Divide una lista ordinata di testi in gruppi consecutivi entro il budget (almeno due per gruppo)."""
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_markdown(text: str, max_tokens: int) -> list[str]:
+    """
+    Divide un documento Markdown in parti consecutive entro `max_tokens`: prima
+    sui titoli, poi, per le sezioni troppo lunghe, sui paragrafi, sulle righe e
+    infine sulle frasi. Concatenando le parti si riottiene esattamente il testo originale.
+    """
+    parts = []
+    for section in re.split(r"(?m)^(?=#{1,6}\s)", text):
+        if section:
+            parts.extend(_split_to_budget(section, max_tokens, [r"(?<=\n)(?=\s*\n)", r"(?<=\n)", r"(?<=[.!?;] )"]))
+    return parts
+
+
+def _split_to_budget(text: str, max_tokens: int, separators: list[str]) -> list[str]:
+    if estimate_tokens(text) <= max_tokens or not separators:
+        return [text]
+    pieces = [p for p in re.split(separators[0], text) if p]
+    parts, current = [], ""
+    for piece in pieces:
+        if current and estimate_tokens(current + piece) > max_tokens:
+            parts.append(current)
+            current = ""
+        current += piece
+    if current:
+        parts.append(current)
+    # Un paragrafo da solo oltre il budget viene diviso sul separatore successivo
+    return [sub for part in parts for sub in _split_to_budget(part, max_tokens, separators[1:])]
+
+
+async def translate_markdown(client, text: str, section_tokens: int = 1500) -> str:
+    """
+    Traduce un documento Markdown per parti, in parallelo (entro il limite di
+    concorrenza del client), e le ricompone nell'ordine originale mantenendo
+    gli spazi e le righe vuote tra una parte e l'altra.
+    """
+    parts = split_markdown(text, section_tokens)
+    cores = [part.strip() for part in parts]
+    translations = await asyncio.gather(*(client.translate_section(c) for c in cores if c))
+    if any(not t for t in translations):
+        print("❌ Traduzione di una o più parti degli appunti non riuscita")
+        return ""
+
+    result, translated = [], iter(translations)
+    for part, core in zip(parts, cores):
+        if not core:
+            result.append(part)
+            continue
+        start = part.index(core)
+        result.append(part[:start] + next(translated) + part[start + len(core):])
+    return "".join(result)
+
+
+async def map_reduce_notes(client, transcript_text: str, section_tokens: int = 3000, merge_tokens: int = 12000) -> str:
+    """
+    Genera gli appunti con `client` (un AsyncAIClient). La concorrenza è limitata
+    dal semaforo "summarize" del client: il tempo totale dipende dal numero di
+    chiamate parallele consentite, non dalla lunghezza della lezione.
+    """
+    sections = split_sections(transcript_text, section_tokens)
+    if not sections:
+        return ""
+    print(f"🧩 Appunti: {len(sections)} sezioni da riassumere")
+
+    partials = await asyncio.gather(*(client.summarize_section(s) for s in sections))
+    if any(not p for p in partials):
+        print("❌ Riassunto di una o più sezioni non riuscito")
+        return ""
+    return await reduce_notes(client, partials, merge_tokens)
+
+
+async def reduce_notes(client, partials: list[str], merge_tokens: int = 12000) -> str:
+    """Unisce in ordine i riassunti delle sezioni in un unico documento."""
+    if len(partials) == 1:
+        return partials[0]
+
+    # Riduzione: se i parziali non stanno in una sola richiesta, si uniscono a livelli
+    while estimate_tokens("\n\n".join(partials)) > merge_tokens and len(partials) > 2:
+        groups = group_by_budget(partials, merge_tokens)
+        if len(groups) == len(partials):
+            break
+        partials = await asyncio.gather(*(client.merge_notes(g, final=False) for g in groups))
+        if any(not p for p in partials):
+            print("❌ Unione intermedia degli appunti non riuscita")
+            return ""
+    return await client.merge_notes(partials, final=True)
+
+
+class RollingNotes:
+    """
+    Appunti costruiti durante la sessione live: i segmenti vengono raggruppati in
+    sezioni con la stessa regola di split_sections e ogni sezione completa viene
+    riassunta subito in background. Alla fine della lezione resta da riassumere
+    solo l'ultima sezione e da fare l'unione finale.
+
+    Poiché le sezioni coincidono con quelle che split_sections ricaverebbe dalla
+    trascrizione salvata, i riassunti finiscono nella cache degli appunti e una
+    rigenerazione successiva li riutilizza.
+    """
+
+    def __init__(self, ai_client, section_tokens: int = 3000, merge_tokens: int = 12000):
+        self.ai_client = ai_client
+        self.section_tokens = section_tokens
+        self.merge_tokens = merge_tokens
+        self.lock = threading.Lock()
+        self.current = []
+        self.current_tokens = 0
+        self.futures = []
+
+    def add_segment(self, segment: dict):
+        block = format_segment(segment).strip()
+        tokens = estimate_tokens(block)
+        with self.lock:
+            if self.current and self.current_tokens + tokens > self.section_tokens:
+                self._submit_current()
+            self.current.append(block)
+            self.current_tokens += tokens
+
+    def _submit_current(self):
+        text = "\n\n".join(self.current)
+        self.futures.append(self.ai_client.submit(self.ai_client.async_client.summarize_section(text)))
+        self.current, self.current_tokens = [], 0
+
+    def finish(self, timeout: float = 300) -> str:
+        """Riassume l'ultima sezione, attende quelle in corso e restituisce gli appunti uniti."""
+        with self.lock:
+            if self.current:
+                self._submit_current()
+            futures = list(self.futures)
+        if not futures:
+            return ""
+        print(f"🧩 Appunti live: unione di {len(futures)} sezioni")
+        partials = [f.result(timeout) for f in futures]
+        if any(not p for p in partials):
+            print("❌ Riassunto di una o più sezioni non riuscito")
+            return ""
+        return self.ai_client.run(reduce_notes(self.ai_client.async_client, partials, self.merge_tokens))
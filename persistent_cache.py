@@ -0,0 +1,163 @@
+# persistent_cache.py
+
+# Cache chiave/valore a due livelli: un LRU in memoria davanti a una tabella SQLite
+# su disco, limitata nel numero di righe. Usata per non ripagare chiamate API
+# identiche (es. frasi ricorrenti da tradurre) tra un riavvio e l'altro.
+
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def make_key(*parts: str) -> str:
+    """Chiave stabile a partire da più componenti (testo, modello, versione del prompt...)."""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class PersistentCache:
+    """
+    LRU in memoria con persistenza su SQLite.
+    Le scritture su disco sono differite: `put` aggiorna la memoria e accoda la
+    riga, che un thread dedicato scrive a blocchi con un solo commit. Così chi
+    chiama (es. l'event loop del client API) non attende mai un fsync.
+    Su disco l'ordine LRU è approssimato: `last_used` viene aggiornato, sempre
+    in differita, solo quando una voce viene letta dal disco.
+    """
+
+    # Righe scritte al massimo per commit
+    WRITE_BATCH = 500
+
+    def __init__(self, db_path: str, table: str, memory_items: int = 2000, max_entries: int = 100_000):
+        self.table = table
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        # La connessione è condivisa tra chi legge e il thread di scrittura
+        self.db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table}(last_used)")
+        self.db.commit()
+        self.entries = self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name=f"cache-writer-{table}", daemon=True)
+        self.writer.start()
+
+    def peek(self, key: str):
+        """Solo la memoria: non tocca mai il disco, adatta a un event loop."""
+        with self.lock:
+            if key not in self.memory:
+                return None
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory[key]
+
+    def get(self, key: str):
+        value = self.peek(key)
+        if value is not None:
+            return value
+        with self.db_lock:
+            row = self.db.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, row[0])
+        # Nessun commit durante la lettura: l'aggiornamento di last_used va con la prossima scrittura
+        self.writes.put(("touch", key, None))
+        return row[0]
+
+    def put(self, key: str, value: str):
+        with self.lock:
+            self._remember(key, value)
+        self.writes.put(("put", key, value))
+
+    def flush(self, timeout: float | None = None):
+        """Attende che tutte le scritture accodate siano su disco."""
+        done = threading.Event()
+        self.writes.put(("flush", None, done))
+        done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch = [self.writes.get()]
+            while len(batch) < self.WRITE_BATCH:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"❌ Errore nella scrittura della cache {self.table}: {e}")
+            for kind, _, done in batch:
+                if kind == "flush":
+                    done.set()
+
+    def _write(self, batch: list):
+        now = time.time()
+        puts = [(key, value, now) for kind, key, value in batch if kind == "put"]
+        touches = [(now, key) for kind, key, _ in batch if kind == "touch"]
+        if not puts and not touches:
+            return
+        with self.db_lock:
+            if puts:
+                self.db.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, last_used) VALUES (?, ?, ?)", puts
+                )
+            if touches:
+                self.db.executemany(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", touches)
+            # Conteggio approssimato per eccesso (le sostituzioni contano come inserimenti)
+            self.entries += len(puts)
+            if self.entries > self.max_entries:
+                self._evict()
+            self.db.commit()
+
+    def _remember(self, key: str, value: str):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict(self):
+        # Elimina in blocco il 10% meno usato, così non si paga una DELETE a ogni inserimento
+        self.entries = self.db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if self.entries <= self.max_entries:
+            return
+        target = int(self.max_entries * 0.9)
+        self.db.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+            (self.entries - target,),
+        )
+        self.entries = self.db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_items": len(self.memory),
+                "disk_entries": self.entries,
+            }
@@ -0,0 +1,242 @@
+# pipeline.py
+
+# Pipeline a stadi per l'elaborazione dei chunk audio.
+# Ogni stadio ha una coda limitata e un numero configurabile di thread, così
+# trascrizione, traduzione e TTS di chunk diversi procedono in parallelo.
+# Il numero di sequenza assegnato in cattura permette di emettere i risultati
+# nello stesso ordine in cui l'audio è stato registrato.
+
+import threading
+import queue
+import time
+
+
+class Chunk:
+    """Un segmento audio che attraversa la pipeline insieme ai suoi risultati."""
+
+    def __init__(self, seq: int, audio, sample_rate: int, session_id: str | None):
+        self.seq = seq
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.session_id = session_id
+        self.captured_at = time.time()
+        # Istante di completamento di ogni fase, nell'ordine in cui avvengono
+        self.timings = {"capture_end": self.captured_at}
+        self.italian = ""
+        self.english = ""
+        self.audio_url = None
+        # Traduzioni e audio per lingua (l'inglese è sempre presente anche in `english`)
+        self.translations = {}
+        self.audio_urls = {}
+        self.skipped = False
+
+    def mark(self, stage: str):
+        self.timings[stage] = time.time()
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / self.sample_rate
+
+
+class OrderedEmitter:
+    """
+    Riordina i chunk completati e li consegna in ordine di sequenza.
+    I chunk scartati (trascrizione vuota, backpressure) fanno comunque avanzare la sequenza.
+    `on_emit` è chiamato fuori dal lock: un invio lento non blocca gli stadi che
+    completano altri chunk. Consegna un solo thread alla volta (quello che trova
+    `emitting` falso), gli altri accodano in `ready` e tornano subito.
+    """
+
+    def __init__(self, on_emit):
+        self.on_emit = on_emit
+        self.next_seq = 0
+        # Sequenze già consegnate (o scartate): è ciò che attende wait_until
+        self.emitted_seq = 0
+        self.pending = {}
+        self.ready = []
+        self.emitting = False
+        self.lock = threading.Lock()
+        self.progress = threading.Condition(self.lock)
+
+    def complete(self, chunk: Chunk):
+        with self.lock:
+            self.pending[chunk.seq] = chunk
+            while self.next_seq in self.pending:
+                self.ready.append(self.pending.pop(self.next_seq))
+                self.next_seq += 1
+            if self.emitting:
+                return
+            self.emitting = True
+        while True:
+            with self.lock:
+                if not self.ready:
+                    self.emitting = False
+                    return
+                batch, self.ready = self.ready, []
+            for ready in batch:
+                if ready.skipped:
+                    continue
+                try:
+                    self.on_emit(ready)
+                except Exception as e:
+                    print(f"❌ Errore nell'invio del chunk {ready.seq}: {e}")
+            with self.lock:
+                self.emitted_seq += len(batch)
+                self.progress.notify_all()
+
+    def wait_until(self, seq: int, timeout: float | None = None) -> bool:
+        """Attende che tutti i chunk con sequenza minore di `seq` siano stati emessi o scartati."""
+        with self.progress:
+            return self.progress.wait_for(lambda: self.emitted_seq >= seq, timeout)
+
+
+class Stage:
+    """Uno stadio della pipeline: una coda limitata servita da `workers` thread."""
+
+    def __init__(self, name: str, handler, workers: int = 1, maxsize: int = 4, policy: str = "block"):
+        if policy not in ("block", "drop_oldest"):
+            raise ValueError(f"Politica di backpressure non valida: {policy}")
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=max(1, maxsize))
+        self.threads = []
+        self.next_stage = None
+        self.on_done = None
+        self.on_drop = None
+        self.dropped_chunks = 0
+        self.dropped_seconds = 0.0
+        self.stats_lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def put(self, chunk: Chunk):
+        if self.policy == "block":
+            self.queue.put(chunk)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(chunk)
+                return
+            except queue.Full:
+                try:
+                    oldest = self.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                if oldest is None:
+                    # Non scartiamo mai il segnale di arresto: lo stadio si sta fermando e il chunk va perso
+                    self._requeue_stop()
+                    self.on_drop(chunk)
+                    return
+                with self.stats_lock:
+                    self.dropped_chunks += 1
+                    self.dropped_seconds += oldest.duration
+                print(f"⚠️ Coda '{self.name}' piena, scarto il chunk {oldest.seq} ({oldest.duration:.1f}s)")
+                self.on_drop(oldest)
+
+    def _requeue_stop(self):
+        """Rimette in coda il segnale di arresto senza bloccarsi, scartando chunk se serve."""
+        stops = 1
+        while stops:
+            try:
+                self.queue.put_nowait(None)
+                stops -= 1
+                continue
+            except queue.Full:
+                pass
+            try:
+                evicted = self.queue.get_nowait()
+            except queue.Empty:
+                continue
+            if evicted is None:
+                # Un altro segnale di arresto: va rimesso anche quello
+                stops += 1
+                continue
+            with self.stats_lock:
+                self.dropped_chunks += 1
+                self.dropped_seconds += evicted.duration
+            self.on_drop(evicted)
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(None)
+
+    def _loop(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            try:
+                keep = self.handler(chunk)
+            except Exception as e:
+                print(f"❌ Errore nello stadio '{self.name}' (chunk {chunk.seq}): {e}")
+                keep = False
+            if not keep:
+                chunk.skipped = True
+                self.on_done(chunk)
+            elif self.next_stage is not None:
+                self.next_stage.put(chunk)
+            else:
+                self.on_done(chunk)
+
+
+class Pipeline:
+    """
+    Collega una serie di stadi e consegna i risultati in ordine a `on_emit`.
+    `stages` è una lista di tuple (nome, handler, numero_di_thread); un handler
+    restituisce False per scartare il chunk.
+    """
+
+    def __init__(self, stages, on_emit, queue_size: int = 4, backpressure: str = "block"):
+        self.emitter = OrderedEmitter(on_emit)
+        self.stages = [
+            Stage(name, handler, workers, queue_size, backpressure)
+            for name, handler, workers in stages
+        ]
+        for current, following in zip(self.stages, self.stages[1:]):
+            current.next_stage = following
+        for stage in self.stages:
+            stage.on_done = self.emitter.complete
+            stage.on_drop = self._on_drop
+        # I chunk scartati arrivano all'emitter da un thread dedicato: chi scarta
+        # (anche la cattura audio) non attende mai il lock dell'emitter
+        self.drops = queue.SimpleQueue()
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        threading.Thread(target=self._drop_loop, name="pipeline-drops", daemon=True).start()
+
+    def submit(self, chunk: Chunk):
+        self.stages[0].put(chunk)
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+        self.drops.put(None)
+
+    def _on_drop(self, chunk: Chunk):
+        chunk.skipped = True
+        self.drops.put(chunk)
+
+    def _drop_loop(self):
+        while True:
+            chunk = self.drops.get()
+            if chunk is None:
+                break
+            self.emitter.complete(chunk)
+
+    def stats(self) -> dict:
+        return {
+            stage.name: {
+                "queued": stage.queue.qsize(),
+                "dropped_chunks": stage.dropped_chunks,
+                "dropped_seconds": round(stage.dropped_seconds, 2),
+            }
+            for stage in self.stages
+        }
@@ -1,8 +1,11 @@
 // script.js (versione corretta)
 
+// Aula da seguire (?classroom=... nell'indirizzo della pagina); senza, il server usa la prima
+const classroomParam = new URLSearchParams(window.location.search).get("classroom");
 const socket = io({
   reconnection: true, reconnectionAttempts: 5, reconnectionDelay: 1000,
-  reconnectionDelayMax: 5000, timeout: 20000
+  reconnectionDelayMax: 5000, timeout: 20000,
+  query: classroomParam ? { classroom: classroomParam } : {}
 });
 
 // Element references
@@ -22,9 +25,18 @@ const currentSessionEl = document.getElementById("currentSession");
 const sessionsModal = document.getElementById("sessionsModal");
 const sessionsList = document.getElementById("sessionsList");
 const closeModal = document.querySelector(".close");
+const languageSelect = document.getElementById("languageSelect");
+
+// Nomi delle lingue mostrati nel menu (le lingue disponibili le decide il server)
+const LANGUAGE_NAMES = { en: "English", es: "Español", zh: "中文", ar: "العربية", it: "Italiano", fr: "Français", de: "Deutsch" };
+let language = localStorage.getItem("language") || "en";
 
 // State variables
 let queue = [], playing = false, audioUrls = [], playbackPaused = true, selectedSessionId = null;
+// Ultimo segmento ricevuto della sessione live, per riprendere dopo una disconnessione
+let liveSessionId = null, lastSeq = null, classroomName = "";
+// Righe ancora in arrivo con i sottotitoli in streaming, per numero di chunk
+const pendingLines = new Map();
 
 function selectSession(sessionData) {
   if (sessionData) {
@@ -65,13 +77,30 @@ function updatePlaybackControls() {
   playPauseBtn.className = playbackPaused ? "btn-primary" : "btn-secondary";
 }
 
-function addLogEntry(it, en) {
+function addLogEntry(it, translated, lang = "en") {
   const timestamp = new Date().toLocaleTimeString();
   const entry = document.createElement("div");
   entry.className = "entry";
-  entry.innerHTML = `<div class="it">IT: ${escapeHtml(it)}</div><div class="en">EN: ${escapeHtml(en)}</div><div class="timestamp">${timestamp}</div>`;
+  entry.innerHTML = `<div class="it">IT: ${escapeHtml(it)}</div><div class="en" dir="auto">${escapeHtml(lang.toUpperCase())}: ${escapeHtml(translated)}</div><div class="timestamp">${timestamp}</div>`;
   log.prepend(entry);
   if (log.children.length > 50) log.removeChild(log.lastChild);
+  return entry;
+}
+
+function setEntryText(entry, it, translated, lang) {
+  entry.querySelector(".it").textContent = `IT: ${it}`;
+  entry.querySelector(".en").textContent = `${lang.toUpperCase()}: ${translated}`;
+}
+
+// Chiude la riga provvisoria di un chunk; quelle dei chunk precedenti non arriveranno più (scartati)
+function takePendingLine(chunk) {
+  const entry = pendingLines.get(chunk);
+  pendingLines.forEach((e, c) => {
+    if (c < chunk) { e.remove(); pendingLines.delete(c); }
+  });
+  pendingLines.delete(chunk);
+  if (entry) entry.classList.remove("pending");
+  return entry;
 }
 
 function escapeHtml(str) {
@@ -79,18 +108,19 @@ function escapeHtml(str) {
   return String(str).replace(/[&<>"']/g, s => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'})[s]);
 }
 
-async function fetchAndQueueAudio(url) {
-  try {
-    const r = await fetch(url);
-    if (!r.ok) { console.warn("Audio fetch failed", r.status); return; }
-    const blob = await r.blob();
-    const objUrl = URL.createObjectURL(blob);
-    queue.push(objUrl);
-    audioUrls.push(objUrl);
-    if (audioUrls.length > 10) URL.revokeObjectURL(audioUrls.shift());
-    updatePlaybackControls();
-    if (!playbackPaused && !playing) playNext();
-  } catch (e) { console.error("Error fetching audio:", e); }
+// Il player legge direttamente l'URL: se l'audio è ancora in sintesi il server lo invia
+// in streaming e la riproduzione parte con i primi byte, senza attendere il file completo
+function queueAudioUrl(url) {
+  queue.push(url);
+  updatePlaybackControls();
+  if (!playbackPaused && !playing) playNext();
+}
+
+function queueAudioBlob(blob) {
+  const objUrl = URL.createObjectURL(blob);
+  audioUrls.push(objUrl);
+  if (audioUrls.length > 10) URL.revokeObjectURL(audioUrls.shift());
+  queueAudioUrl(objUrl);
 }
 
 function playNext() {
@@ -120,16 +150,64 @@ function playNext() {
 socket.on("connect", () => { updateStatus(true); sessionInfo.textContent = "Connected. Waiting for translation..."; });
 socket.on("disconnect", () => { updateStatus(false); sessionInfo.textContent = "Disconnected. Please check server connection."; });
 socket.on("new_translation", (data) => {
-  addLogEntry(data.italian || "", data.english || "");
+  if (data.seq !== undefined) {
+    if (lastSeq !== null && data.seq <= lastSeq) return; // già ricevuto con il catch_up
+    if (lastSeq !== null && data.seq > lastSeq + 1) {
+      // Buco nella sequenza: chiediamo i segmenti mancanti
+      socket.emit("resume", { session_id: liveSessionId, last_seq: lastSeq, language });
+      const stale = takePendingLine(data.chunk);
+      if (stale) stale.remove();
+      return;
+    }
+    lastSeq = data.seq;
+  }
+  const translated = data.translation || data.english || "", lang = data.language || "en";
+  const entry = data.chunk !== undefined ? takePendingLine(data.chunk) : null;
+  if (entry) setEntryText(entry, data.italian || "", translated, lang);
+  else addLogEntry(data.italian || "", translated, lang);
   sessionInfo.textContent = "New translation received.";
-  if (data.audio_url) fetchAndQueueAudio(window.location.origin + data.audio_url);
+  // Con AUDIO_INLINE l'mp3 arriva già nel messaggio, senza una seconda richiesta
+  if (data.audio) queueAudioBlob(new Blob([data.audio], { type: "audio/mpeg" }));
+  else if (data.audio_url) queueAudioUrl(window.location.origin + data.audio_url);
+});
+
+// Sottotitoli in streaming: l'italiano appena trascritto, poi la traduzione che si completa
+// sulla stessa riga finché new_translation non la chiude
+socket.on("partial_transcript", (data) => {
+  if (pendingLines.has(data.chunk)) return;
+  const entry = addLogEntry(data.italian || "", "…", language);
+  entry.classList.add("pending");
+  pendingLines.set(data.chunk, entry);
+});
+
+socket.on("partial_translation", (data) => {
+  const entry = pendingLines.get(data.chunk);
+  if (entry && data.language === language) entry.querySelector(".en").textContent = `${data.language.toUpperCase()}: ${data.text}…`;
 });
 
+// Segmenti persi mentre il client era disconnesso, in un solo messaggio
+socket.on("catch_up", (data) => {
+  if (data.session_id !== liveSessionId) return;
+  const missed = data.segments.filter(s => lastSeq === null || s.seq > lastSeq);
+  // Solo il testo: l'audio di segmenti ormai passati non verrebbe più ascoltato
+  missed.forEach(s => s.translation
+    ? addLogEntry(s.italian || "", s.translation, s.language)
+    : addLogEntry(s.italian || "", s.english || "", "en"));
+  if (missed.length > 0) {
+    lastSeq = missed[missed.length - 1].seq;
+    sessionInfo.textContent = `Caught up on ${missed.length} missed translation(s).`;
+  }
+});
+
+socket.on("classroom", (data) => { classroomName = data.name; });
+
 socket.on("session_status", (data) => {
   if (data.active) {
-    // Sessione Live
+    // Sessione Live: entriamo nella sua stanza e recuperiamo ciò che ci siamo persi
+    if (data.session_id !== liveSessionId) { liveSessionId = data.session_id; lastSeq = null; }
+    socket.emit("resume", { session_id: liveSessionId, last_seq: lastSeq, language });
     selectSession(null); // Disabilita i pulsanti di azione per le sessioni passate
-    currentSessionEl.textContent = `Live: ${data.session_id.substring(0, 20)}...`;
+    currentSessionEl.textContent = `Live${classroomName ? ` (${classroomName})` : ""}: ${data.session_id.substring(0, 20)}...`;
     currentSessionEl.style.color = "green";
     sessionInfo.textContent = "Session active - Receiving translations...";
   } else {
@@ -142,6 +220,21 @@ socket.on("session_status", (data) => {
   }
 });
 
+// Lavori in background conclusi (appunti generati a fine lezione o su richiesta)
+socket.on("job_done", (job) => {
+  if (job.kind !== "notes" || job.session_id !== selectedSessionId) return;
+  processBtn.textContent = "Generate Notes";
+  if (job.status === "done") {
+    processBtn.disabled = true;
+    downloadNotesBtn.disabled = false;
+    downloadNotesEnBtn.disabled = false;
+    sessionInfo.textContent = "Notes are ready.";
+  } else {
+    processBtn.disabled = false;
+    sessionInfo.textContent = "Error generating notes.";
+  }
+});
+
 
 // --- GESTIONE DEI PULSANTI ---
 playPauseBtn.addEventListener("click", () => {
@@ -168,22 +261,22 @@ processBtn.addEventListener("click", async () => {
   processBtn.disabled = true;
   processBtn.textContent = "Generating...";
   try {
+    // Il server accoda il lavoro: il risultato arriva con l'evento "job_done"
     const response = await fetch(`/process_session/${selectedSessionId}`);
     const result = await response.json();
-    if (result.success) {
-      alert("Notes generated successfully!");
-      downloadNotesBtn.disabled = false;
-      downloadNotesEnBtn.disabled = false;
+    if (response.ok) {
+      sessionInfo.textContent = "Generating notes in the background...";
     } else {
       alert("Error generating notes: " + result.error);
       processBtn.disabled = false;
+      processBtn.textContent = "Generate Notes";
     }
   } catch (error) {
     console.error("Error:", error);
     alert("Error during note generation.");
     processBtn.disabled = false;
+    processBtn.textContent = "Generate Notes";
   }
-  processBtn.textContent = "Generate Notes";
 });
 
 // Le funzioni di download ora usano sempre e solo l'ID della sessione selezionata
@@ -215,6 +308,25 @@ closeModal.addEventListener("click", () => { sessionsModal.style.display = "none
 window.addEventListener("click", (event) => { if (event.target === sessionsModal) { sessionsModal.style.display = "none"; } });
 window.addEventListener("beforeunload", () => { audioUrls.forEach(url => URL.revokeObjectURL(url)); });
 
+// Lingua dei sottotitoli e dell'audio: il server traduce solo nelle lingue scelte da qualcuno
+async function loadLanguages() {
+  try {
+    const data = await (await fetch("/languages")).json();
+    if (!data.languages.includes(language)) language = data.default;
+    languageSelect.innerHTML = data.languages
+      .map(code => `<option value="${code}">${escapeHtml(LANGUAGE_NAMES[code] || code)}</option>`).join("");
+    languageSelect.value = language;
+  } catch (e) { console.error("Error loading languages:", e); }
+}
+
+languageSelect.addEventListener("change", () => {
+  language = languageSelect.value;
+  localStorage.setItem("language", language);
+  // Cambiamo stanza; i segmenti già mostrati restano nella lingua precedente
+  if (liveSessionId) socket.emit("resume", { session_id: liveSessionId, last_seq: lastSeq, language });
+});
+
 // Stato iniziale
+loadLanguages();
 selectSession(null);
 updatePlaybackControls();
\ No newline at end of file
@@ -0,0 +1,157 @@
+# search_index.py
+
+# Indice full-text (SQLite FTS5) sul testo italiano e inglese di tutti i segmenti
+# e di tutti gli appunti. Viene aggiornato in modo incrementale mentre la pipeline
+# produce i segmenti e quando vengono generati gli appunti, così la ricerca
+# sull'intero archivio non richiede di leggere i file delle trascrizioni.
+
+import html
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import config
+import segment_log
+
+# Formato delle righe di trascrizione_*.txt (vedi utils.format_transcript)
+_TRANSCRIPT_LINE = re.compile(r"^\[(?P<ts>[^\]]*)\] IT: (?P<it>.*)\nEN: (?P<en>.*)$", re.MULTILINE)
+
+# Delimitatori dei termini trovati usati da snippet(): caratteri di controllo che non
+# compaiono nel testo, sostituiti con <mark> solo dopo l'escape HTML dell'estratto
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def highlight(snippet: str) -> str:
+    """Estratto di snippet() come HTML sicuro: testo con escape, termini trovati in <mark>."""
+    escaped = html.escape(snippet)
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def to_match_query(text: str) -> str:
+    """
+    Converte il testo digitato dall'utente in una query FTS5: ogni parola diventa
+    un termine tra virgolette (niente operatori accidentali), tutte richieste.
+    """
+    terms = [t.replace('"', '""') for t in text.split()]
+    return " ".join(f'"{t}"' for t in terms)
+
+
+class SearchIndex:
+    def __init__(self, db_path: str):
+        self.lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # Con il WAL, synchronous=NORMAL rende economico un commit per segmento
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(
+                session_id UNINDEXED, kind UNINDEXED, ref UNINDEXED, italian, english,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS notes_rows (session_id TEXT PRIMARY KEY, doc_rowid INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self.db.commit()
+
+    def add_segment(self, session_id: str, timestamp: str, italian: str, english: str):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO documents (session_id, kind, ref, italian, english) VALUES (?, 'segment', ?, ?, ?)",
+                (session_id, timestamp, italian or "", english or ""),
+            )
+            self.db.commit()
+
+    def set_notes(self, session_id: str, italian: str, english: str):
+        """Indicizza gli appunti di una sessione, sostituendo quelli eventualmente già presenti."""
+        with self.lock:
+            self._replace_notes(session_id, italian, english)
+            self.db.commit()
+
+    def _replace_notes(self, session_id: str, italian: str, english: str):
+        # La tabella di appoggio evita una scansione dell'indice per trovare la riga da sostituire
+        row = self.db.execute("SELECT doc_rowid FROM notes_rows WHERE session_id = ?", (session_id,)).fetchone()
+        if row:
+            self.db.execute("DELETE FROM documents WHERE rowid = ?", (row[0],))
+        cursor = self.db.execute(
+            "INSERT INTO documents (session_id, kind, ref, italian, english) VALUES (?, 'notes', '', ?, ?)",
+            (session_id, italian or "", english or ""),
+        )
+        self.db.execute("INSERT OR REPLACE INTO notes_rows (session_id, doc_rowid) VALUES (?, ?)",
+                        (session_id, cursor.lastrowid))
+
+    def search(self, text: str, page: int = 1, per_page: int = 10, session_id: str | None = None) -> tuple[list, bool]:
+        """
+        Risultati ordinati per rilevanza (bm25) con un estratto evidenziato.
+        Restituisce (risultati, altre_pagine).
+        """
+        query = to_match_query(text)
+        if not query:
+            return [], False
+        sql = (
+            "SELECT session_id, kind, ref, snippet(documents, -1, char(2), char(3), '…', 12) AS snippet, "
+            "bm25(documents) AS score FROM documents WHERE documents MATCH ?"
+        )
+        params = [query]
+        if session_id:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY score LIMIT ? OFFSET ?"
+        params.extend([per_page + 1, (page - 1) * per_page])
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        results = [dict(r) for r in rows[:per_page]]
+        for result in results:
+            result["snippet"] = highlight(result["snippet"])
+        return results, len(rows) > per_page
+
+    def import_existing_files(self, force: bool = False) -> int:
+        """
+        Indicizza una volta sola le trascrizioni e gli appunti già salvati.
+        I segmenti vengono letti dal log della sessione quando esiste, altrimenti dal file di testo.
+        """
+        with self.lock:
+            done = self.db.execute("SELECT value FROM index_meta WHERE key = 'imported'").fetchone()
+        if done and not force:
+            return 0
+
+        imported = 0
+        with self.lock:
+            if force:
+                self.db.execute("DELETE FROM documents")
+                self.db.execute("DELETE FROM notes_rows")
+            for path in Path(config.TRANSCRIPTS_DIR).glob("trascrizione_*.txt"):
+                session_id = path.stem.replace("trascrizione_", "")
+                segments = [(s.get("timestamp", ""), s.get("italian", ""), s.get("english", ""))
+                            for s in segment_log.read_segments(session_id)]
+                if not segments:
+                    text = path.read_text(encoding="utf-8")
+                    segments = [(m["ts"], m["it"], m["en"]) for m in _TRANSCRIPT_LINE.finditer(text)]
+                self.db.executemany(
+                    "INSERT INTO documents (session_id, kind, ref, italian, english) VALUES (?, 'segment', ?, ?, ?)",
+                    [(session_id, ts, it, en) for ts, it, en in segments],
+                )
+                imported += 1
+
+            for path in Path(config.NOTES_DIR).glob("appunti_*.txt"):
+                session_id = path.stem.replace("appunti_", "")
+                english_path = Path(config.NOTES_DIR) / f"notes_{session_id}.txt"
+                english = english_path.read_text(encoding="utf-8") if english_path.exists() else ""
+                self._replace_notes(session_id, path.read_text(encoding="utf-8"), english)
+
+            self.db.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('imported', ?)",
+                            (datetime.now().isoformat(),))
+            self.db.commit()
+        print(f"🔎 Indice di ricerca: indicizzate {imported} trascrizioni esistenti")
+        return imported
+
+
+if __name__ == "__main__":
+    # Ricostruzione manuale dell'indice: python search_index.py
+    index = SearchIndex(getattr(config, "SEARCH_DB", "data/search.sqlite3"))
+    index.import_existing_files(force=True)
@@ -0,0 +1,133 @@
+# segment_log.py
+
+# Log append-only (JSONL) dei segmenti di una sessione live.
+# Ogni segmento viene scritto su disco appena prodotto, così un crash o una
+# chiusura forzata non fanno perdere la lezione; l'fsync è raggruppato (ogni N
+# segmenti o ogni T secondi) per non rallentare la pipeline.
+#
+# Formato: una riga JSON per record, {"type": "start" | "segment" | "end", ...}.
+# Una sessione senza record "end" non è stata chiusa correttamente e viene
+# recuperata all'avvio successivo.
+
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import config
+
+
+def log_path(session_id: str) -> Path:
+    return Path(getattr(config, "SESSIONS_DIR", "sessions")) / f"{session_id}.jsonl"
+
+
+class SegmentLog:
+    def __init__(self, session_id: str, fsync_every: int = 10, fsync_interval: float = 1.0):
+        self.session_id = session_id
+        self.path = log_path(session_id)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.unsynced = 0
+        self.closed = False
+        self.flusher_stop = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, name=f"segment-log-{session_id}", daemon=True)
+        self.flusher.start()
+
+    def start(self, metadata: dict):
+        self._write({"type": "start", "session_id": self.session_id, **metadata}, sync=True)
+
+    def append(self, segment: dict):
+        self._write({"type": "segment", **segment})
+
+    def close(self):
+        self._write({"type": "end", "end_time": datetime.now().isoformat()}, sync=True)
+        with self.lock:
+            self.closed = True
+            self.file.close()
+        self.flusher_stop.set()
+
+    def _write(self, record: dict, sync: bool = False):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.closed:
+                # Segmenti arrivati dopo la chiusura (es. pipeline bloccata oltre STOP_LATE_TIMEOUT_S):
+                # li accodiamo seguiti da un nuovo record "end", così il log resta chiuso
+                end = json.dumps({"type": "end", "end_time": datetime.now().isoformat(), "late": True})
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + end + "\n")
+                return
+            # flush() porta i dati al sistema operativo: sopravvivono a un crash del processo
+            self.file.write(line)
+            self.file.flush()
+            self.unsynced += 1
+            if sync or self.unsynced >= self.fsync_every:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def _flush_loop(self):
+        # fsync periodico: protegge anche dagli spegnimenti improvvisi della macchina
+        while not self.flusher_stop.wait(self.fsync_interval):
+            with self.lock:
+                if not self.closed and self.unsynced:
+                    self._sync()
+
+
+def read_records(session_id: str) -> list:
+    path = log_path(session_id)
+    if not path.exists():
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Ultima riga troncata da un crash durante la scrittura
+                continue
+    return records
+
+
+def read_segments(session_id: str) -> list:
+    return [r for r in read_records(session_id) if r.get("type") == "segment"]
+
+
+def read_metadata(session_id: str) -> dict:
+    for record in read_records(session_id):
+        if record.get("type") == "start":
+            return record
+    return {}
+
+
+def find_unfinished_sessions() -> list:
+    """ID delle sessioni il cui log non contiene il record di chiusura."""
+    sessions_dir = Path(getattr(config, "SESSIONS_DIR", "sessions"))
+    if not sessions_dir.exists():
+        return []
+    return [path.stem for path in sessions_dir.glob("*.jsonl") if not _ends_with_end_record(path)]
+
+
+def _ends_with_end_record(path: Path) -> bool:
+    # Di solito basta la coda del file: il record "end" è l'ultimo scritto dalla sessione
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 4096))
+        tail = f.read().decode("utf-8", errors="ignore")
+    if '"type": "end"' in tail:
+        return True
+    # Log di versioni precedenti con segmenti accodati dopo la chiusura: si cerca in tutto il file
+    return size > 4096 and any(r.get("type") == "end" for r in read_records(path.stem))
+
+
+def mark_recovered(session_id: str):
+    with open(log_path(session_id), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "end", "end_time": datetime.now().isoformat(), "recovered": True}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,202 @@
+# segmenter.py
+
+# Segmentazione dell'audio catturato in chunk da inviare alla trascrizione.
+# FixedSegmenter riproduce il vecchio comportamento (chunk di durata fissa),
+# VadSegmenter usa l'energia dei frame (ed eventualmente webrtcvad) per saltare
+# il silenzio e chiudere i segmenti sulle pause naturali del parlato.
+
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+
+class FixedSegmenter:
+    """Taglia l'audio in chunk consecutivi di `chunk_duration` secondi."""
+
+    def __init__(self, sample_rate: int, chunk_duration: float = 4):
+        self.samples_per_chunk = int(sample_rate * chunk_duration)
+        self.parts = []
+        self.buffered = 0
+
+    def feed(self, samples: np.ndarray) -> list:
+        self.parts.append(samples.copy())
+        self.buffered += len(samples)
+        segments = []
+        if self.buffered < self.samples_per_chunk:
+            return segments
+        data = np.concatenate(self.parts)
+        n_full = len(data) // self.samples_per_chunk
+        for i in range(n_full):
+            segments.append(data[i * self.samples_per_chunk:(i + 1) * self.samples_per_chunk])
+        rest = data[n_full * self.samples_per_chunk:]
+        self.parts = [rest] if len(rest) else []
+        self.buffered = len(rest)
+        return segments
+
+    def flush(self):
+        # Un chunk parziale a fine sessione viene scartato, come in passato
+        self.parts = []
+        self.buffered = 0
+        return None
+
+
+class VadSegmenter:
+    """
+    Segmentazione guidata dall'attività vocale.
+    L'energia viene calcolata in modo vettoriale su tutti i frame ricevuti; un
+    segmento si apre al primo frame di parlato e si chiude dopo `silence_ms` di
+    pausa (se è lungo almeno `min_duration`) oppure al raggiungimento di `max_duration`.
+    """
+
+    def __init__(self, sample_rate: int, frame_ms: int = 30, threshold_db: float = -45.0,
+                 noise_margin_db: float = 10.0, silence_ms: int = 600, max_silence_ms: int = 2000,
+                 min_duration: float = 1.5, max_duration: float = 10.0, min_speech_ms: int = 250,
+                 padding_ms: int = 200, backend: str = "energy", aggressiveness: int = 2,
+                 noise_window_s: float = 10.0, noise_percentile: float = 15.0):
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.noise_floor_db = threshold_db - noise_margin_db
+        # Rumore di fondo = percentile basso dell'energia di tutti i frame recenti:
+        # non dipende dalla classificazione, quindi non resta agganciato a una stima sbagliata
+        self.noise_percentile = noise_percentile
+        self.energy_window = np.zeros(max(1, int(noise_window_s * 1000 / frame_ms)))
+        self.energy_count = 0
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.max_silence_frames = max(self.silence_frames, max_silence_ms // frame_ms)
+        self.min_frames = int(min_duration * 1000 / frame_ms)
+        self.max_frames = int(max_duration * 1000 / frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.padding_frames = padding_ms // frame_ms
+
+        self.vad = None
+        if backend == "webrtc":
+            if webrtcvad is None:
+                print("⚠️ webrtcvad non installato, uso la sola soglia di energia")
+            elif frame_ms not in (10, 20, 30):
+                print("⚠️ webrtcvad richiede frame da 10, 20 o 30 ms, uso la sola soglia di energia")
+            else:
+                self.vad = webrtcvad.Vad(aggressiveness)
+
+        self.remainder = np.zeros(0, dtype=np.float32)
+        self.preroll = []
+        self.frames = []
+        self.speech_frames = 0
+        self.silence_run = 0
+        self.skipped_seconds = 0.0
+
+    def _classify(self, frames: np.ndarray) -> np.ndarray:
+        energy = np.sqrt(np.mean(frames * frames, axis=1)) + 1e-10
+        energy_db = 20 * np.log10(energy)
+        self._update_noise_floor(energy_db)
+        threshold = max(self.threshold_db, self.noise_floor_db + self.noise_margin_db)
+        speech = energy_db > threshold
+
+        if self.vad is not None and speech.any():
+            pcm = (np.clip(frames, -1, 1) * 32767).astype(np.int16)
+            for i in np.flatnonzero(speech):
+                speech[i] = self.vad.is_speech(pcm[i].tobytes(), self.sample_rate)
+        return speech
+
+    def _update_noise_floor(self, energy_db: np.ndarray):
+        size = len(self.energy_window)
+        values = energy_db[-size:]
+        # Finestra circolare: i nuovi valori sovrascrivono i più vecchi
+        positions = (self.energy_count + np.arange(len(values))) % size
+        self.energy_window[positions] = values
+        self.energy_count += len(values)
+        filled = self.energy_window[:min(self.energy_count, size)]
+        self.noise_floor_db = float(np.percentile(filled, self.noise_percentile))
+
+    def feed(self, samples: np.ndarray) -> list:
+        data = np.concatenate([self.remainder, samples]) if len(self.remainder) else samples
+        n_frames = len(data) // self.frame_len
+        self.remainder = data[n_frames * self.frame_len:].copy()
+        if n_frames == 0:
+            return []
+
+        frames = data[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        speech = self._classify(frames)
+        if self.frames or speech.any():
+            # I frame conservati in un segmento non possono restare viste sul buffer circolare
+            frames = frames.copy()
+
+        segments = []
+        for frame, is_speech in zip(frames, speech):
+            if not self.frames:
+                if not is_speech:
+                    self.preroll.append(frame)
+                    if len(self.preroll) > self.padding_frames:
+                        self.preroll.pop(0)
+                        self.skipped_seconds += self.frame_len / self.sample_rate
+                    continue
+                self.frames = [f.copy() for f in self.preroll]
+                self.preroll = []
+
+            self.frames.append(frame)
+            if is_speech:
+                self.speech_frames += 1
+                self.silence_run = 0
+            else:
+                self.silence_run += 1
+
+            pause = self.silence_run >= self.silence_frames and len(self.frames) >= self.min_frames
+            if pause or self.silence_run >= self.max_silence_frames or len(self.frames) >= self.max_frames:
+                segment = self._close()
+                if segment is not None:
+                    segments.append(segment)
+        return segments
+
+    def _close(self):
+        frames = self.frames
+        # Tieni solo `padding_frames` di silenzio finale
+        trailing = max(0, self.silence_run - self.padding_frames)
+        if trailing:
+            frames = frames[:-trailing]
+            self.skipped_seconds += trailing * self.frame_len / self.sample_rate
+        enough_speech = self.speech_frames >= self.min_speech_frames
+
+        self.frames = []
+        self.speech_frames = 0
+        self.silence_run = 0
+
+        if not enough_speech:
+            # Solo rumore impulsivo: non vale una chiamata API
+            self.skipped_seconds += len(frames) * self.frame_len / self.sample_rate
+            return None
+        return np.concatenate(frames)
+
+    def flush(self):
+        """Chiude l'eventuale segmento aperto (es. a fine sessione)."""
+        self.remainder = np.zeros(0, dtype=np.float32)
+        self.preroll = []
+        if not self.frames:
+            return None
+        return self._close()
+
+
+def create_segmenter(sample_rate: int, chunk_duration: float, config):
+    """Crea il segmentatore scelto in config.SEGMENTATION ("vad" oppure "fixed")."""
+    mode = getattr(config, "SEGMENTATION", "vad")
+    if mode == "fixed":
+        return FixedSegmenter(sample_rate, chunk_duration)
+    if mode != "vad":
+        raise ValueError(f"Modalità di segmentazione non valida: {mode}")
+    return VadSegmenter(
+        sample_rate,
+        frame_ms=getattr(config, "VAD_FRAME_MS", 30),
+        threshold_db=getattr(config, "VAD_THRESHOLD_DB", -45.0),
+        silence_ms=getattr(config, "VAD_SILENCE_MS", 600),
+        min_duration=getattr(config, "VAD_MIN_SEGMENT_S", 1.5),
+        max_duration=getattr(config, "VAD_MAX_SEGMENT_S", 10.0),
+        min_speech_ms=getattr(config, "VAD_MIN_SPEECH_MS", 250),
+        padding_ms=getattr(config, "VAD_PADDING_MS", 200),
+        backend=getattr(config, "VAD_BACKEND", "energy"),
+        aggressiveness=getattr(config, "VAD_AGGRESSIVENESS", 2),
+        noise_window_s=getattr(config, "VAD_NOISE_WINDOW_S", 10.0),
+        noise_percentile=getattr(config, "VAD_NOISE_PERCENTILE", 15.0),
+    )
@@ -0,0 +1,208 @@
+# session_catalog.py
+
+# Catalogo delle sessioni su SQLite: una riga per lezione con docente, materia,
+# orari e disponibilità di trascrizione/appunti. Viene aggiornato all'avvio e
+# alla chiusura delle sessioni e quando si generano gli appunti, così l'elenco
+# delle sessioni non deve più scorrere le cartelle né interpretare i nomi dei file.
+
+import base64
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import config
+import segment_log
+
+
+class SessionCatalog:
+    def __init__(self, db_path: str):
+        self.lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                docente TEXT NOT NULL,
+                materia TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                ended_at TEXT,
+                has_transcript INTEGER NOT NULL DEFAULT 0,
+                has_notes INTEGER NOT NULL DEFAULT 0
+            );
+            -- Indici precedenti, senza l'id che serve alla paginazione per chiave
+            DROP INDEX IF EXISTS sessions_started_at;
+            DROP INDEX IF EXISTS sessions_docente;
+            DROP INDEX IF EXISTS sessions_materia;
+            DROP INDEX IF EXISTS sessions_with_transcript;
+            CREATE INDEX IF NOT EXISTS sessions_by_date ON sessions(started_at, id);
+            CREATE INDEX IF NOT EXISTS sessions_by_docente ON sessions(docente, started_at, id);
+            CREATE INDEX IF NOT EXISTS sessions_by_materia ON sessions(materia, started_at, id);
+            CREATE INDEX IF NOT EXISTS sessions_by_date_with_transcript ON sessions(started_at, id) WHERE has_transcript = 1;
+            CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self.db.commit()
+
+    def session_started(self, session_id: str, docente: str, materia: str, started_at: str):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sessions (id, docente, materia, started_at) VALUES (?, ?, ?, ?)",
+                (session_id, docente, materia, started_at),
+            )
+            self.db.commit()
+
+    def session_ended(self, session_id: str, has_transcript: bool, ended_at: str | None = None):
+        with self.lock:
+            self.db.execute(
+                "UPDATE sessions SET ended_at = ?, has_transcript = ? WHERE id = ?",
+                (ended_at or datetime.now().isoformat(), int(has_transcript), session_id),
+            )
+            self.db.commit()
+
+    def notes_generated(self, session_id: str):
+        with self.lock:
+            self.db.execute("UPDATE sessions SET has_notes = 1 WHERE id = ?", (session_id,))
+            self.db.commit()
+
+    def get(self, session_id: str) -> dict | None:
+        with self.lock:
+            row = self.db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_sessions(self, per_page: int = 6, cursor: str | None = None, docente: str | None = None,
+                      materia: str | None = None, date: str | None = None,
+                      has_transcript: bool | None = None) -> tuple[list, str | None]:
+        """
+        Sessioni dalla più recente, filtrate per docente, materia, giorno (YYYY-MM-DD)
+        e/o presenza della trascrizione salvata.
+        Paginazione per chiave su (started_at, id): `cursor` è il valore restituito
+        per la pagina precedente. Ogni filtro ha il suo indice ordinato per data e id,
+        quindi anche le pagine più lontane costano quanto la prima.
+        Restituisce (righe, cursore della pagina successiva o None).
+        Solleva ValueError se `date` o `cursor` non sono validi.
+        """
+        if date:
+            # Normalizzato (es. 2026-3-2 -> 2026-03-02), altrimenti l'intervallo di stringhe non funziona
+            try:
+                date = datetime.strptime(date, "%Y-%m-%d").date().isoformat()
+            except ValueError:
+                raise ValueError(f"Data non valida, atteso YYYY-MM-DD: {date}") from None
+        conditions, params = [], []
+        if docente:
+            conditions.append("docente = ?")
+            params.append(docente)
+        if materia:
+            conditions.append("materia = ?")
+            params.append(materia)
+        if date:
+            conditions.append("started_at >= ? AND started_at < ?")
+            # Date ISO "YYYY-MM-DDTHH:MM:SS": l'intervallo [giorno+"T", giorno+"U") usa l'indice
+            params.extend([date + "T", date + "U"])
+        if has_transcript is not None:
+            # Valore letterale, non parametro: così SQLite può usare l'indice parziale
+            conditions.append("has_transcript = 1" if has_transcript else "has_transcript = 0")
+        if cursor:
+            conditions.append("(started_at, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Una riga in più ci dice se esiste la pagina successiva senza un COUNT(*) sull'intera tabella
+        params.append(per_page + 1)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT * FROM sessions {where} ORDER BY started_at DESC, id DESC LIMIT ?", params
+            ).fetchall()
+        rows = [dict(r) for r in rows]
+        if len(rows) <= per_page:
+            return rows, None
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1])
+
+    def import_existing_files(self, force: bool = False) -> int:
+        """
+        Importa una volta sola le sessioni già presenti in transcripts/ e notes/.
+        I metadati vengono presi dal log dei segmenti quando esiste, altrimenti dal nome del file.
+        """
+        with self.lock:
+            done = self.db.execute("SELECT value FROM catalog_meta WHERE key = 'imported'").fetchone()
+        if done and not force:
+            return 0
+
+        notes_ids = {f.stem.replace("appunti_", "") for f in Path(config.NOTES_DIR).glob("appunti_*.txt")}
+        imported = 0
+        for f in Path(config.TRANSCRIPTS_DIR).glob("trascrizione_*.txt"):
+            session_id = f.stem.replace("trascrizione_", "")
+            entry = _metadata_for(session_id)
+            if entry is None:
+                print(f"⚠️ Sessione ignorata nell'importazione, ID non riconosciuto: {session_id}")
+                continue
+            docente, materia, started_at = entry
+            with self.lock:
+                self.db.execute(
+                    "INSERT OR IGNORE INTO sessions (id, docente, materia, started_at, ended_at, has_transcript, has_notes) "
+                    "VALUES (?, ?, ?, ?, ?, 1, ?)",
+                    (session_id, docente, materia, started_at, started_at, int(session_id in notes_ids)),
+                )
+            imported += 1
+
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('imported', ?)",
+                            (datetime.now().isoformat(),))
+            self.db.commit()
+        print(f"📚 Catalogo delle sessioni: importate {imported} sessioni esistenti")
+        return imported
+
+
+def encode_cursor(row: dict) -> str:
+    """Cursore opaco che riprende l'elenco dopo `row`."""
+    return base64.urlsafe_b64encode(json.dumps([row["started_at"], row["id"]]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        started_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError(f"Cursore non valido: {cursor}") from None
+    if not isinstance(started_at, str) or not isinstance(session_id, str):
+        raise ValueError(f"Cursore non valido: {cursor}")
+    return started_at, session_id
+
+
+def _metadata_for(session_id: str):
+    metadata = segment_log.read_metadata(session_id)
+    if metadata.get("start_time"):
+        return metadata.get("docente", ""), metadata.get("materia", ""), metadata["start_time"]
+
+    # Formato storico docente_materia_YYYYMMDD_HHMM: la materia può contenere underscore
+    parts = session_id.split("_")
+    if len(parts) < 4:
+        return None
+    try:
+        started_at = datetime.strptime(parts[-2] + parts[-1], "%Y%m%d%H%M").isoformat()
+    except ValueError:
+        return None
+    return parts[0], " ".join(parts[1:-2]), started_at
+
+
+def format_session(row: dict) -> dict:
+    """Riga del catalogo nel formato usato dall'interfaccia web."""
+    started = datetime.fromisoformat(row["started_at"])
+    return {
+        "id": row["id"],
+        "docente": row["docente"],
+        "materia": row["materia"],
+        "data": started.strftime("%d/%m/%Y"),
+        "ora": started.strftime("%H:%M"),
+        "timestamp": started.strftime("%Y%m%d%H%M"),
+        "processed": bool(row["has_notes"]),
+    }
+
+
+if __name__ == "__main__":
+    # Reimportazione manuale: python session_catalog.py
+    catalog = SessionCatalog(getattr(config, "CATALOG_DB", "data/catalog.sqlite3"))
+    catalog.import_existing_files(force=True)
@@ -1,9 +1,88 @@
 # shared_state.py
 
+import threading
+
 # Dati condivisi tra i vari moduli dell'applicazione.
 # Questo approccio semplice evita complesse gestioni dello stato per un'app di queste dimensioni.
 
 session_transcripts = {}
-current_session_id = None
-session_active = False   # <-- L'ERRORE DICE CHE QUESTA RIGA MANCA O E' SCRITTA MALE
-transcript_log = []      # Log completo di tutte le sessioni (potrebbe essere rimosso se non serve)
\ No newline at end of file
+transcript_log = []      # Log completo di tutte le sessioni (potrebbe essere rimosso se non serve)
+
+# Aula usata quando la configurazione non ne definisce altre
+DEFAULT_CLASSROOM = "aula"
+
+
+class ClassroomState:
+    """
+    Stato di un'aula: la sessione in corso e la lingua scelta da ogni client
+    collegato. Ogni aula ha la propria pipeline (vedi classrooms.py).
+    """
+
+    def __init__(self, classroom_id: str, name: str | None = None):
+        self.id = classroom_id
+        self.name = name or classroom_id
+        self.current_session_id = None
+        self.session_active = False
+        # Serializza avvio e stop della sessione di quest'aula
+        self.lifecycle_lock = threading.Lock()
+        # Funzioni chiamate a ogni cambio di `session_active` (es. per svegliare il worker audio)
+        self._session_listeners = []
+        self._listeners_lock = threading.Lock()
+        # Lingua scelta da ogni client (sid -> codice lingua): la pipeline
+        # traduce e sintetizza solo nelle lingue che hanno almeno un ascoltatore
+        self._subscriptions = {}
+        self._subscriptions_lock = threading.Lock()
+
+    def add_session_listener(self, callback):
+        with self._listeners_lock:
+            self._session_listeners.append(callback)
+
+    def set_session_active(self, active: bool):
+        """Aggiorna lo stato della sessione e notifica chi è in attesa del cambio."""
+        self.session_active = active
+        with self._listeners_lock:
+            listeners = list(self._session_listeners)
+        for callback in listeners:
+            callback()
+
+    def subscribe_language(self, sid: str, language: str):
+        with self._subscriptions_lock:
+            self._subscriptions[sid] = language
+
+    def unsubscribe(self, sid: str):
+        with self._subscriptions_lock:
+            self._subscriptions.pop(sid, None)
+
+    def subscribed_languages(self) -> set:
+        with self._subscriptions_lock:
+            return set(self._subscriptions.values())
+
+    def status(self) -> dict:
+        return {"classroom": self.id, "name": self.name,
+                "active": self.session_active, "session_id": self.current_session_id}
+
+
+# Aule servite da questo processo, nell'ordine della configurazione
+classrooms = {}
+
+def add_classroom(classroom_id: str, name: str | None = None) -> ClassroomState:
+    classroom = classrooms[classroom_id] = ClassroomState(classroom_id, name)
+    return classroom
+
+def get_classroom(classroom_id: str | None = None) -> ClassroomState | None:
+    """L'aula richiesta, o la prima configurata se `classroom_id` è vuoto."""
+    if not classroom_id:
+        return next(iter(classrooms.values()), None)
+    return classrooms.get(classroom_id)
+
+def classroom_of_session(session_id: str) -> ClassroomState | None:
+    """L'aula in cui `session_id` è in corso, se è una sessione live."""
+    for classroom in list(classrooms.values()):
+        if classroom.session_active and classroom.current_session_id == session_id:
+            return classroom
+    return None
+
+def unsubscribe(sid: str):
+    """Dimentica la lingua scelta da un client in tutte le aule (es. alla disconnessione)."""
+    for classroom in list(classrooms.values()):
+        classroom.unsubscribe(sid)
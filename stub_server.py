@@ -0,0 +1,162 @@
+# stub_server.py
+
+# Server locale che imita gli endpoint OpenAI usati dall'applicazione
+# (trascrizione, chat, sintesi vocale) con latenze casuali configurabili.
+# Serve per misurare la pipeline senza rete e senza consumare credito API.
+#
+# Uso: python stub_server.py --port 8765 --transcribe-latency lognormal:700,0.4
+# e poi OPENAI_BASE_URL = "http://127.0.0.1:8765/v1" in config.py
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+DEFAULT_LATENCIES = {
+    "transcribe": "lognormal:700,0.35",
+    "chat": "lognormal:400,0.3",
+    "speech": "lognormal:600,0.3",
+}
+
+# Pausa tra una parola e l'altra nelle risposte in streaming (la latenza "chat" è il tempo al primo token)
+STREAM_WORD_DELAY = 0.03
+
+SAMPLE_SENTENCES = [
+    "Oggi parliamo delle equazioni differenziali del primo ordine.",
+    "Come abbiamo visto la volta scorsa, il teorema vale solo per funzioni continue.",
+    "Allora, ci sono domande?",
+    "Va bene, andiamo avanti con il prossimo esempio.",
+    "Questo risultato sarà fondamentale per l'esame.",
+]
+
+
+def parse_latency(spec: str):
+    """
+    Converte una specifica di latenza in una funzione che restituisce secondi:
+    "fixed:MS", "uniform:MIN_MS,MAX_MS" oppure "lognormal:MEDIANA_MS,SIGMA".
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma) / 1000
+    raise ValueError(f"Distribuzione di latenza non valida: {spec}")
+
+
+def stream_completion(text: str, model: str):
+    """Risposta in streaming (server-sent events) che invia il testo una parola alla volta."""
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        time.sleep(STREAM_WORD_DELAY)
+        delta = word if i == 0 else " " + word
+        event = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                 "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+        yield f"data: {json.dumps(event)}\n\n"
+    event = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    yield f"data: {json.dumps(event)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_app(latencies: dict | None = None, error_rate: float = 0.0) -> Flask:
+    samplers = {name: parse_latency(spec) for name, spec in {**DEFAULT_LATENCIES, **(latencies or {})}.items()}
+    app = Flask(__name__)
+    app.stats = {"transcribe": 0, "chat": 0, "speech": 0, "errors": 0}
+    stats_lock = threading.Lock()
+
+    def simulate(endpoint: str):
+        with stats_lock:
+            app.stats[endpoint] += 1
+        time.sleep(samplers[endpoint]())
+        if error_rate and random.random() < error_rate:
+            with stats_lock:
+                app.stats["errors"] += 1
+            status = random.choice([429, 500, 503])
+            return jsonify(error={"message": "errore simulato", "type": "stub_error"}), status
+        return None
+
+    @app.post("/v1/audio/transcriptions")
+    def transcriptions():
+        upload = request.files.get("file")
+        size = len(upload.read()) if upload else 0
+        error = simulate("transcribe")
+        if error:
+            return error
+        # Testo deterministico rispetto al contenuto, così le cache si comportano come in produzione
+        return jsonify(text=SAMPLE_SENTENCES[size % len(SAMPLE_SENTENCES)])
+
+    @app.post("/v1/chat/completions")
+    def chat_completions():
+        body = request.get_json()
+        error = simulate("chat")
+        if error:
+            return error
+        text = body["messages"][-1]["content"]
+        if body.get("stream"):
+            return Response(stream_completion(f"[EN] {text}", body.get("model", "stub")), mimetype="text/event-stream")
+        return jsonify(
+            id="chatcmpl-stub", object="chat.completion", created=int(time.time()), model=body.get("model", "stub"),
+            choices=[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": f"[EN] {text}"}}],
+            usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        )
+
+    @app.post("/v1/audio/speech")
+    def speech():
+        text = request.get_json().get("input", "")
+        error = simulate("speech")
+        if error:
+            return error
+        # Circa 1 KB per parola, come un mp3 a bassa qualità
+        return b"ID3" + bytes(1024 * max(1, len(text.split()))), 200, {"Content-Type": "audio/mpeg"}
+
+    @app.get("/stats")
+    def stats():
+        return jsonify(app.stats)
+
+    return app
+
+
+class StubServer(threading.Thread):
+    """Avvia lo stub in un thread, per usarlo dall'interno di un benchmark."""
+
+    def __init__(self, port: int = 8765, latencies: dict | None = None, error_rate: float = 0.0):
+        super().__init__(daemon=True)
+        # Il log di ogni richiesta coprirebbe l'output del benchmark
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.app = create_app(latencies, error_rate)
+        self.server = make_server("127.0.0.1", port, self.app, threaded=True)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub locale degli endpoint OpenAI")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--transcribe-latency", default=DEFAULT_LATENCIES["transcribe"])
+    parser.add_argument("--chat-latency", default=DEFAULT_LATENCIES["chat"])
+    parser.add_argument("--speech-latency", default=DEFAULT_LATENCIES["speech"])
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Frazione di richieste che falliscono con 429/5xx")
+    args = parser.parse_args()
+
+    latencies = {"transcribe": args.transcribe_latency, "chat": args.chat_latency, "speech": args.speech_latency}
+    app = create_app(latencies, args.error_rate)
+    print(f"🧪 Stub OpenAI in ascolto su http://127.0.0.1:{args.port}/v1")
+    app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# conftest.py
+
+# I moduli dell'applicazione stanno nella radice del repository, senza pacchetto
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# config.py è locale (copiato da config.template.py con le proprie chiavi): se manca,
+# i test usano i valori predefiniti del template
+try:
+    import config  # noqa: F401
+except ImportError:
+    spec = importlib.util.spec_from_file_location("config", ROOT / "config.template.py")
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    sys.modules["config"] = config
@@ -0,0 +1,90 @@
+# test_audio_ingest.py
+
+# Decodifica dell'audio inviato dalla pagina del docente (audio_ingest.py).
+# I pacchetti Opus sono prodotti con opuslib come fa WebCodecs nel browser:
+# 48 kHz, mono, frame da 20 ms. I test Opus richiedono opuslib e libopus.
+
+import numpy as np
+import pytest
+
+from audio_ingest import OpusDecoder, PCM16Decoder, available_codecs, create_decoder
+
+try:
+    import opuslib
+except Exception:  # opuslib assente o libopus non trovata
+    opuslib = None
+
+needs_opus = pytest.mark.skipif(opuslib is None, reason="opuslib o libopus non disponibili")
+
+
+def tone(sample_rate: int, seconds: float, frequency: float = 440.0) -> np.ndarray:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def dominant_frequency(samples: np.ndarray, sample_rate: int) -> float:
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return np.fft.rfftfreq(len(samples), 1 / sample_rate)[np.argmax(spectrum)]
+
+
+def to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def test_pcm16_is_resampled_to_the_pipeline_rate():
+    decoder = PCM16Decoder(48000, 16000)
+    decoded = np.concatenate([decoder.decode(to_pcm16(block)) for block in np.split(tone(48000, 1.0), 10)])
+    assert len(decoded) == 16000
+    assert dominant_frequency(decoded, 16000) == pytest.approx(440, abs=2)
+
+
+def test_pcm16_at_the_pipeline_rate_is_unchanged():
+    samples = tone(16000, 0.1)
+    decoded = PCM16Decoder(16000, 16000).decode(to_pcm16(samples))
+    np.testing.assert_allclose(decoded, samples, atol=1e-4)
+
+
+def test_pcm16_packets_resample_as_one_continuous_stream():
+    source = tone(44100, 1.0)
+    # Pacchetti di lunghezza irregolare, come quelli che arrivano dal browser
+    edges = np.cumsum([0] + [441, 1000, 37, 2048, 4096] * 5)
+    packets = [source[start:end] for start, end in zip(edges[:-1], edges[1:])] + [source[edges[-1]:]]
+
+    decoder = PCM16Decoder(44100, 16000)
+    decoded = np.concatenate([decoder.decode(to_pcm16(packet)) for packet in packets])
+    assert len(decoded) == pytest.approx(16000, abs=1)
+    # Il risultato coincide con il tono generato direttamente a 16 kHz: nessun salto ai bordi dei pacchetti
+    np.testing.assert_allclose(decoded, tone(16000, 1.0)[:len(decoded)], atol=2e-3)
+    assert np.max(np.abs(np.diff(decoded))) < 0.1
+
+
+def test_invalid_pcm_rate_is_rejected():
+    with pytest.raises(ValueError):
+        create_decoder("pcm16", 16000, 0)
+    with pytest.raises(ValueError):
+        create_decoder("pcm16", 16000, 1_000_000)
+    # sample_rate arriva dal client: tipi sbagliati sono un errore di validazione, non un'eccezione qualsiasi
+    for bad in (None, "abc", [48000], {"rate": 48000}):
+        with pytest.raises(ValueError):
+            create_decoder("pcm16", 16000, bad)
+    assert create_decoder("pcm16", 16000, "48000").input_rate == 48000
+
+
+@needs_opus
+def test_opus_packets_decode_at_the_pipeline_rate():
+    assert available_codecs()[0] == "opus"
+    encoder = opuslib.Encoder(48000, 1, opuslib.APPLICATION_AUDIO)
+    frame = 960  # 20 ms a 48 kHz
+    source = tone(48000, 1.0)
+    packets = [encoder.encode(to_pcm16(source[i:i + frame]), frame) for i in range(0, len(source), frame)]
+
+    decoder = create_decoder("opus", 16000)
+    assert isinstance(decoder, OpusDecoder)
+    blocks = [decoder.decode(packet) for packet in packets]
+    # Ogni pacchetto da 20 ms diventa 320 campioni a 16 kHz, senza ricampionamento
+    assert {len(block) for block in blocks} == {320}
+    decoded = np.concatenate(blocks)
+    assert decoded.dtype == np.float32
+    assert dominant_frequency(decoded[1600:], 16000) == pytest.approx(440, abs=2)
+    # Escluso il ritardo iniziale del codec, il livello resta quello del tono
+    assert np.sqrt(np.mean(decoded[1600:] ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.1)
@@ -0,0 +1,69 @@
+# test_audio_worker.py
+
+# Buffer circolare della cattura audio e cursori dei consumatori (audio_worker.py).
+
+import numpy as np
+
+from audio_worker import CircularBuffer
+
+
+def ramp(start: int, count: int) -> np.ndarray:
+    return np.arange(start, start + count, dtype=np.float32)
+
+
+def test_every_sample_is_delivered_exactly_once():
+    ring = CircularBuffer(100)
+    cursor = ring.cursor()
+    received = []
+    written = 0
+    # Blocchi di lunghezza variabile che attraversano più volte la fine del buffer
+    for size in (30, 45, 60, 10, 99, 1, 70):
+        ring.add_data(ramp(written, size))
+        written += size
+        received.append(cursor.read_new().copy())
+    np.testing.assert_array_equal(np.concatenate(received), ramp(0, written))
+    assert cursor.available() == 0
+    assert cursor.overrun_samples == 0
+    assert len(cursor.read_new()) == 0
+
+
+def test_max_samples_limits_each_read():
+    ring = CircularBuffer(100)
+    cursor = ring.cursor()
+    ring.add_data(ramp(0, 50))
+    first = cursor.read_new(20).copy()
+    rest = cursor.read_new().copy()
+    np.testing.assert_array_equal(np.concatenate([first, rest]), ramp(0, 50))
+
+
+def test_overrun_is_counted_and_reading_resumes_at_the_oldest_sample():
+    ring = CircularBuffer(100)
+    cursor = ring.cursor()
+    ring.add_data(ramp(0, 80))
+    ring.add_data(ramp(80, 70))
+    data = cursor.read_new()
+    # Dei 150 campioni scritti restano gli ultimi 100: i primi 50 sono persi
+    assert cursor.overrun_samples == 50
+    np.testing.assert_array_equal(data, ramp(50, 100))
+
+
+def test_block_larger_than_the_buffer_keeps_its_tail():
+    ring = CircularBuffer(100)
+    cursor = ring.cursor()
+    ring.add_data(ramp(0, 250))
+    np.testing.assert_array_equal(cursor.read_new(), ramp(150, 100))
+    assert cursor.overrun_samples == 150
+    np.testing.assert_array_equal(ring.get_data(), ramp(150, 100))
+
+
+def test_cursors_are_independent_and_start_at_the_write_position():
+    ring = CircularBuffer(100)
+    ring.add_data(ramp(0, 10))
+    early, late = ring.cursor(), None
+    ring.add_data(ramp(10, 10))
+    late = ring.cursor()
+    ring.add_data(ramp(20, 10))
+    np.testing.assert_array_equal(early.read_new(), ramp(10, 20))
+    np.testing.assert_array_equal(late.read_new(), ramp(20, 10))
+    late.skip_to_end()
+    assert late.available() == 0
@@ -0,0 +1,62 @@
+# test_jobs.py
+
+# Coda persistente dei lavori in background (jobs.py).
+
+import threading
+import time
+
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def test_requests_for_the_same_session_are_merged(tmp_path):
+    release = threading.Event()
+    finished = []
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), {"notes": lambda s: release.wait(5)},
+                    workers=1, on_done=finished.append)
+    jobs.start()
+    first = jobs.submit("notes", "lezione")
+    assert jobs.submit("notes", "lezione")["id"] == first["id"]
+    other = jobs.submit("notes", "altra")
+    assert other["id"] != first["id"]
+
+    release.set()
+    while len(finished) < 2:
+        time.sleep(0.01)
+    assert {job["status"] for job in finished} == {DONE}
+    # Concluso il lavoro, una nuova richiesta ne crea un altro
+    assert jobs.submit("notes", "lezione")["id"] != first["id"]
+
+
+def test_failures_are_recorded(tmp_path):
+    done = threading.Event()
+
+    def fail(session_id):
+        raise RuntimeError("API non raggiungibile")
+
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), {"notes": fail}, workers=1, on_done=lambda job: done.set())
+    jobs.start()
+    job = jobs.submit("notes", "lezione")
+    assert done.wait(5)
+    job = jobs.get(job["id"])
+    assert job["status"] == FAILED
+    assert job["error"] == "API non raggiungibile"
+
+
+def test_interrupted_jobs_are_requeued_on_restart(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    # Prima esecuzione: il lavoro viene accodato ma il server si ferma prima di eseguirlo
+    before = JobQueue(db, {"notes": lambda s: True})
+    queued = before.submit("notes", "in_coda")
+    running = before.submit("notes", "in_corso")
+    before._update(running["id"], status=RUNNING, started_at="2026-03-02T09:00:00")
+    assert before.stats() == {QUEUED: 1, RUNNING: 1}
+
+    ran = []
+    finished = threading.Event()
+    after = JobQueue(db, {"notes": lambda s: ran.append(s) or True}, workers=1,
+                     on_done=lambda job: len(ran) == 2 and finished.set())
+    after.start()
+    assert finished.wait(5)
+    assert ran == ["in_coda", "in_corso"]
+    assert after.get(queued["id"])["status"] == DONE
+    assert after.get(running["id"])["status"] == DONE
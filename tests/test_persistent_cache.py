@@ -0,0 +1,55 @@
+# test_persistent_cache.py
+
+# Cache a due livelli, memoria e SQLite (persistent_cache.py).
+
+from persistent_cache import PersistentCache, make_key, normalize_text
+
+
+def test_hits_and_misses_across_memory_and_disk(tmp_path):
+    db = tmp_path / "cache.sqlite3"
+    cache = PersistentCache(str(db), "traduzioni")
+    assert cache.get("a") is None
+    cache.put("a", "uno")
+    assert cache.get("a") == "uno"
+    cache.flush(5)
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # Dopo un "riavvio" la voce arriva dal disco e torna in memoria
+    reopened = PersistentCache(str(db), "traduzioni")
+    assert reopened.peek("a") is None
+    assert reopened.get("a") == "uno"
+    assert reopened.peek("a") == "uno"
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_memory_is_a_bounded_lru(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"), "traduzioni", memory_items=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.peek("a")
+    cache.put("c", "3")
+    # "b" era la meno usata: resta solo su disco
+    assert cache.peek("b") is None
+    assert cache.peek("a") == "1"
+    cache.flush(5)
+    assert cache.get("b") == "2"
+
+
+def test_disk_eviction_keeps_the_most_recently_used(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"), "traduzioni", memory_items=1, max_entries=10)
+    for i in range(10):
+        cache.put(f"k{i}", str(i))
+        cache.flush(5)
+    cache.put("k10", "10")
+    cache.flush(5)
+    # Superato il limite si elimina in blocco fino al 90%
+    assert cache.stats()["disk_entries"] == 9
+    assert cache.get("k0") is None
+    assert cache.get("k10") == "10"
+
+
+def test_keys_are_stable_and_text_is_normalized():
+    assert make_key("ciao", "modello") == make_key("ciao", "modello")
+    assert make_key("ciao", "modello") != make_key("ciaomodello")
+    assert normalize_text("  buon \n giorno\t") == "buon giorno"
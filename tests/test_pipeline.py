@@ -0,0 +1,89 @@
+# test_pipeline.py
+
+# Ordine di emissione e backpressure della pipeline a stadi (pipeline.py).
+
+import threading
+import time
+
+import numpy as np
+
+from pipeline import Chunk, OrderedEmitter, Pipeline, Stage
+
+
+def chunk(seq: int, seconds: float = 1.0) -> Chunk:
+    return Chunk(seq, np.zeros(int(16000 * seconds), dtype=np.float32), 16000, "sessione")
+
+
+def test_emitter_delivers_in_sequence_order():
+    emitted = []
+    emitter = OrderedEmitter(lambda c: emitted.append(c.seq))
+    for seq in (2, 0, 3, 1):
+        emitter.complete(chunk(seq))
+    assert emitted == [0, 1, 2, 3]
+    assert emitter.wait_until(4, timeout=0)
+
+
+def test_emitter_calls_on_emit_outside_the_lock():
+    held = []
+    emitter = OrderedEmitter(lambda c: held.append(emitter.lock.locked()))
+    emitter.complete(chunk(0))
+    assert held == [False]
+
+
+def test_out_of_order_completion_is_emitted_in_order():
+    emitted = []
+
+    def handler(c):
+        # I primi chunk finiscono per ultimi
+        time.sleep(0.05 * (5 - c.seq))
+        return c.seq != 2
+
+    pipeline = Pipeline([("lavoro", handler, 6)], lambda c: emitted.append(c.seq), queue_size=6)
+    pipeline.start()
+    for seq in range(6):
+        pipeline.submit(chunk(seq))
+    assert pipeline.emitter.wait_until(6, timeout=5)
+    pipeline.stop()
+    # Il chunk scartato dall'handler fa comunque avanzare la sequenza
+    assert emitted == [0, 1, 3, 4, 5]
+
+
+def test_drop_oldest_counts_and_skips_dropped_chunks():
+    release = threading.Event()
+    emitted = []
+
+    def handler(c):
+        release.wait(5)
+        return True
+
+    pipeline = Pipeline([("lento", handler, 1)], lambda c: emitted.append(c.seq),
+                        queue_size=2, backpressure="drop_oldest")
+    pipeline.start()
+    pipeline.submit(chunk(0))
+    # Il chunk 0 è in lavorazione: i successivi riempiono la coda e scartano i più vecchi
+    while pipeline.stages[0].queue.qsize():
+        time.sleep(0.01)
+    for seq in range(1, 6):
+        pipeline.submit(chunk(seq, seconds=0.5))
+    release.set()
+    assert pipeline.emitter.wait_until(6, timeout=5)
+    pipeline.stop()
+
+    stats = pipeline.stats()["lento"]
+    assert stats["dropped_chunks"] == 3
+    assert stats["dropped_seconds"] == 1.5
+    assert emitted == [0, 4, 5]
+
+
+def test_drop_oldest_never_blocks_on_the_stop_signal():
+    dropped = []
+    stage = Stage("fermo", lambda c: True, maxsize=1, policy="drop_oldest")
+    stage.on_drop = dropped.append
+    stage.queue.put(None)
+
+    done = threading.Event()
+    threading.Thread(target=lambda: (stage.put(chunk(0)), done.set()), daemon=True).start()
+    assert done.wait(1)
+    # Il segnale di arresto resta in coda, il nuovo chunk viene scartato
+    assert stage.queue.get_nowait() is None
+    assert [c.seq for c in dropped] == [0]
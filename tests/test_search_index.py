@@ -0,0 +1,55 @@
+# test_search_index.py
+
+# Ricerca full-text su segmenti e appunti (search_index.py).
+
+import pytest
+
+from search_index import SearchIndex, highlight, to_match_query
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    index.add_segment("storia", "09:00:00", "La rivoluzione francese iniziò nel 1789", "The French revolution began in 1789")
+    index.add_segment("storia", "09:01:00", "Il re fu arrestato", "The king was arrested")
+    index.add_segment("fisica", "10:00:00", "La velocità della luce è costante", "The speed of light is constant")
+    return index
+
+
+def test_user_text_becomes_quoted_terms():
+    assert to_match_query('luce OR "velocità') == '"luce" "OR" """velocità"'
+    assert to_match_query("   ") == ""
+
+
+def test_operators_and_quotes_are_searched_as_text(index):
+    # Senza le virgolette "OR" e "NEAR(" sarebbero sintassi FTS5, o un errore
+    assert index.search("luce OR re")[0] == []
+    assert index.search('NEAR( "luce')[0] == []
+    results, _ = index.search("re arrestato")
+    assert [r["ref"] for r in results] == ["09:01:00"]
+
+
+def test_accents_are_ignored(index):
+    results, _ = index.search("velocita")
+    assert [r["session_id"] for r in results] == ["fisica"]
+
+
+def test_snippet_is_escaped_before_highlighting(index):
+    index.add_segment("html", "11:00:00", "Il tag <script>alert(1)</script> è pericoloso", "")
+    results, _ = index.search("pericoloso")
+    snippet = results[0]["snippet"]
+    assert "<script>" not in snippet
+    assert "&lt;script&gt;" in snippet
+    assert "<mark>pericoloso</mark>" in snippet
+    assert highlight("a < b \x02c\x03") == "a &lt; b <mark>c</mark>"
+
+
+def test_notes_are_replaced_and_results_paginated(index):
+    index.set_notes("storia", "Appunti sulla rivoluzione", "")
+    index.set_notes("storia", "Appunti aggiornati sulla rivoluzione", "")
+    results, more = index.search("rivoluzione", per_page=1)
+    assert more
+    results, _ = index.search("rivoluzione", per_page=10)
+    assert sorted(r["kind"] for r in results) == ["notes", "segment"]
+    results, _ = index.search("rivoluzione", session_id="fisica")
+    assert results == []
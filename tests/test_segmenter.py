@@ -0,0 +1,59 @@
+# test_segmenter.py
+
+# Segmentazione dell'audio sulle pause (segmenter.py).
+
+import numpy as np
+
+from segmenter import FixedSegmenter, VadSegmenter
+
+RATE = 16000
+
+
+def tone(seconds: float, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds: float) -> np.ndarray:
+    # Rumore di fondo debole, come un microfono reale in un'aula silenziosa
+    return (np.random.default_rng(0).normal(0, 1e-4, int(RATE * seconds))).astype(np.float32)
+
+
+def feed_in_blocks(segmenter, signal: np.ndarray, block: int = 1600) -> list:
+    segments = []
+    for i in range(0, len(signal), block):
+        segments.extend(segmenter.feed(signal[i:i + block]))
+    return segments
+
+
+def test_speech_is_split_on_pauses_and_silence_is_skipped():
+    signal = np.concatenate([silence(1.0), tone(2.0), silence(1.0), tone(3.0), silence(1.0)])
+    segmenter = VadSegmenter(RATE)
+    segments = feed_in_blocks(segmenter, signal)
+    assert segmenter.flush() is None
+
+    assert len(segments) == 2
+    # Ogni segmento è il tono più al massimo 200 ms di margine per lato
+    for segment, expected in zip(segments, (2.0, 3.0)):
+        assert expected <= len(segment) / RATE <= expected + 0.45
+    assert segmenter.skipped_seconds > 1.5
+
+
+def test_long_speech_is_cut_at_max_duration():
+    segmenter = VadSegmenter(RATE, max_duration=4.0)
+    segments = feed_in_blocks(segmenter, np.concatenate([silence(3.0), tone(6.0), silence(1.0)]))
+    durations = [len(s) / RATE for s in segments]
+    assert len(durations) == 2
+    assert max(durations) <= 4.0
+    assert 6.0 <= sum(durations) <= 6.45
+
+
+def test_short_click_is_not_a_segment():
+    signal = np.concatenate([silence(1.0), tone(0.06), silence(2.0)])
+    assert feed_in_blocks(VadSegmenter(RATE), signal) == []
+
+
+def test_fixed_segmenter_cuts_whole_chunks():
+    segmenter = FixedSegmenter(RATE, chunk_duration=2)
+    segments = feed_in_blocks(segmenter, tone(5.0))
+    assert [len(s) for s in segments] == [2 * RATE, 2 * RATE]
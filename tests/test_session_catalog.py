@@ -0,0 +1,77 @@
+# test_session_catalog.py
+
+# Filtri e paginazione del catalogo delle sessioni (session_catalog.py).
+
+import pytest
+
+from session_catalog import SessionCatalog, format_session
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = SessionCatalog(str(tmp_path / "catalog.sqlite3"))
+    lessons = [
+        ("rossi", "storia", "2026-03-02T09:00:00", True),
+        ("rossi", "storia", "2026-03-02T11:00:00", False),
+        ("bianchi", "fisica", "2026-03-02T10:00:00", True),
+        ("bianchi", "fisica", "2026-03-03T09:00:00", True),
+        ("rossi", "latino", "2026-03-04T08:30:00", True),
+    ]
+    for i, (docente, materia, started_at, transcript) in enumerate(lessons):
+        session_id = f"s{i}"
+        catalog.session_started(session_id, docente, materia, started_at)
+        catalog.session_ended(session_id, has_transcript=transcript)
+    return catalog
+
+
+def ids(rows):
+    return [row["id"] for row in rows]
+
+
+def test_sessions_are_listed_newest_first(catalog):
+    rows, cursor = catalog.list_sessions(per_page=10)
+    assert ids(rows) == ["s4", "s3", "s1", "s2", "s0"]
+    assert cursor is None
+
+
+def test_filters_can_be_combined(catalog):
+    assert ids(catalog.list_sessions(docente="rossi")[0]) == ["s4", "s1", "s0"]
+    assert ids(catalog.list_sessions(materia="fisica")[0]) == ["s3", "s2"]
+    assert ids(catalog.list_sessions(date="2026-03-02")[0]) == ["s1", "s2", "s0"]
+    assert ids(catalog.list_sessions(date="2026-3-2")[0]) == ["s1", "s2", "s0"]
+    assert ids(catalog.list_sessions(docente="rossi", date="2026-03-02", has_transcript=True)[0]) == ["s0"]
+    assert ids(catalog.list_sessions(has_transcript=False)[0]) == ["s1"]
+
+
+def test_pages_cover_every_session_once(catalog):
+    # Due sessioni con lo stesso orario: l'id decide l'ordine e nessuna delle due va persa tra le pagine
+    catalog.session_started("s5", "verdi", "chimica", "2026-03-03T09:00:00")
+    pages, cursor = [], None
+    while True:
+        rows, cursor = catalog.list_sessions(per_page=2, cursor=cursor)
+        pages.append(ids(rows))
+        if cursor is None:
+            break
+    assert pages == [["s4", "s5"], ["s3", "s1"], ["s2", "s0"]]
+
+
+def test_cursor_keeps_its_place_when_new_sessions_start(catalog):
+    first, cursor = catalog.list_sessions(per_page=2)
+    catalog.session_started("s9", "verdi", "chimica", "2026-03-05T08:00:00")
+    second, _ = catalog.list_sessions(per_page=2, cursor=cursor)
+    assert ids(first + second) == ["s4", "s3", "s1", "s2"]
+
+
+@pytest.mark.parametrize("arguments", [{"date": "02/03/2026"}, {"date": "2026-02-30"},
+                                       {"cursor": "non-un-cursore"}, {"cursor": "WzFd"}])
+def test_malformed_date_or_cursor_is_rejected(catalog, arguments):
+    with pytest.raises(ValueError):
+        catalog.list_sessions(**arguments)
+
+
+def test_format_session_for_the_web_page(catalog):
+    catalog.notes_generated("s4")
+    formatted = format_session(catalog.get("s4"))
+    assert formatted["data"] == "04/03/2026"
+    assert formatted["ora"] == "08:30"
+    assert formatted["processed"] is True
@@ -0,0 +1,150 @@
+# test_tts_store.py
+
+# Concatenazione degli mp3 sintetizzati per frasi (tts_store.py).
+# tone.mp3 è un tono di 0.5 s codificato da LAME (MPEG-2 Layer III, 24 kHz, CBR),
+# con il frame Info/LAME in testa come quelli prodotti dalle API TTS. A bitrate
+# costante libsndfile ricava la durata dalla dimensione se il frame Info manca.
+
+import asyncio
+import io
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import soundfile as sf
+
+from tts_store import AudioRetentionManager, Mp3HeaderStripper, TTSStore, mp3_header_end
+
+FIXTURE = (Path(__file__).parent / "fixtures" / "tone.mp3").read_bytes()
+
+
+def duration(data: bytes) -> float:
+    samples, sample_rate = sf.read(io.BytesIO(data))
+    return len(samples) / sample_rate
+
+
+def has_info_frame(data: bytes) -> bool:
+    return b"Xing" in data or b"Info" in data
+
+
+def id3_tag(size: int = 32) -> bytes:
+    # Tag ID3v2.4 vuoto (solo padding), dimensione in formato syncsafe
+    return b"ID3\x04\x00\x00" + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) + bytes(size)
+
+
+def strip(data: bytes, keep_id3: bool = False, piece: int | None = None) -> bytes:
+    stripper = Mp3HeaderStripper(keep_id3)
+    piece = piece or len(data)
+    out = b"".join(stripper.feed(data[i:i + piece]) for i in range(0, len(data), piece))
+    return out + stripper.flush()
+
+
+def test_fixture_has_info_frame():
+    id3_end, audio_start = mp3_header_end(FIXTURE)
+    assert id3_end == 0
+    assert has_info_frame(FIXTURE[:audio_start])
+    assert audio_start < len(FIXTURE)
+
+
+def test_plain_concatenation_loses_later_parts():
+    # Il motivo della pulizia: il frame Xing della prima parte dichiara la durata di quella sola
+    assert duration(FIXTURE + FIXTURE) == pytest.approx(duration(FIXTURE), abs=0.01)
+
+
+def test_stripped_parts_play_in_full():
+    data = strip(FIXTURE) + strip(FIXTURE) + strip(FIXTURE)
+    assert not has_info_frame(data)
+    assert duration(data) == pytest.approx(3 * duration(strip(FIXTURE)), abs=0.01)
+
+
+@pytest.mark.parametrize("piece", [1, 7, 100])
+def test_streamed_pieces_match_whole(piece):
+    tagged = id3_tag() + FIXTURE
+    assert strip(tagged, keep_id3=True, piece=piece) == strip(tagged, keep_id3=True)
+    assert strip(tagged, piece=piece) == strip(FIXTURE)
+
+
+def test_id3_kept_only_when_requested():
+    tagged = id3_tag() + FIXTURE
+    assert strip(tagged, keep_id3=True) == id3_tag() + strip(FIXTURE)
+    assert strip(tagged).startswith(b"\xff")
+
+
+def test_short_or_foreign_data_is_untouched():
+    assert strip(b"\xff\xf3") == b"\xff\xf3"
+    assert strip(b"RIFF....WAVEfmt ") == b"RIFF....WAVEfmt "
+
+
+class FakeAsyncClient:
+    """Restituisce la fixture a pezzi, come la risposta in streaming dell'API TTS."""
+
+    async def stream_speech(self, text, on_chunk, voice, model):
+        data = id3_tag() + FIXTURE
+        for i in range(0, len(data), 100):
+            on_chunk(data[i:i + 100])
+            await asyncio.sleep(0)
+        return True
+
+
+class FailingAsyncClient(FakeAsyncClient):
+    """La sintesi della frase che contiene "Seconda" fallisce."""
+
+    async def stream_speech(self, text, on_chunk, voice, model):
+        if "Seconda" in text:
+            return False
+        return await super().stream_speech(text, on_chunk, voice, model)
+
+
+class FakeAIClient:
+    def __init__(self, async_client=None):
+        self.async_client = async_client or FakeAsyncClient()
+
+    def submit(self, coro):
+        threading.Thread(target=asyncio.run, args=(coro,), daemon=True).start()
+
+
+def test_sentences_are_joined_into_one_playable_file(tmp_path):
+    store = TTSStore(tmp_path, FakeAIClient(), sentence_min_chars=10, first_audio_timeout=5)
+    filename = store.get_or_create("Prima frase del test. Seconda frase del test. Terza frase del test.")
+    assert filename is not None
+    data = (tmp_path / filename).read_bytes()
+    assert data.count(b"ID3") == 1
+    assert not has_info_frame(data)
+    assert duration(data) == pytest.approx(3 * duration(strip(FIXTURE)), abs=0.01)
+
+
+def test_failed_later_sentence_keeps_the_announced_url_served(tmp_path):
+    store = TTSStore(tmp_path, FakeAIClient(FailingAsyncClient()), sentence_min_chars=10, first_audio_timeout=5)
+    text = "Prima frase del test. Seconda frase del test. Terza frase del test."
+    filename = store.start(text)
+    assert filename is not None
+    pending = store.pending(filename)
+    assert not pending.wait_done(5)
+
+    # La prima frase resta disponibile per l'URL già inviato ai client, ma non viene salvata
+    partial = store.pending(filename)
+    assert partial is pending
+    assert duration(partial.data()) == pytest.approx(duration(strip(FIXTURE)), abs=0.01)
+    assert not (tmp_path / filename).exists()
+
+    # Una nuova richiesta dello stesso testo lo sintetizza da capo
+    store.ai_client = FakeAIClient()
+    assert store.get_or_create(text) == filename
+    assert (tmp_path / filename).exists()
+    assert store.pending(filename) is None
+
+
+def test_retention_counts_fresh_tmp_files_and_removes_abandoned_ones(tmp_path):
+    old = time.time() - 2 * AudioRetentionManager.TMP_GRACE_S
+    for name, size, mtime in (("vecchio.mp3", 400, old), ("nuovo.mp3", 400, None),
+                              ("in_corso.ab12.mp3.tmp", 400, None), ("interrotto.cd34.mp3.tmp", 400, old)):
+        path = tmp_path / name
+        path.write_bytes(bytes(size))
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    AudioRetentionManager(str(tmp_path), quota_bytes=1000, max_age_hours=24).enforce()
+    # 1200 byte oltre la quota di 1000 contando la sintesi in corso: si elimina l'mp3 meno recente
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["in_corso.ab12.mp3.tmp", "nuovo.mp3"]
@@ -0,0 +1,416 @@
+# tts_store.py
+
+# Archivio dei file TTS indirizzato per contenuto.
+# Il nome di ogni mp3 deriva dall'hash di (testo, voce, modello): una frase già
+# sintetizzata viene riutilizzata senza una nuova chiamata API. Il gestore di
+# ritenzione tiene la cartella audio entro una quota in byte, eliminando i file
+# usati meno di recente.
+#
+# I testi lunghi vengono sintetizzati per frasi, in parallelo, e ricevuti in
+# streaming: l'audio della prima frase è disponibile (vedi PendingAudio e la
+# rotta /audio) mentre le altre sono ancora in sintesi. Il file finale è la
+# concatenazione degli mp3 delle frasi, nell'ordine, senza le intestazioni
+# (tag ID3, frame Xing/Info/VBRI) che dichiarerebbero la durata di una sola frase.
+
+import asyncio
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from ai_client import TTS_MODEL, TTS_VOICE
+from persistent_cache import make_key, normalize_text
+
+# Fine di una frase: punteggiatura seguita da spazio, o punteggiatura CJK (senza spazi)
+SENTENCE_END = re.compile(r"(?<=[.!?;:؟])\s+|(?<=[。！？；])")
+
+
+def split_sentences(text: str, min_chars: int = 60) -> list[str]:
+    """
+    Divide un testo in frasi da sintetizzare separatamente. Le frasi più corte
+    di `min_chars` vengono unite alla successiva: ogni richiesta TTS ha un costo
+    fisso di latenza e una frase troppo breve suona spezzata.
+    """
+    sentences, current = [], ""
+    for piece in SENTENCE_END.split(text.strip()):
+        if not piece:
+            continue
+        current = f"{current} {piece}" if current else piece
+        if len(current) >= min_chars:
+            sentences.append(current)
+            current = ""
+    if current:
+        if sentences and len(current) < min_chars // 2:
+            sentences[-1] = f"{sentences[-1]} {current}"
+        else:
+            sentences.append(current)
+    return sentences
+
+
+# Bitrate (kbit/s) di MPEG Layer III: MPEG-1 e MPEG-2/2.5
+MP3_BITRATES = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Frequenze di campionamento per versione (bit di versione nell'intestazione del frame)
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_header_end(data: bytes) -> tuple[int, int] | None:
+    """
+    Posizioni di fine del tag ID3v2 e dell'eventuale frame informativo
+    Xing/Info/VBRI che lo segue (uguali se il frame non c'è).
+    None se servono altri byte per deciderlo.
+    """
+    id3_end = 0
+    if data[:3] == b"ID3":
+        if len(data) < 10:
+            return None
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        id3_end = 10 + size + (10 if data[5] & 0x10 else 0)
+    header = data[id3_end:id3_end + 4]
+    if len(header) < 4:
+        return None
+    version, layer = (header[1] >> 3) & 3, (header[1] >> 1) & 3
+    bitrate_index, rate_index = header[2] >> 4, (header[2] >> 2) & 3
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0 or layer != 1 or version == 1 \
+            or bitrate_index in (0, 15) or rate_index == 3:
+        # Non è un frame MPEG Layer III: lasciamo i byte come sono
+        return id3_end, id3_end
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[mpeg1][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    frame_end = id3_end + (144 if mpeg1 else 72) * bitrate // sample_rate + ((header[2] >> 1) & 1)
+    if len(data) < frame_end:
+        return None
+    mono = header[3] >> 6 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    tag = data[id3_end + 4 + side_info:id3_end + 8 + side_info]
+    if tag in (b"Xing", b"Info") or data[id3_end + 36:id3_end + 40] == b"VBRI":
+        return id3_end, frame_end
+    return id3_end, id3_end
+
+
+class Mp3HeaderStripper:
+    """
+    Toglie da un mp3 ricevuto in streaming il frame Xing/Info/VBRI e, se
+    `keep_id3` è falso, il tag ID3v2. Trattiene solo i primi byte, finché non
+    ha visto tutta l'intestazione.
+    """
+
+    def __init__(self, keep_id3: bool = False):
+        self.keep_id3 = keep_id3
+        self.buffer = b""
+        self.done = False
+
+    def feed(self, data: bytes) -> bytes:
+        if self.done:
+            return data
+        self.buffer += data
+        ends = mp3_header_end(self.buffer)
+        if ends is None:
+            return b""
+        id3_end, audio_start = ends
+        data = (self.buffer[:id3_end] if self.keep_id3 else b"") + self.buffer[audio_start:]
+        self.buffer = b""
+        self.done = True
+        return data
+
+    def flush(self) -> bytes:
+        """Byte trattenuti di un mp3 troppo corto per avere un'intestazione completa."""
+        data, self.buffer = self.buffer, b""
+        self.done = True
+        return data
+
+
+class PendingAudio:
+    """Un mp3 in sintesi: i byte ricevuti finora, leggibili mentre ne arrivano altri."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+        self.done = False
+        self.ok = False
+        self.condition = threading.Condition()
+
+    def append(self, data: bytes):
+        with self.condition:
+            self.parts.append(data)
+            self.size += len(data)
+            self.condition.notify_all()
+
+    def finish(self, ok: bool):
+        with self.condition:
+            self.done, self.ok = True, ok
+            self.condition.notify_all()
+
+    def data(self) -> bytes:
+        with self.condition:
+            return b"".join(self.parts)
+
+    def wait_started(self, timeout: float) -> bool:
+        """Attende i primi byte (o la fine della sintesi); False se la sintesi non è riuscita."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.size > 0 or self.done, timeout)
+            return self.ok if self.done else self.size > 0
+
+    def wait_done(self, timeout: float) -> bool:
+        with self.condition:
+            self.condition.wait_for(lambda: self.done, timeout)
+            return self.done and self.ok
+
+    def iter_bytes(self, sleep, poll_interval: float = 0.02, timeout: float = 60):
+        """
+        Generatore dei byte man mano che arrivano, per una risposta HTTP in streaming.
+        Attende con `sleep` (es. socketio.sleep) invece che sulla Condition, così non
+        blocca l'event loop del server in modalità gevent/eventlet.
+        """
+        index, idle_since = 0, time.monotonic()
+        while True:
+            with self.condition:
+                new_parts = self.parts[index:]
+                finished = self.done
+            if new_parts:
+                index += len(new_parts)
+                idle_since = time.monotonic()
+                yield b"".join(new_parts)
+            elif finished or time.monotonic() - idle_since > timeout:
+                return
+            else:
+                sleep(poll_interval)
+
+
+class TTSStore:
+    # Sintesi fallite a metà ancora servite dalla rotta /audio (vedi _synthesize)
+    TRUNCATED_ITEMS = 32
+
+    def __init__(self, audio_dir: str, ai_client, voice: str = TTS_VOICE, model: str = TTS_MODEL, hot_cache=None,
+                 sentence_min_chars: int = 60, first_audio_timeout: float = 30):
+        self.audio_dir = Path(audio_dir)
+        self.ai_client = ai_client
+        # AudioHotCache opzionale: i file appena prodotti o riusati restano anche in memoria
+        self.hot_cache = hot_cache
+        self.voice = voice
+        self.model = model
+        # 0 = nessuna divisione in frasi
+        self.sentence_min_chars = sentence_min_chars
+        self.first_audio_timeout = first_audio_timeout
+        self.hits = 0
+        self.misses = 0
+        # Sintesi in corso per nome di file: la stessa frase non viene mai sintetizzata due volte in parallelo
+        self.in_progress = {}
+        self.truncated = OrderedDict()
+        self.lock = threading.Lock()
+
+    def filename_for(self, text: str) -> str:
+        digest = make_key(normalize_text(text), self.voice, self.model)[:32]
+        return f"tts_{digest}.mp3"
+
+    def get_or_create(self, text: str, ai_client=None) -> str | None:
+        """
+        Restituisce il nome del file mp3 per `text`, sintetizzandolo solo se non esiste già.
+        `ai_client` (es. la vista di un'aula, vedi AIClient.for_tenant) sostituisce quello predefinito.
+        """
+        filename, pending = self._lookup_or_start(text, ai_client)
+        if pending is None:
+            return filename
+        return filename if pending.wait_done(self.first_audio_timeout * 4) else None
+
+    def start(self, text: str, ai_client=None) -> str | None:
+        """
+        Come get_or_create, ma ritorna appena l'audio inizia ad arrivare: il resto
+        del file si può leggere in streaming con pending().
+        """
+        filename, pending = self._lookup_or_start(text, ai_client)
+        if pending is None:
+            return filename
+        return filename if pending.wait_started(self.first_audio_timeout) else None
+
+    def pending(self, filename: str) -> PendingAudio | None:
+        """La sintesi ancora in corso per `filename`, o quella fallita a metà, se c'è."""
+        with self.lock:
+            return self.in_progress.get(filename) or self.truncated.get(filename)
+
+    def _lookup_or_start(self, text: str, ai_client=None):
+        filename = self.filename_for(text)
+        path = self.audio_dir / filename
+        while True:
+            if self._reuse(path):
+                return filename, None
+            with self.lock:
+                pending = self.in_progress.get(filename)
+                if pending is not None:
+                    return filename, pending
+                # Se il file non c'è ancora nemmeno ora, la sintesi tocca a noi;
+                # altrimenti è appena terminata e al prossimo giro viene riusato
+                if not path.exists():
+                    pending = self.in_progress[filename] = PendingAudio()
+                    break
+        ai_client = ai_client or self.ai_client
+        ai_client.submit(self._synthesize(text, path, pending, ai_client))
+        return filename, pending
+
+    async def _synthesize(self, text: str, path: Path, pending: PendingAudio, ai_client):
+        sentences = split_sentences(text, self.sentence_min_chars) if self.sentence_min_chars else [text]
+        # Tutte le frasi partono subito (entro il limite di concorrenza TTS); i byte
+        # vengono però accodati al file nell'ordine delle frasi
+        queues = [asyncio.Queue() for _ in sentences]
+
+        async def produce(sentence, output):
+            ok = await ai_client.async_client.stream_speech(sentence, output.put_nowait, self.voice, self.model)
+            output.put_nowait(ok)
+
+        tasks = [asyncio.create_task(produce(s, q)) for s, q in zip(sentences, queues)]
+        ok = True
+        for i, output in enumerate(queues):
+            # Un solo tag ID3 in testa al file, nessun frame Xing: la durata dichiarata
+            # sarebbe quella della prima frase e i player si fermerebbero lì
+            stripper = Mp3HeaderStripper(keep_id3=i == 0)
+            while True:
+                item = await output.get()
+                if isinstance(item, bool):
+                    ok = item
+                    break
+                data = stripper.feed(item)
+                if data:
+                    pending.append(data)
+            if not ok:
+                break
+            rest = stripper.flush()
+            if rest:
+                pending.append(rest)
+        for task in tasks:
+            task.cancel()
+
+        if ok:
+            try:
+                await asyncio.to_thread(self._store, path, pending.data())
+            except Exception as e:
+                print(f"❌ Errore nel salvataggio dell'audio: {e}")
+                ok = False
+        # Il file è su disco prima di togliere la sintesi da in_progress: nessuna richiesta resta senza risposta
+        pending.finish(ok)
+        with self.lock:
+            self.in_progress.pop(path.name, None)
+            if ok:
+                self.misses += 1
+                self.truncated.pop(path.name, None)
+            elif pending.size:
+                # L'URL potrebbe essere già stato annunciato (vedi start): le frasi riuscite restano
+                # servite dalla memoria, senza cache, ma non finiscono su disco sotto il nome
+                # dell'intero testo. La prossima richiesta dello stesso testo lo sintetizza da capo
+                self.truncated[path.name] = pending
+                self.truncated.move_to_end(path.name)
+                while len(self.truncated) > self.TRUNCATED_ITEMS:
+                    self.truncated.popitem(last=False)
+        if not ok and pending.size:
+            print(f"⚠️ Sintesi interrotta dopo {pending.size} byte, audio incompleto per {path.name}")
+
+    def _store(self, path: Path, data: bytes):
+        # Scrittura su file temporaneo + rename: nessuno vede mai un mp3 parziale.
+        # Nome temporaneo unico: anche un altro processo può scrivere lo stesso file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{path.stem}.", suffix=".mp3.tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        if self.hot_cache is not None:
+            self.hot_cache.put(path.name, data)
+
+    def _reuse(self, path: Path) -> bool:
+        try:
+            # L'mtime registra l'ultimo utilizzo, usato dal gestore di ritenzione come ordine LRU
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        if self.hot_cache is not None and not self.hot_cache.contains(path.name):
+            # Caricato ora, prima che i client lo richiedano tutti insieme
+            self.hot_cache.get(path.name)
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+class AudioRetentionManager(threading.Thread):
+    """
+    Controlla periodicamente la cartella audio: elimina i file non usati da più di
+    `max_age_hours` e, se la cartella supera `quota_bytes`, i file usati meno di recente.
+    I .tmp delle sintesi in corso contano nella quota ma non vengono toccati; quelli
+    fermi da più di TMP_GRACE_S sono resti di sintesi interrotte e vengono eliminati.
+    """
+
+    # Una sintesi scrive il proprio .tmp man mano che arrivano i dati
+    TMP_GRACE_S = 3600
+
+    def __init__(self, audio_dir: str, quota_bytes: int, max_age_hours: float = 24, interval: float = 300):
+        super().__init__(daemon=True)
+        self.audio_dir = Path(audio_dir)
+        self.quota_bytes = quota_bytes
+        self.max_age_hours = max_age_hours
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.evicted_files = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.enforce()
+            except Exception as e:
+                print(f"❌ Errore nella pulizia dei file audio: {e}")
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def enforce(self):
+        if not self.audio_dir.exists():
+            return
+
+        now = time.time()
+        files = []
+        in_progress = 0
+        for entry in os.scandir(self.audio_dir):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if not entry.name.endswith(".tmp"):
+                files.append((st.st_mtime, st.st_size, entry.name))
+            elif now - st.st_mtime > self.TMP_GRACE_S:
+                self._remove(entry.name, "file temporaneo abbandonato")
+            else:
+                in_progress += st.st_size
+        files.sort()
+
+        total = in_progress + sum(size for _, size, _ in files)
+        # Sotto quota ci fermiamo al 90%, per non ripetere la pulizia a ogni giro
+        target = int(self.quota_bytes * 0.9) if total > self.quota_bytes else total
+        for mtime, size, name in files:
+            too_old = (now - mtime) > self.max_age_hours * 3600
+            if not too_old and total <= target:
+                break
+            if self._remove(name, "file audio"):
+                total -= size
+
+    def _remove(self, name: str, description: str) -> bool:
+        """Elimina un file della cartella; False se il file è ancora lì."""
+        try:
+            (self.audio_dir / name).unlink()
+            self.evicted_files += 1
+            print(f"🗑️ Rimosso {description}: {name}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"❌ Errore nella rimozione di {name}: {e}")
+            return False
+        return True
@@ -4,18 +4,19 @@
 # ... (altre importazioni) ...
 
 from pathlib import Path
-import time
 
 # Import dei nostri moduli
 
 import socket
 import config  # <-- ECCO LA CORREZIONE! MANCAVA QUESTA RIGA.
+import segment_log
 import shared_state
 from ai_client import AIClient
+from notes import format_segment
 
 
 
-def generate_and_save_notes(session_id: str, ai_client: AIClient) -> bool:
+def generate_and_save_notes(session_id: str, ai_client: AIClient, catalog=None, search_index=None) -> bool:
     """
     Genera gli appunti in italiano, li salva, poi li traduce e salva la versione inglese.
     """
@@ -29,43 +30,55 @@ def generate_and_save_notes(session_id: str, ai_client: AIClient) -> bool:
         transcript_text = f.read()
 
     print(f"⏳ Elaborazione appunti in italiano per {session_id}...")
-    italian_notes = ai_client.summarize_transcript(transcript_text)
+    italian_notes = ai_client.generate_notes(transcript_text)
 
     if italian_notes:
-        # Salva gli appunti in italiano
-        notes_it_filepath = Path(config.NOTES_DIR) / f"appunti_{session_id}.txt"
-        with open(notes_it_filepath, "w", encoding="utf-8") as f:
-            f.write(italian_notes)
-        print(f"✅ Appunti in italiano salvati in {notes_it_filepath}")
-
-        # Traduci e salva gli appunti in inglese
-        print(f"⏳ Traduzione degli appunti in inglese per {session_id}...")
-        english_notes = ai_client.translate(italian_notes)
-        if english_notes:
-            notes_en_filepath = Path(config.NOTES_DIR) / f"notes_{session_id}.txt"
-            with open(notes_en_filepath, "w", encoding="utf-8") as f:
-                f.write(english_notes)
-            print(f"✅ Appunti in inglese salvati in {notes_en_filepath}")
-        
+        save_notes(session_id, italian_notes, ai_client, catalog, search_index)
         return True
     else:
         print(f"❌ Errore durante l'elaborazione degli appunti per {session_id}.")
         return False
 
-def cleanup_old_audio_files(hours=24):
-    """Pulisce i file audio più vecchi di un certo numero di ore."""
-    audio_dir = Path(config.AUDIO_DIR)
-    if not audio_dir.exists():
-        return
-        
-    now = time.time()
-    for file in audio_dir.iterdir():
-        if file.is_file() and (now - file.stat().st_mtime) > (hours * 3600):
-            try:
-                file.unlink()
-                print(f"🗑️ Rimosso file audio vecchio: {file.name}")
-            except Exception as e:
-                print(f"❌ Errore nella rimozione di {file.name}: {e}")
+def save_notes(session_id: str, italian_notes: str, ai_client: AIClient, catalog=None, search_index=None):
+    """
+    Salva gli appunti in italiano, li traduce e salva la versione inglese, poi
+    aggiorna il catalogo e l'indice di ricerca.
+    """
+    notes_it_filepath = Path(config.NOTES_DIR) / f"appunti_{session_id}.txt"
+    with open(notes_it_filepath, "w", encoding="utf-8") as f:
+        f.write(italian_notes)
+    print(f"✅ Appunti in italiano salvati in {notes_it_filepath}")
+
+    # Traduci e salva gli appunti in inglese
+    print(f"⏳ Traduzione degli appunti in inglese per {session_id}...")
+    english_notes = ai_client.translate_document(italian_notes)
+    if search_index is not None:
+        search_index.set_notes(session_id, italian_notes, english_notes or "")
+    if english_notes:
+        notes_en_filepath = Path(config.NOTES_DIR) / f"notes_{session_id}.txt"
+        with open(notes_en_filepath, "w", encoding="utf-8") as f:
+            f.write(english_notes)
+        print(f"✅ Appunti in inglese salvati in {notes_en_filepath}")
+
+    if catalog is not None:
+        catalog.notes_generated(session_id)
+
+def finalize_live_notes(session_id: str, rolling_notes, ai_client: AIClient, catalog=None, search_index=None) -> bool:
+    """
+    Completa gli appunti costruiti durante la lezione (RollingNotes) e li salva.
+    Se qualcosa è andato storto li rigenera dalla trascrizione: le sezioni già
+    riassunte vengono comunque riprese dalla cache.
+    """
+    print(f"⏳ Completamento degli appunti live per {session_id}...")
+    try:
+        italian_notes = rolling_notes.finish()
+    except Exception as e:
+        print(f"❌ Errore negli appunti live: {e}")
+        italian_notes = ""
+    if not italian_notes:
+        return generate_and_save_notes(session_id, ai_client, catalog, search_index)
+    save_notes(session_id, italian_notes, ai_client, catalog, search_index)
+    return True
 
 # in utils.py
 
@@ -74,17 +87,19 @@ def cleanup_old_audio_files(hours=24):
 # -------------------------------------------------------------------
 # ▼▼▼ AGGIUNGI QUESTA NUOVA FUNZIONE IN FONDO AL FILE ▼▼▼
 # -------------------------------------------------------------------
+def format_transcript(segments) -> str:
+    return "\n".join(format_segment(r) for r in segments)
+
 def save_transcript_to_file(session_id: str) -> str | None:
     """
-    Formatta la trascrizione e la salva in un file permanente.
+    Formatta la trascrizione a partire dal log dei segmenti e la salva in un file permanente.
     Restituisce il percorso del file.
     """
-    session_data = shared_state.session_transcripts.get(session_id)
-    if not session_data or not session_data.get("transcripts"):
+    segments = segment_log.read_segments(session_id)
+    if not segments:
         return None
 
-    lines = [f"[{r.get('timestamp', '')}] IT: {r.get('italian', '')}\nEN: {r.get('english', '')}\n" for r in session_data["transcripts"]]
-    transcript_text = "\n".join(lines)
+    transcript_text = format_transcript(segments)
     
     # Salva nella nuova cartella 'transcripts'
     filepath = Path(config.TRANSCRIPTS_DIR) / f"trascrizione_{session_id}.txt"
@@ -96,7 +111,64 @@ def save_transcript_to_file(session_id: str) -> str | None:
     except Exception as e:
         print(f"❌ Errore nel salvataggio della trascrizione: {e}")
         return None
-    
+
+# Le stanze delle aule hanno un prefisso, per non confonderle con quelle delle sessioni
+CLASSROOM_ROOM_PREFIX = "classroom:"
+
+def classroom_room(classroom_id: str) -> str:
+    """Stanza Socket.IO dei client di un'aula: ricevono l'avvio e la fine delle sue sessioni."""
+    return f"{CLASSROOM_ROOM_PREFIX}{classroom_id}"
+
+def language_room(session_id: str, language: str) -> str:
+    """Stanza Socket.IO dei client che seguono la sessione in una certa lingua."""
+    return f"{session_id}:{language}"
+
+def segment_for_language(segment: dict, language: str) -> dict:
+    """
+    Vista di un segmento per i client di una lingua: `translation` e `audio_url`
+    sono quelli della lingua scelta. I segmenti salvati prima del supporto
+    multilingua hanno solo l'inglese.
+    """
+    view = {k: v for k, v in segment.items() if k not in ("translations", "audio_urls")}
+    translations = segment.get("translations") or {"en": segment.get("english", "")}
+    audio_urls = segment.get("audio_urls") or {"en": segment.get("audio_url")}
+    view["language"] = language
+    view["translation"] = translations.get(language, "")
+    view["audio_url"] = audio_urls.get(language)
+    return view
+
+def segments_after(session_id: str, last_seq: int | None, limit: int | None = None) -> list:
+    """
+    Segmenti della sessione con numero progressivo maggiore di `last_seq`, in ordine.
+    Di solito bastano quelli recenti tenuti in memoria; se il client è rimasto
+    indietro oltre quella coda vengono letti dal log su disco.
+    Con `last_seq` None restituisce solo gli ultimi `limit` segmenti.
+    """
+    session = shared_state.session_transcripts.get(session_id)
+    # list() copia la deque in un colpo solo, mentre la pipeline può continuare ad aggiungere
+    tail = list(session["transcripts"]) if session else []
+    if last_seq is None:
+        return tail[-limit:] if limit else tail
+    if tail and tail[0].get("seq", 0) <= last_seq + 1:
+        # I seq nella coda sono consecutivi: basta un indice
+        return tail[last_seq + 1 - tail[0]["seq"]:]
+    missed = [s for s in segment_log.read_segments(session_id) if s.get("seq", -1) > last_seq]
+    return missed[-limit:] if limit else missed
+
+def recover_unfinished_sessions() -> list:
+    """
+    Recupera le sessioni interrotte da un crash: ricostruisce la trascrizione dal
+    log dei segmenti e chiude il log. Restituisce le coppie (ID, percorso della
+    trascrizione), con None se non c'era niente da salvare o il salvataggio è fallito.
+    """
+    recovered = []
+    for session_id in segment_log.find_unfinished_sessions():
+        print(f"♻️ Recupero della sessione interrotta {session_id}...")
+        path = save_transcript_to_file(session_id)
+        segment_log.mark_recovered(session_id)
+        recovered.append((session_id, path))
+    return recovered
+
     # ____________________________________________________________________
 # ▼▼▼ AGGIUNGI QUESTA NUOVA FUNZIONE IN FONDO AL FILE utils.py ▼▼▼
 # ____________________________________________________________________